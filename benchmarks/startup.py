@@ -0,0 +1,80 @@
+"""
+Startup time benchmark.
+
+Times fresh interpreter invocations (best and median of several runs)
+and checks which heavy dependencies each one imported.
+
+Usage
+=====
+$ python benchmarks/startup.py --runs 10
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WRAPPER = os.path.join(ROOT, "cov_model", "cov_lin_wrapper.py")
+
+# modules that should only load in the stages that need them
+HEAVY_MODULES = ["matplotlib", "scipy", "xlrd", "sqlite3",
+                 "multiprocessing.shared_memory"]
+
+# name: python command line args
+CASES = [
+    ("help", [WRAPPER, "--help"]),
+    ("import package", ["-c", "import cov_model"]),
+    ("import wrapper", ["-c", "import cov_model.cov_lin_wrapper"]),
+    ("import api", ["-c", "import cov_model.api"]),
+]
+
+LOADED = "import sys; print(','.join(m for m in {} if m in sys.modules))"
+
+
+def time_invocation(args, runs):
+    """Get the wall clock times (s) of runs fresh interpreters."""
+    times = []
+    for _ in range(runs):
+        start = time.time()
+        subprocess.check_call([sys.executable] + args, cwd=ROOT,
+                              stdout=subprocess.DEVNULL)
+        times.append(time.time() - start)
+
+    return sorted(times)
+
+
+def loaded_heavy_modules(args):
+    """Get the heavy modules a command has imported."""
+    if args[0] != "-c":
+        return "n/a"
+    code = args[1] + "; " + LOADED.format(HEAVY_MODULES)
+    output = subprocess.check_output([sys.executable, "-c", code], cwd=ROOT)
+
+    return output.decode().strip() or "none"
+
+
+def main():
+    """Run the startup benchmark and print a table."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n',
+                        '--runs',
+                        type=int,
+                        default=5,
+                        help='Number of runs per invocation.')
+    args = parser.parse_args()
+
+    baseline = time_invocation(["-c", "pass"], args.runs)
+    print("python startup: best %.3fs" % baseline[0])
+    print("invocation | best (s) | median (s) | heavy modules loaded")
+    print(":---------:|:--------:|:----------:|:-------------------:")
+    for name, case_args in CASES:
+        times = time_invocation(case_args, args.runs)
+        print("%s | %.3f | %.3f | %s" % (name, times[0],
+                                         times[len(times) // 2],
+                                         loaded_heavy_modules(case_args)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,308 @@
+"""
+Benchmark suite on synthetic data.
+
+For each scale (number of countries) synthetic data for March and April
+(the data finder reads closed months whole) is generated in a temporary
+directory (see benchmarks/synthetic.py) and these stages are timed
+there, without network access:
+
+    ingest cold   parse the full daily reports (first run)
+    ingest warm   read the compacted one-line files (later runs,
+                  without the monthly cache)
+    ingest disk cache
+                  load the closed months from the on-disk monthly cache
+    ingest memoized
+                  repeated requests answered by the in-process cache
+    ingest time series
+                  read the three wide time-series files instead
+    fitting       linear fits of all case and death series
+    analysis      per-geography analysis: fits, projections, tables
+                  and recorded figures
+    statistics    Rt, delay-adjusted CFR, rolling death statistics and
+                  death rate histograms of all countries at once
+    ks            Kolmogorov-Smirnoff test
+    render        draw the recorded figures (needs matplotlib)
+
+and, with --counties N, for N synthetic US counties over the same days:
+
+    county ingest   read the daily reports into the county cube
+    county fits     batched fits of all county case and death series
+
+Results are stored as JSON for regression comparison.
+
+Usage
+=====
+$ python benchmarks/suite.py --scales 5,20,50 --output benchmarks/results/today.json
+$ python benchmarks/suite.py --compare benchmarks/results/before.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import synthetic
+from cov_model import counties as county_analysis
+from cov_model import cov_lin_wrapper as wrapper
+from cov_model.datafinder import (county_cube, monthly_cache, results_history,
+    time_series)
+from cov_model.plotting import render
+from cov_model.statsanalysis import cfr, ks, linear, rolling, rt, runs
+
+
+SCALES = "5,20"
+MONTHS = [3, 4]
+DAYS = 61
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+# stages slower than this (ratio to the baseline) are flagged
+REGRESSION_RATIO = 1.2
+
+
+def _best(function, repeat):
+    """Get the best wall clock time (s) of repeat calls and the result."""
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.time()
+        result = function()
+        times.append(time.time() - start)
+
+    return min(times), result
+
+
+def _has_xlwt():
+    """Check if the official UK files can be written (xlwt)."""
+    try:
+        import xlwt
+    except ImportError:
+        return False
+    return True
+
+
+def run_scale(n_geographies, n_days=DAYS, repeat=3, render_figures=True):
+    """
+    Time all stages at one scale; get stage: seconds.
+
+    Without xlwt there are no official UK files and the UK (official
+    data) is left out of the geographies.
+    """
+    timings = {}
+    work_dir = tempfile.mkdtemp(prefix="cov_bench_")
+    cwd = os.getcwd()
+    quiet = io.StringIO()
+    try:
+        names, _ = synthetic.generate(work_dir, n_geographies, n_days,
+                                      uk=_has_xlwt())
+        os.chdir(work_dir)
+
+        def ingest():
+            return [wrapper.load_geography(name, False, MONTHS)[0]
+                    for name in names]
+
+        # the first pass compacts the daily reports, so it runs once
+        monthly_cache.set_monthly_cache(monthly_cache.MonthlyCache())
+        timings["ingest cold"], datasets = _best(ingest, 1)
+        timings["ingest memoized"], _ = _best(ingest, repeat)
+
+        def ingest_disk_cache():
+            monthly_cache.set_monthly_cache(monthly_cache.MonthlyCache())
+            return ingest()
+        timings["ingest disk cache"], _ = _best(ingest_disk_cache, repeat)
+        monthly_cache.set_monthly_cache(None)
+        timings["ingest warm"], datasets = _best(ingest, repeat)
+        monthly_cache.set_monthly_cache(monthly_cache.MonthlyCache())
+
+        def ingest_time_series():
+            cube = time_series.TimeSeriesCube.load()
+            return [wrapper.load_geography(name, False, MONTHS,
+                                           series=cube)[0]
+                    for name in names]
+        timings["ingest time series"], _ = _best(ingest_time_series, repeat)
+
+        series = []
+        for cases, deaths, _, _ in datasets:
+            for values in (cases, deaths):
+                values = values[values > 0.]
+                if len(values) > 1:
+                    series.append((np.arange(len(values), dtype=float),
+                                   np.log(values)))
+
+        def fitting():
+            return [linear.get_linear_parameters(x, y) for x, y in series]
+        timings["fitting"], _ = _best(fitting, repeat)
+
+        history = results_history.ResultsHistory()
+        renderer = render.Renderer(collect=True)
+        render.set_renderer(renderer)
+
+        def analysis():
+            renderer.pop_specs()
+            return [wrapper.analyze_geography(name, False, data, MONTHS,
+                                              True, history)
+                    for name, data in zip(names, datasets)]
+        with contextlib.redirect_stdout(quiet):
+            timings["analysis"], results = _best(analysis, repeat)
+        specs = renderer.pop_specs()
+        nums_cases = {result.geography: result.cases for result in results}
+        padded_cases = {name: data[0] for name, data in zip(names, datasets)}
+        nums_deaths = {result.geography: result.deaths
+                       for result in results}
+
+        def statistics():
+            matrix = rt.align_series(nums_cases, names)
+            deaths = rt.align_series(nums_deaths, names)
+            stats = rolling.RollingStats(nums_deaths, names, threshold=5.)
+            daily_rates = stats.series(100. * stats.log_ratios())
+            return (rt.estimate_rt(rt.align_series(padded_cases, names)),
+                    cfr.delay_adjusted_cfr(matrix, deaths),
+                    stats.rolling_mean(7),
+                    runs.RateHistogram(daily_rates, names))
+        timings["statistics"], _ = _best(statistics, repeat)
+
+        if all(name in nums_cases for name in synthetic.PREFERRED[:5]):
+            render.set_renderer(render.NullRenderer())
+            with contextlib.redirect_stdout(quiet):
+                timings["ks"], _ = _best(
+                    lambda: ks.kstest(nums_cases, nums_deaths), repeat)
+
+        if render_figures:
+            try:
+                import matplotlib
+            except ImportError:
+                render_figures = False
+        if render_figures:
+            def draw():
+                for path, calls in specs:
+                    render.render_spec(path, calls)
+            timings["render"], _ = _best(draw, 1)
+            timings["figures"] = len(specs)
+    finally:
+        os.chdir(cwd)
+        render.set_renderer(render.Renderer())
+        shutil.rmtree(work_dir)
+
+    return timings
+
+
+def run_counties(n_counties, n_days=DAYS, repeat=3):
+    """Time the county stages; get stage: seconds."""
+    timings = {}
+    work_dir = tempfile.mkdtemp(prefix="cov_bench_")
+    cwd = os.getcwd()
+    try:
+        synthetic.generate(work_dir, 1, n_days, n_regions=n_counties,
+                           uk=False, region_dirs=False, county_reports=True)
+        os.chdir(work_dir)
+        end_day = synthetic.START + timedelta(days=n_days)
+
+        # days in the cube are not read again, so ingest runs once
+        cube = county_cube.CountyCube()
+        timings["county ingest"], _ = _best(
+            lambda: cube.update(end_day, fetch=False), 1)
+        timings["county fits"], _ = _best(
+            lambda: county_analysis.fit_counties(cube), repeat)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work_dir)
+
+    return timings
+
+
+def compare(current, baseline):
+    """Print stage time ratios against a baseline run."""
+    print("scale | stage | baseline (s) | current (s) | ratio")
+    print(":---:|:-----:|:------------:|:-----------:|:-----:")
+    for scale, timings in sorted(current["scales"].items(),
+                                   key=lambda item: int(item[0].split()[0])):
+        base_timings = baseline["scales"].get(scale, {})
+        for stage, seconds in sorted(timings.items()):
+            if stage == "figures" or stage not in base_timings:
+                continue
+            ratio = seconds / max(base_timings[stage], 1e-9)
+            flag = " REGRESSION" if ratio > REGRESSION_RATIO else ""
+            print("%s | %s | %.4f | %.4f | %.2f%s" % (
+                scale, stage, base_timings[stage], seconds, ratio, flag))
+
+
+def main():
+    """Run the benchmarks, store and optionally compare the results."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s',
+                        '--scales',
+                        type=str,
+                        default=SCALES,
+                        help='Comma-sep numbers of countries.')
+    parser.add_argument('-n',
+                        '--repeat',
+                        type=int,
+                        default=3,
+                        help='Best of n runs per stage.')
+    parser.add_argument('-o',
+                        '--output',
+                        type=str,
+                        default=None,
+                        help='JSON results file; default: dated file in '
+                             'benchmarks/results.')
+    parser.add_argument('-c',
+                        '--compare',
+                        type=str,
+                        default=None,
+                        help='Baseline JSON results file to compare with.')
+    parser.add_argument('--counties',
+                        type=int,
+                        default=0,
+                        help='Number of US counties for the county stages.')
+    parser.add_argument('--no-render',
+                        action='store_true',
+                        help='Skip the render stage.')
+    args = parser.parse_args()
+
+    results = {"date": datetime.today().strftime("%Y-%m-%dT%H:%M:%S"),
+               "python": platform.python_version(),
+               "numpy": np.__version__,
+               "repeat": args.repeat,
+               "scales": {}}
+    for scale in args.scales.split(","):
+        print("Benchmarking {} countries x {} days ...".format(scale, DAYS))
+        results["scales"][scale] = run_scale(int(scale), DAYS, args.repeat,
+                                             not args.no_render)
+    if args.counties:
+        print("Benchmarking {} counties x {} days ...".format(args.counties,
+                                                             DAYS))
+        results["scales"][str(args.counties) + " counties"] = \
+            run_counties(args.counties, DAYS, args.repeat)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, "bench_{}.json".format(results["date"][:10]))
+    if not os.path.isdir(os.path.dirname(output)):
+        os.makedirs(os.path.dirname(output))
+    with open(output, "w") as file:
+        json.dump(results, file, indent=1, sort_keys=True)
+    print("Results written to {}".format(output))
+
+    if args.compare:
+        with open(args.compare, "r") as file:
+            compare(results, json.load(file))
+    else:
+        for scale, timings in sorted(results["scales"].items(),
+                                       key=lambda item: int(item[0].split()[0])):
+            for stage, seconds in sorted(timings.items()):
+                print("{} | {} | {}".format(scale, stage, seconds))
+
+
+if __name__ == '__main__':
+    main()
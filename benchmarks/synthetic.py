@@ -0,0 +1,278 @@
+"""
+Synthetic JHU-format data generator.
+
+Writes daily reports for N geographies x D days (starting March 1st,
+2020) in the layout the data finder reads from country_data/:
+
+    country_data/<geography>_monthly_<MM>/<MM>-<DD>-2020.csv
+    country_data/ALL_monthly_<MM>/<MM>-<DD>-2020.csv
+    country_data/time_series/time_series_covid19_<metric>_global.csv
+
+Reports before 23 March use the old JHU schema, later ones the new one
+(see datafinder.rollup); every report holds the
+rows of all geographies, so parsing costs scale as with the real data.
+Optionally the official UK files are written too: UK_cases.xls and
+UK_deaths.xls (needs xlwt) and UK_deaths_history.
+
+Usage
+=====
+$ python benchmarks/synthetic.py --output /tmp/synthetic --geographies 20 --days 61
+"""
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from cov_model.statsanalysis.country_parameters import COUNTRY_PARAMS
+
+
+START = datetime(2020, 3, 1)
+NEW_SCHEMA_START = datetime(2020, 3, 23)
+
+OLD_HEADER = "Province/State,Country/Region,Last Update,Confirmed,Deaths," + \
+             "Recovered,Latitude,Longitude"
+NEW_HEADER = "FIPS,Admin2,Province_State,Country_Region,Last_Update,Lat," + \
+             "Long_,Confirmed,Deaths,Recovered,Active,Combined_Key"
+
+# countries the ensemble analysis (eg. the KS test) looks for come first
+PREFERRED = ["UK", "France", "Spain", "Italy", "Germany", "US",
+             "Netherlands", "Belgium", "Romania", "Sweden", "Norway",
+             "Switzerland", "Canada", "Austria", "Bulgaria"]
+
+# first March day with reported UK deaths (official data layout)
+UK_FIRST_DEATH_DAY = 13
+
+
+def geography_names(n_geographies, uk=True):
+    """Get country names: known ones first, then synthetic ones."""
+    names = [name for name in PREFERRED if uk or name != "UK"]
+    names.extend(sorted(name for name in COUNTRY_PARAMS
+                        if name not in names))
+    names = names[:n_geographies]
+    names.extend("Synthland{:03d}".format(i)
+                 for i in range(n_geographies - len(names)))
+
+    return names
+
+
+def region_names(n_regions):
+    """Get synthetic US state names."""
+    return ["Synthstate{:03d}".format(i) for i in range(n_regions)]
+
+
+def epidemic_curves(n_series, n_days, seed=0):
+    """
+    Get cumulative cases, deaths and recoveries (series x day).
+
+    Logistic growth with random rate, size and onset; deaths follow the
+    cases with a 10 day lag and a random fatality rate.
+    """
+    rng = np.random.RandomState(seed)
+    days = np.arange(n_days, dtype=float)
+    rate = rng.uniform(0.08, 0.3, (n_series, 1))
+    size = 10 ** rng.uniform(3., 6., (n_series, 1))
+    onset = rng.uniform(15., 45., (n_series, 1))
+    cases = size / (1. + np.exp(-rate * (days - onset)))
+    lagged = size / (1. + np.exp(-rate * (days - onset - 10.)))
+    deaths = rng.uniform(0.01, 0.12, (n_series, 1)) * lagged
+    recovered = 0.5 * size / (1. + np.exp(-rate * (days - onset - 20.)))
+
+    # reported numbers are integers and at least one case
+    return (np.maximum(np.floor(cases), 1.), np.floor(deaths),
+            np.floor(recovered))
+
+
+def _old_rows(names, regions, day, cases, deaths, recovered, idx):
+    """Report rows in the pre 23 March schema."""
+    stamp = day.strftime("%Y-%m-%dT%H:%M:%S")
+    rows = [OLD_HEADER]
+    for i, name in enumerate(names + regions):
+        state, country = ("", name) if i < len(names) else (name, "US")
+        rows.append("{},{},{},{:.0f},{:.0f},{:.0f},{:.4f},{:.4f}".format(
+            state, country, stamp, cases[i, idx], deaths[i, idx],
+            recovered[i, idx], 10. + i, 20. + i))
+
+    return rows
+
+
+def _new_rows(names, regions, day, cases, deaths, recovered, idx):
+    """Report rows in the new (from 23 March) schema."""
+    stamp = day.strftime("%Y-%m-%d %H:%M:%S")
+    rows = [NEW_HEADER]
+    for i, name in enumerate(names + regions):
+        if i < len(names):
+            fips, state, country, key = "", "", name, name
+        else:
+            fips, state, country = str(1000 + i), name, "US"
+            key = '"{}, US"'.format(name)
+        active = cases[i, idx] - deaths[i, idx] - recovered[i, idx]
+        rows.append("{},,{},{},{},{:.4f},{:.4f},{:.0f},{:.0f},{:.0f},"
+                    "{:.0f},{}".format(fips, state, country, stamp,
+                                       10. + i, 20. + i, cases[i, idx],
+                                       deaths[i, idx], recovered[i, idx],
+                                       max(active, 0.), key))
+
+    return rows
+
+
+def daily_report(names, regions, day, curves, idx):
+    """Get the csv text of the daily report of day."""
+    if day < NEW_SCHEMA_START:
+        rows = _old_rows(names, regions, day, curves[0], curves[1],
+                         curves[2], idx)
+    else:
+        rows = _new_rows(names, regions, day, curves[0], curves[1],
+                         curves[2], idx)
+
+    return "\n".join(rows) + "\n"
+
+
+def write_time_series(data_dir, names, regions, curves, n_days):
+    """Write the wide time-series files (same numbers as the reports)."""
+    ts_dir = os.path.join(data_dir, "time_series")
+    if not os.path.isdir(ts_dir):
+        os.makedirs(ts_dir)
+    days = [START + timedelta(days=idx) for idx in range(n_days)]
+    dates = ["{}/{}/{:02d}".format(day.month, day.day, day.year % 100)
+             for day in days]
+    header = ",".join(["Province/State", "Country/Region", "Lat",
+                       "Long"] + dates)
+    for metric, values in zip(("confirmed", "deaths", "recovered"), curves):
+        rows = [header]
+        for i, name in enumerate(names + regions):
+            state, country = ("", name) if i < len(names) else (name, "US")
+            rows.append("{},{},{:.4f},{:.4f},".format(state, country,
+                                                      10. + i, 20. + i) +
+                        ",".join("{:.0f}".format(val)
+                                 for val in values[i, :n_days]))
+        file_name = "time_series_covid19_{}_global.csv".format(metric)
+        with open(os.path.join(ts_dir, file_name), "w") as file:
+            file.write("\n".join(rows) + "\n")
+
+
+def write_uk_data(data_dir, cases, deaths):
+    """Write UK_cases.xls, UK_deaths.xls and UK_deaths_history."""
+    import xlwt
+
+    # cases sheet: header, 30 days before March 1st, then daily rows
+    book = xlwt.Workbook()
+    sheet = book.add_sheet("DailyConfirmedCases")
+    for col, name in enumerate(["DateVal", "CMODateCount", "CumCases"]):
+        sheet.write(0, col, name)
+    cumulative = np.concatenate((np.zeros(30), cases))
+    daily = np.diff(cumulative, prepend=0.)
+    for row, value in enumerate(cumulative):
+        day = START + timedelta(days=row - 30)
+        sheet.write(row + 1, 0, day.strftime("%Y-%m-%d"))
+        sheet.write(row + 1, 1, float(daily[row]))
+        sheet.write(row + 1, 2, float(value))
+    book.save(os.path.join(data_dir, "UK_cases.xls"))
+
+    book = xlwt.Workbook()
+    sheet = book.add_sheet("Sheet1")
+    for col, name in enumerate(["Date", "UK", "England", "Deaths"]):
+        sheet.write(0, col, name)
+    sheet.write(1, 0, START.strftime("%Y-%m-%d"))
+    sheet.write(1, 3, float(deaths[-1]))
+    book.save(os.path.join(data_dir, "UK_deaths.xls"))
+
+    # deaths history starts on the first March day with deaths
+    history = np.maximum(deaths[UK_FIRST_DEATH_DAY - 1:], 1.)
+    np.savetxt(os.path.join(data_dir, "UK_deaths_history"), history,
+               fmt="%.1f")
+
+
+def generate(output_dir, n_geographies, n_days, n_regions=0, uk=True,
+             seed=0, region_dirs=True, county_reports=False):
+    """
+    Write synthetic data under output_dir/country_data.
+
+    Regions are US rows with a FIPS code (counties to the county cube);
+    region_dirs=False writes no per-region data directories and
+    county_reports=True writes the reports for the county cube too.
+    Returns the (countries, regions) names written.
+    """
+    data_dir = os.path.join(output_dir, "country_data")
+    if not os.path.isdir(data_dir):
+        os.makedirs(data_dir)
+    names = geography_names(n_geographies, uk=uk)
+    regions = region_names(n_regions)
+    curves = epidemic_curves(len(names) + len(regions), n_days, seed)
+
+    for idx in range(n_days):
+        day = START + timedelta(days=idx)
+        report = daily_report(names, regions, day, curves, idx)
+        file_name = day.strftime("%m-%d-2020.csv")
+        # ALL: the reports read whole by the --all discovery
+        geo_names = names + regions if region_dirs else list(names)
+        geo_names.append("ALL")
+        if county_reports:
+            geo_names.append("US_counties")
+        for name in geo_names:
+            geo_dir = os.path.join(data_dir, "{}_monthly_{}".format(
+                name, day.strftime("%m")))
+            if not os.path.isdir(geo_dir):
+                os.makedirs(geo_dir)
+            with open(os.path.join(geo_dir, file_name), "w") as file:
+                file.write(report)
+    write_time_series(data_dir, names, regions, curves, n_days)
+    # the UK fits use the official data (same curves)
+    if "UK" in names:
+        write_uk_data(data_dir, curves[0][0], curves[1][0])
+
+    return names, regions
+
+
+def main():
+    """Parse command line args and write the data."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-o',
+                        '--output',
+                        type=str,
+                        required=True,
+                        help='Directory to write country_data/ in.')
+    parser.add_argument('-g',
+                        '--geographies',
+                        type=int,
+                        default=20,
+                        help='Number of countries.')
+    parser.add_argument('-r',
+                        '--regions',
+                        type=int,
+                        default=0,
+                        help='Number of US states.')
+    parser.add_argument('-d',
+                        '--days',
+                        type=int,
+                        default=61,
+                        help='Number of days from March 1st.')
+    parser.add_argument('--counties',
+                        action='store_true',
+                        help='Write reports for the county cube; regions '
+                             'are counties, without their own directories.')
+    parser.add_argument('--no-uk',
+                        action='store_true',
+                        help='Do not write the official UK files (xlwt).')
+    parser.add_argument('--seed',
+                        type=int,
+                        default=0,
+                        help='Random seed.')
+    args = parser.parse_args()
+
+    names, regions = generate(args.output, args.geographies, args.days,
+                              args.regions, uk=not args.no_uk,
+                              seed=args.seed,
+                              region_dirs=not args.counties,
+                              county_reports=args.counties)
+    print("Wrote {} days for {} countries and {} regions to {}".format(
+        args.days, len(names), len(regions), args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,20 @@
+"""
+COVID-19 linear model.
+
+Library API: cov_model.analyze(); see cov_model.api.
+"""
+from cov_model.datafinder.memory_store import MemoryStore
+from cov_model.datafinder.results_bundle import RunResults
+
+
+def analyze(*args, **kwargs):
+    """Analyze geographies in process; see cov_model.api.analyze."""
+    # the analysis stack is only loaded when used, not on package import
+    from cov_model import api
+    return api.analyze(*args, **kwargs)
+
+
+def analysis_months(start, end):
+    """Get the months covering [start, end]; see cov_model.api."""
+    from cov_model import api
+    return api.analysis_months(start, end)
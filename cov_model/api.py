@@ -0,0 +1,108 @@
+"""
+Library API: analyze geographies in process.
+
+Usage
+=====
+>>> import cov_model
+>>> store = cov_model.MemoryStore()
+>>> results = cov_model.analyze(["UK", "Italy"], "2020-04-01", "2020-04-30",
+...                             store=store)
+>>> results.fits["UK"]["doubling_time"]
+
+Nothing is plotted, printed, downloaded or written to disk; results
+are returned in memory as a RunResults. Data is read from the store
+(any object with the SQLiteStore observations interface, eg. a
+MemoryStore that stays warm between calls); days missing from it are
+parsed from the reports already in data_dir (default country_data/)
+and added to the store, unless fetch=False. Days with no report there
+are missing.
+"""
+from datetime import date, datetime
+
+from cov_model import cov_lin_wrapper as wrapper
+from cov_model.datafinder import (results_bundle, results_history,
+    results_writer)
+from cov_model.datafinder.data_finder import DATA_DIR
+from cov_model.plotting import render
+from cov_model.statsanalysis import fit_records
+
+
+DATA_YEAR = 2020
+
+
+def _to_date(value):
+    """Get a date from a date, datetime or YYYY-MM-DD string."""
+    if isinstance(value, (date, datetime)):
+        return value
+    return datetime.strptime(value, "%Y-%m-%d")
+
+
+def analysis_months(start, end):
+    """Get the months covering [start, end]; analysis is by whole months."""
+    start = _to_date(start)
+    end = _to_date(end)
+    if (end.year, end.month) < (start.year, start.month):
+        raise ValueError("End date {} is before start date {}".format(
+            end, start))
+    # the data (and the report file names) cover 2020 only
+    if start.year != DATA_YEAR or end.year != DATA_YEAR:
+        raise ValueError("Only dates in {} can be analyzed".format(
+            DATA_YEAR))
+
+    return list(range(start.month, end.month + 1))
+
+
+def analyze(geographies, start, end, regions=(), store=None, fetch=True,
+            history=None, data_dir=DATA_DIR):
+    """
+    Fit countries and regions (US states) over the months of [start, end].
+
+    Reports (and the official UK files) are read from data_dir, which
+    is never written to. Returns a RunResults with per-geography fit
+    numbers, summary table fields, the fitted cases and deaths, the
+    day-aligned cases and deaths, the Rt series and the fit records
+    table (run_results.fit_table).
+    """
+    months = analysis_months(start, end)
+    if history is None:
+        history = results_history.ResultsHistory()
+    run_date = datetime.today().strftime("%Y-%m-%d")
+    run_results = results_bundle.RunResults(run_date, months)
+    writer = results_writer.ResultsWriter(None)
+
+    tasks = [(geography, False) for geography in geographies]
+    tasks.extend((region, True) for region in regions)
+    nums_cases = {}
+    fits = []
+    previous_renderer = render.get_renderer()
+    render.set_renderer(render.NullRenderer())
+    try:
+        for idx, (geography, region) in enumerate(tasks):
+            monthly_numbers, _ = wrapper.load_geography(
+                geography, region, months, store, fetch,
+                data_dir=data_dir, read_only=True)
+            result = wrapper.analyze_geography(geography, region,
+                                               monthly_numbers, months,
+                                               False, history,
+                                               data_dir=data_dir,
+                                               read_only=True,
+                                               verbose=False)
+            writer.merge(result.writer, idx)
+            fits.append(result.fit)
+            run_results.add_geography(geography, region,
+                                      result.fit["doubling_time"],
+                                      result.fit["reproductive_number"],
+                                      result.fit["fit_quality"],
+                                      result.cases, result.deaths)
+            if not region:
+                wrapper.add_aligned_series(run_results, result)
+                nums_cases[geography] = result.padded_cases
+    finally:
+        render.set_renderer(previous_renderer)
+
+    run_results.fit_table = fit_records.fit_table(
+        [geo for geo, _ in tasks], [reg for _, reg in tasks], fits)
+    run_results.add_rows(writer.header, writer.rows)
+    wrapper.add_rt_series(run_results, nums_cases)
+
+    return run_results
@@ -0,0 +1,133 @@
+"""
+US county (FIPS) analysis.
+
+Ingests the county rows of the JHU daily reports into the county cube
+(see datafinder.county_cube), fits the last days of cumulative cases
+and deaths of all counties at once and writes the county summary table
+and the table of counties with case doubling time larger than 14 days.
+
+Usage
+=====
+$ python cov_model/counties.py --window 5
+"""
+import argparse
+import os
+import sys
+from datetime import datetime
+
+import numpy as np
+
+if __package__ in (None, ""):
+    # run as a script: make the cov_model package importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+
+from cov_model import instrument
+from cov_model.datafinder import county_cube, results_writer
+from cov_model.statsanalysis import linear
+
+
+COUNTY_TABLE_FILE = "country_tables/US_COUNTIES_DATA_{}.csv"
+COUNTY_SLOW_TABLE_FILE = \
+    "country_tables/US_counties_with_case_doubling-time_larger_14days.csv"
+COUNTY_TABLE_HEADER = [
+    "FIPS", "county", "state", "cases", "deaths", "case rate",
+    "death rate", "doubling cases (days)", "doubling deaths (days)",
+    "fit quality cases"]
+
+# days fitted (as the last 5 days fit of the countries)
+WINDOW = 5
+
+
+def fit_counties(cube, window=WINDOW):
+    """
+    Fit log cases and deaths of the last window days of all counties.
+
+    Returns (slope, R squared, doubling time, R0) arrays per county for
+    cases and for deaths.
+    """
+    days = (cube.dates[-window:] - np.datetime64("2020-03-01", "D"))
+    x = days.astype(float) + 1.
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_cases = np.log(cube.cases[:, -window:].astype(float))
+        log_deaths = np.log(cube.deaths[:, -window:].astype(float))
+    with instrument.timer("county fits"):
+        fit_cases = linear.get_linear_parameters_batch(x, log_cases)
+        fit_deaths = linear.get_linear_parameters_batch(x, log_deaths)
+
+    return fit_cases, fit_deaths
+
+
+def tabulate_counties(cube, fit_cases, fit_deaths, writer):
+    """Add a table row per county, slow doubling counties too."""
+    slope, R, d_time, _ = fit_cases
+    slope_d, _, d_time_d, _ = fit_deaths
+    cases = cube.cases[:, -1]
+    deaths = cube.deaths[:, -1]
+    for idx, fips in enumerate(cube.fips):
+        if np.isnan(cases[idx]):
+            continue
+        writer.add_row([
+            "{:05d}".format(fips), cube.names[idx].replace(",", " "),
+            cube.states[idx].replace(",", " "),
+            "%i" % cases[idx],
+            "%i" % deaths[idx] if not np.isnan(deaths[idx]) else "nan",
+            "%.0f" % (slope[idx] * 100.), "%.0f" % (slope_d[idx] * 100.),
+            "%.1f" % d_time[idx], "%.1f" % d_time_d[idx], "%.2f" % R[idx]])
+        if d_time[idx] >= 14.:
+            writer.add_slow_row("{:05d}".format(fips), "%.1f" % d_time[idx])
+
+
+def main():
+    """Update the county cube, fit all counties and write the tables."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-w',
+                        '--window',
+                        type=int,
+                        default=WINDOW,
+                        help='Number of last days fitted.')
+    parser.add_argument('-e',
+                        '--end-date',
+                        type=str,
+                        default=None,
+                        help='Ingest reports before this date (YYYY-MM-DD);'
+                             ' default: today.')
+    parser.add_argument('--no-fetch',
+                        action='store_true',
+                        help='Do not download missing daily reports.')
+    parser.add_argument('--profile',
+                        type=str,
+                        default=None,
+                        help='Write stage timers and counters to a JSON file.')
+    args = parser.parse_args()
+
+    end_day = datetime.today()
+    if args.end_date:
+        end_day = datetime.strptime(args.end_date, "%Y-%m-%d")
+    end_day = datetime(end_day.year, end_day.month, end_day.day)
+
+    cube = county_cube.CountyCube.load()
+    with instrument.timer("load data"):
+        cube.update(end_day, fetch=not args.no_fetch)
+        cube.save()
+    if not len(cube.dates):
+        print("No county data before {}".format(end_day.strftime("%Y-%m-%d")))
+        return
+    print("Analyzing {} counties over {} days ...".format(len(cube.fips),
+                                                         len(cube.dates)))
+    fit_cases, fit_deaths = fit_counties(cube, args.window)
+
+    with instrument.timer("tables"):
+        table_date = str(cube.dates[-1])
+        writer = results_writer.ResultsWriter(
+            COUNTY_TABLE_FILE.format(table_date), header=COUNTY_TABLE_HEADER,
+            slow_table_file=COUNTY_SLOW_TABLE_FILE)
+        tabulate_counties(cube, fit_cases, fit_deaths, writer)
+        writer.commit()
+
+    if args.profile:
+        instrument.get_instruments().write(args.profile)
+
+
+if __name__ == '__main__':
+    main()
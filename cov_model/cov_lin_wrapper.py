@@ -16,39 +16,63 @@ Source (official): https://www.gov.uk/government/publications/covid-19-track-cor
 which is an excel spreadsheet.
 """
 import argparse
+import logging
+import multiprocessing
 import os
+import sys
+import time
 import numpy as np
-import matplotlib
-import matplotlib.pyplot as plt
 
 from datetime import datetime
-from itertools import groupby
 
-from datafinder.data_finder import (COUNTRIES_TO_SUM,
-    get_monthly_countries_data, get_official_uk_data)
-from statsanalysis import (linear, ks, country_parameters)
-from projections import uk
+if __package__ in (None, ""):
+    # run as a script: make the cov_model package importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
 
+from cov_model.datafinder.data_finder import (DATA_DIR, UK_DEATHS_FIRST_DAY,
+    discover_geographies, get_monthly_countries_data, get_official_uk_data,
+    last_report_day, load_uk_deaths_history)
+from cov_model.datafinder import (ensemble_store, monthly_cache,
+    results_bundle, results_history, results_writer)
+from cov_model.statsanalysis import (cfr, linear, ks, country_parameters,
+    fit_records, rolling, rt, runs)
+from cov_model import instrument
+from cov_model.plotting import render
+from cov_model.projections import uk
 
-COUNTRY_PARAMS = country_parameters.COUNTRY_PARAMS
 
-def make_evolution_plot(variable_pack, country, month_str):
+COUNTRY_PARAMS = country_parameters.load_country_params()
+
+# days with cases needed to analyze a discovered geography (--all);
+# the case fits use the last 5 days
+MIN_FIT_DAYS = 5
+
+# figures are recorded here and drawn by the render stage
+plt = render.FigureRecorder()
+
+# first day of the doubling times history
+HISTORY_START = "2020-04-04"
+
+def make_evolution_plot(fits, country, month_str):
     """Make the exponential evolution plot."""
     # unpack variables
-    (x_cases, y_cases, x_slow, y_slow, cases, deaths,
-     x_deaths, deaths, y_deaths, poly_x, poly_x_s,
-     poly_x_d, y_err, y_err_d, plot_text, plot_text_s,
-     plot_text_d, plot_name, slope_d, slope,
-     march0, april0, may0) = variable_pack
+    x_cases, y_cases, cases = fits.cases.x, fits.cases.y, fits.cases.values
+    x_deaths, y_deaths, deaths = \
+        fits.deaths.x, fits.deaths.y, fits.deaths.values
+    poly_x, poly_x_d = fits.cases.poly_x, fits.deaths.poly_x
+    plot_text, plot_text_d = fits.plot_text, fits.plot_text_d
+    plot_name = fits.plot_name
+    march0, april0, may0 = fits.month_starts
 
     # repack some data
     y_all_real = []
-    if deaths:
+    if len(deaths):
         y_all_real.extend(deaths)
     y_all_real.extend(cases)
     y_all = np.log(y_all_real)
     last_tick_real = []
-    if deaths:
+    if len(deaths):
         last_tick_real.append(deaths[-1])
     last_tick_real.append(y_all_real[-1])
     last_tick = np.log(last_tick_real)
@@ -60,7 +84,7 @@ def make_evolution_plot(variable_pack, country, month_str):
         plt.plot(x_cases[-5:], poly_x, '--r')
     else:
         plt.plot(x_cases, poly_x, '--r')
-    if deaths:
+    if len(deaths):
         plt.scatter(x_deaths, y_deaths, marker='v',
                     color='b', label="Daily Deaths")
         if len(poly_x_d) == 5:
@@ -72,7 +96,7 @@ def make_evolution_plot(variable_pack, country, month_str):
     #if deaths:
     #    plt.errorbar(x_deaths, y_deaths, yerr=y_err_d, fmt='v', color='b')
     plt.grid()
-    if not deaths:
+    if not len(deaths):
         plt.xlim(0., x_cases[-1] + 1.5)
         plt.ylim(0., y_cases[-1] + 3.5)
     else:
@@ -109,20 +133,18 @@ def make_evolution_plot(variable_pack, country, month_str):
     plt.axvline(april0, linestyle="--", color='k')
     plt.axvline(may0, linestyle="--", color='k')
     plt.text(1., y_cases[-1] + 0.3, plot_text, fontsize=8, color='r')
-    if deaths:
+    if len(deaths):
         plt.text(1., y_cases[-1] - 2.1, plot_text_d, fontsize=8, color='b')
     plt.legend(loc="lower left", fontsize=7)
-    plt.yticks(last_tick, [np.int(y01) for y01 in last_tick_real])
+    plt.yticks(last_tick, [int(y01) for y01 in last_tick_real])
     plt.tick_params(axis="y", labelsize=8)
 
-    if not os.path.isdir(os.path.join("country_plots", country)):
-        os.makedirs(os.path.join("country_plots", country))
-
     plt.savefig(os.path.join("country_plots", country, plot_name))
     plt.close()
 
 
-def plot_countries(datasets, months, country, table_file, download):
+def plot_countries(datasets, months, country, writer, download,
+                   data_dir=DATA_DIR, read_only=False):
     """Plot countries data."""
     # set correct months labels
     if len(months) == 1:
@@ -133,22 +155,20 @@ def plot_countries(datasets, months, country, table_file, download):
     else:
         month_str = "March-April-May"
 
-    # filter data lists
-    cases = [float(c) for c in datasets[0] if c != 'NN']
-    deaths = [float(c) for c in datasets[1] if c != 'NN']
-    deaths = [d for d in deaths if d > 0.]
-    recs = [float(c) for c in datasets[2] if c != 'NN']
+    # all analyzed days, NaN if missing: the Rt and CFR day axis
+    padded_cases, padded_deaths = datasets[0], datasets[1]
+
+    # filter data arrays: drop missing (NaN/NaT) days
+    cases = datasets[0][~np.isnan(datasets[0])]
+    deaths = datasets[1][datasets[1] > 0.]
+    recs = datasets[2][~np.isnan(datasets[2])]
 
     if country != "UK":
-        time_fmt = "%Y-%m-%dT%H:%M:%S"
-        actual_days = [
-            datetime.strptime(c, time_fmt).day
-            for c in datasets[3] if c != 'NN'
-        ]
-        actual_months = [
-            datetime.strptime(c, time_fmt).month
-            for c in datasets[3] if c != 'NN'
-        ]
+        times = datasets[3][~np.isnat(datasets[3])]
+        month_starts = times.astype("datetime64[M]")
+        actual_days = (times.astype("datetime64[D]") -
+                       month_starts).astype(int) + 1
+        actual_months = month_starts.astype(int) % 12 + 1
 
         days_list = []
         day_march = [d for d, m in zip(actual_days, actual_months) if m == 3]
@@ -174,14 +194,25 @@ def plot_countries(datasets, months, country, table_file, download):
         x_deaths = [float(n) for n in range(int(x_cases[-1]) - len(deaths) + 1,
                                             int(x_cases[-1]) + 1)]
 
+        # date of the last data point
+        data_date = times[-1].astype("datetime64[D]").item()
+
     # UK specific data
+    official_mort = None
     if country == "UK":
-        x_cases, cases, x_deaths, deaths, avg_mort, stdev_mort = \
-            [], [], [], [], [], []
+        x_cases, cases, x_deaths, deaths = [], [], [], []
+        avg_mort, stdev_mort = [], []
+        # the reports have no UK numbers: Rt from the official cases
+        padded_cases = []
         for month in months:
             (x_casesi, casesi, x_deathsi,
              deathsi, avg_morti,
-             stdev_morti) = get_official_uk_data(month, download)
+             stdev_morti) = get_official_uk_data(month, download,
+                                                 data_dir, read_only)
+            month_cases = np.full(last_report_day(month), np.nan)
+            n_days = min(len(casesi), len(month_cases))
+            month_cases[:n_days] = casesi[:n_days]
+            padded_cases.append(month_cases)
             x_cases.extend(x_casesi)
             cases.extend(casesi)
             x_deaths.extend(x_deathsi)
@@ -196,17 +227,24 @@ def plot_countries(datasets, months, country, table_file, download):
         x_deaths = [float(n) for n in range(int(x_cases[-1]) - len(deaths) + 1,
                                             int(x_cases[-1]) + 1)]
 
-        avg_mort = np.mean(avg_mort)
-        stdev_mort = np.mean(stdev_mort)
+        # official mortality, shown in the deaths plot text
+        official_mort = (np.mean(avg_mort), np.mean(stdev_mort))
+        padded_cases = np.concatenate(padded_cases)
+        # official data is daily from the 1st of the first month
+        data_date = (np.datetime64("2020-{:02d}-01".format(months[0])) +
+                     len(cases) - 1).item()
+        # deaths end on the last day with cases
+        padded_deaths = np.full(len(padded_cases), np.nan)
+        days = np.flatnonzero(~np.isnan(padded_cases))
+        n_days = min(len(days), len(deaths))
+        if n_days:
+            padded_deaths[days[-n_days:]] = deaths[-n_days:]
 
     # log data
     y_cases = np.log(cases)
     y_deaths = np.log(deaths)
 
     # statistics
-    Pdt = []
-    Pr0 = []
-    Pr = []
     x_slow = y_slow = poly_x_s = y_err_s = slope_s = \
         d_time_s = R0_s = R_s = plot_text_s = plot_name_s = None
 
@@ -229,9 +267,10 @@ def plot_countries(datasets, months, country, table_file, download):
         
 
     # get data for plotting
-    Pdt.append(d_time)
-    Pr0.append(R0)
-    Pr.append(R)
+    fit = fit_records.empty_fit()
+    fit["doubling_time"] = d_time
+    fit["reproductive_number"] = R0
+    fit["fit_quality"] = R - 0.5
     double_cases = d_time
     rate_cases = slope
 
@@ -246,20 +285,17 @@ def plot_countries(datasets, months, country, table_file, download):
     plot_text, plot_name = linear.get_plot_text(slope, country,
                                                 R, d_time, R0,
                                                 x_cases,
-                                                months[-1])
+                                                months[-1],
+                                                data_date=data_date)
 
-    # compute average mortality
-    if country != "UK":
-        delta = len(cases) - len(deaths)
-        mort = np.array(deaths) / np.array(cases[delta:])
-        avg_mort = np.mean(mort)
-        stdev_mort = np.std(mort)
+    # compute delay-adjusted mortality (CFR) and its rolling stdev
+    avg_mort, stdev_mort = cfr.current_cfr(cases, deaths)
 
     # statistics: deaths
     poly_x_d = R_d = y_err_d = slope_d = \
         d_time_d = R0_d = plot_text_d = None
     rate_deaths = double_deaths = 1e-10
-    if deaths:
+    if len(deaths):
         d_time_d_s = None
         (poly_x_d, R_d, y_err_d,
          slope_d, d_time_d, R0_d) = linear.get_linear_parameters(
@@ -286,7 +322,7 @@ def plot_countries(datasets, months, country, table_file, download):
         plot_text_d = linear.get_deaths_plot_text(
             slope_d, "bla",
             R_d, d_time_d,
-            avg_mort, stdev_mort
+            avg_mort, stdev_mort, official_mort
         )
         if not d_time_d_s:
             rate_deaths = slope_d
@@ -295,29 +331,39 @@ def plot_countries(datasets, months, country, table_file, download):
             rate_deaths = slope_d_s
             double_deaths = d_time_d_s
 
+    fit["rate_cases"] = rate_cases
+    fit["cases"] = cases[-1]
+    fit["cfr"] = avg_mort
+    fit["cfr_std"] = stdev_mort
+    if len(deaths):
+        fit["rate_deaths"] = rate_deaths
+        fit["doubling_deaths"] = double_deaths
+        fit["deaths"] = deaths[-1]
+
     s1 = s2 = s3 = 1e-20
-    variable_pack = (
-        x_cases, y_cases, x_slow, y_slow,
-        cases, deaths, x_deaths, deaths,
-        y_deaths, poly_x, poly_x_s, poly_x_d,
-        y_err, y_err_d, plot_text, plot_text_s,
-        plot_text_d, plot_name, slope_d, slope,
-        march0, april0, may0
-    )
+    # no simulations with fewer than 3 death days
+    sim10_0 = sim10_1 = sim10_2 = sim10_3 = sim10_4 = 0.
+    sim20_0 = sim20_1 = sim20_2 = sim20_3 = sim20_4 = 0.
+    fits = fit_records.CountryFits(
+        fit_records.SeriesFit(x_cases, y_cases, cases, poly_x, R, y_err,
+                              slope, d_time, R0),
+        fit_records.SeriesFit(x_deaths, y_deaths, deaths, poly_x_d, R_d,
+                              y_err_d, slope_d, d_time_d, R0_d),
+        plot_text, plot_text_d, plot_name, (march0, april0, may0))
 
     # call plotting routines
-    make_evolution_plot(variable_pack, country, month_str)
-    if deaths and len(deaths) >= 3.0:
+    make_evolution_plot(fits, country, month_str)
+    if len(deaths) >= 3:
         (s1, s2, s3, sim10_0, sim10_1, sim10_2, sim10_3, sim10_4,
          sim20_0, sim20_1, sim20_2, sim20_3, sim20_4) = \
-            make_simulations_plot(variable_pack, country, month_str)
+            make_simulations_plot(fits, country, month_str)
 
     # write to table file
     if country in COUNTRY_PARAMS:
         iso_country = COUNTRY_PARAMS[country][0]
         pop = COUNTRY_PARAMS[country][1]
         cs = str(int(cases[-1]))
-        if deaths:
+        if len(deaths):
             ds = str(int(deaths[-1]))
         else:
             ds = '0'
@@ -340,38 +386,43 @@ def plot_countries(datasets, months, country, table_file, download):
         fs1 = "%.1f" % (cases[-1] / s1 * 100.)
         fs2 = "%.1f" % (cases[-1] / s2 * 100.)
         fs3 = "%.1f" % (cases[-1] / s3 * 100.)
-        data_line = ",".join([iso_country,
-                              country,
-                              cs,
-                              ds,
-                              br,
-                              mr,
-                              dc,
-                              dd,
-                              f1, f2, f3,
-                              xs1, xs2, xs3,
-                              fs1, fs2, fs3,
-                              f10_1, f10_2, f10_3,
-                              f20_1, f20_2, f20_3]) + '\n'
-        with open(table_file, "a") as file:
-            file.write(data_line)
-        with open("country_tables/countries_with_case_doubling-time_larger_14days.csv", "a") as file:
-            if float(dc) >= 14.:
-                file.write(country + "," + dc + "\n")
-
-
-    return Pdt, Pr0, [pr - 0.5 for pr in Pr], (np.array(cases), np.array(deaths))
-
-
-
-
-def make_simulations_plot(variable_pack, country, month_str):
-    # get variable pack
-    (x_data, y_data, x_slow, y_slow, y_data_real, y_deaths_real,
-     x_deaths, y_deaths_real, y_deaths, poly_x, poly_x_s,
-     poly_x_d, y_err, y_err_d, plot_text, plot_text_s,
-     plot_text_d, plot_name, slope_d, slope,
-     march0, april0, may0) = variable_pack
+        cfr_s = "%.2f" % (avg_mort * 100.)
+        cfr_std = "%.2f" % (stdev_mort * 100.)
+        writer.add_row([iso_country,
+                        country,
+                        cs,
+                        ds,
+                        br,
+                        mr,
+                        dc,
+                        dd,
+                        f1, f2, f3,
+                        xs1, xs2, xs3,
+                        fs1, fs2, fs3,
+                        f10_1, f10_2, f10_3,
+                        f20_1, f20_2, f20_3,
+                        cfr_s, cfr_std])
+        if float(dc) >= 14.:
+            writer.add_slow_row(country, dc)
+
+
+    return fit, (np.array(cases), np.array(deaths), padded_cases,
+                 padded_deaths)
+
+
+
+
+def make_simulations_plot(fits, country, month_str):
+    """Make the simulated cases plot from the deaths and death rate."""
+    # get the fits
+    x_data, y_data, y_data_real = \
+        fits.cases.x, fits.cases.y, fits.cases.values
+    x_deaths, y_deaths, y_deaths_real = \
+        fits.deaths.x, fits.deaths.y, fits.deaths.values
+    poly_x, poly_x_d = fits.cases.poly_x, fits.deaths.poly_x
+    slope_d = fits.deaths.slope
+    plot_text, plot_text_d = fits.plot_text, fits.plot_text_d
+    march0, april0, may0 = fits.month_starts
 
     # extract last points for dsiplay
     curr_case = y_data_real[-1]
@@ -482,7 +533,7 @@ def make_simulations_plot(variable_pack, country, month_str):
     last_tick_real.append(sim_y_2_f)
     last_tick_real.append(sim_y_3_f)
     last_tick_real.append(sim_y_4_f)
-    plt.yticks(last_tick, [np.int(y01) for y01 in last_tick_real])
+    plt.yticks(last_tick, [int(y01) for y01 in last_tick_real])
     plt.tick_params(axis="y", labelsize=8)
     plt.annotate(str(int(sim_y_4_real[-1])),xy=(x_deaths[-1]-20,sim_y_4[-1]))
     plt.annotate(str(int(sim_y_0_real[-1])),xy=(x_deaths[-1]-20,sim_y_0[-1]))
@@ -499,9 +550,6 @@ def make_simulations_plot(variable_pack, country, month_str):
               "Sim cum. no. cases: rep. deaths x 1/M; rate=current death rate (0.5 x current death rate if > 5%)",
               fontsize=10)
 
-    if not os.path.isdir(os.path.join("country_plots", country)):
-        os.makedirs(os.path.join("country_plots", country))
-
     plt.savefig(os.path.join("country_plots", country,
                              "COVID-19_LIN_{}_SIM_CASES.png".format(country)))
     plt.close()
@@ -575,9 +623,6 @@ def make_simulations_plot(variable_pack, country, month_str):
                      fontsize=10)
         plt.title("Best case: quarantine rates b=m=0.2", color='green', fontsize=10)
 
-        if not os.path.isdir(os.path.join("country_plots", country)):
-            os.makedirs(os.path.join("country_plots", country))
-
         plt.savefig(os.path.join("country_plots", country,
                                  "COVID-19_LIN_{}_DARK_SIM_UK.png".format(country)))
         plt.close()
@@ -645,9 +690,6 @@ def make_simulations_plot(variable_pack, country, month_str):
                      fontsize=10)
         plt.title("Best: b=m=0.05 (DoublTime=14 days, R=1)", color='green', fontsize=10)
 
-        if not os.path.isdir(os.path.join("country_plots", country)):
-            os.makedirs(os.path.join("country_plots", country))
-
         plt.savefig(os.path.join("country_plots", country,
                                  "COVID-19_LIN_{}_DARK_SIM_UK.png".format(country)))
         plt.close()
@@ -656,15 +698,14 @@ def make_simulations_plot(variable_pack, country, month_str):
             sim20_0, sim20_1, sim20_2, sim20_3, sim20_4)
 
 
-def _read_write_parameter(filename, parameter, stddev_parameter):
-    """Read doubling time from record."""
-    # eg filename="country_data/mean_doubling_time", parameter=mean_dt
-    # stddev_parameter=np.std(parameter)
-    with open(filename, "r") as file:
-        data_lines = [c.split(' ')[0] for c in file.readlines()]
-    with open(filename, "a") as file:
-        if str(parameter) not in data_lines:
-            file.write(str(parameter) + ' ' + str(stddev_parameter) + "\n")
+def record_ensemble(run_date, doubling_time, basic_reproductive,
+                    lin_fit_quality):
+    """Add the run's doubling times and R0 to the ensemble statistics."""
+    store = ensemble_store.EnsembleStore()
+    store.add(run_date, "doubling time", doubling_time, lin_fit_quality)
+    store.add(run_date, "R0", [c * 10. for c in basic_reproductive],
+              lin_fit_quality)
+    store.commit()
 
 
 def plot_parameters(doubling_time, basic_reproductive,
@@ -687,17 +728,12 @@ def plot_parameters(doubling_time, basic_reproductive,
     plt.title(title, fontsize=10)
 
     country = "ALL_COUNTRIES"
-    if not os.path.isdir(os.path.join("country_plots", country)):
-        os.makedirs(os.path.join("country_plots", country))
 
     plt.savefig(os.path.join("country_plots",
                              country,
                              "Histogram_Doubling_Time.png"))
     plt.close()
 
-    # append historical data
-    _read_write_parameter("country_data/mean_doubling_time", mean_dt, std_dt)
-
     R_0 = [c * 10. for c in basic_reproductive]
     plt.hist(R_0, bins=20, color='darkolivegreen',
              normed=True, cumulative=False, weights=lin_fit_quality)
@@ -717,22 +753,9 @@ def plot_parameters(doubling_time, basic_reproductive,
     plt.title(title, fontsize=8)
 
     country = "ALL_COUNTRIES"
-    if not os.path.isdir(os.path.join("country_plots", country)):
-        os.makedirs(os.path.join("country_plots", country))
 
     plt.savefig(os.path.join("country_plots", country,
                              "Histogram_Basic_Reproductive_Number.png"))
-    # append historical data
-    _read_write_parameter("country_data/basic_reproductive_number",
-                          mean_r0, std_r0)
-
-    with open("country_data/DT_27-03-2020", "w") as file:
-        for dt in doubling_time:
-            file.write(str(dt) + "\n")
-    with open("country_data/R0_27-03-2020", "w") as file:
-        for r0 in R_0:
-            file.write(str(r0) + "\n")
-
     plt.close()
 
 
@@ -755,17 +778,10 @@ def plot_doubling(cases_dt, deaths_dt, current_range, country):
     plt.plot(current_range, cases_dt, color='r')
     plt.plot(current_range, deaths_dt, color='b')
 
-    # rollong average
+    # rollong average of cases and deaths doubling times
     n = 7
-    # cases rates
-    ret_c = np.cumsum(np.array([float(m) for m in cases_dt]), dtype=float)
-    ret_c[n:] = ret_c[n:] - ret_c[:-n]
-    rolling_avg_c = ret_c[n - 1:] / n
-
-    # death rates
-    ret_d = np.cumsum(np.array([float(m) for m in deaths_dt]), dtype=float)
-    ret_d[n:] = ret_d[n:] - ret_d[:-n]
-    rolling_avg_d = ret_d[n - 1:] / n
+    rolling_avg_c, rolling_avg_d = rolling.rolling_mean(
+        np.array([cases_dt, deaths_dt], dtype=float), n)
 
     # plot rolling averages
     plt.plot(current_range[6:], rolling_avg_c,
@@ -819,16 +835,18 @@ def plot_doubling(cases_dt, deaths_dt, current_range, country):
     plt.grid()
     plt.legend(loc="lower left", fontsize=8)
 
-    if not os.path.isdir(os.path.join("country_plots", country)):
-        os.makedirs(os.path.join("country_plots", country))
-
     plt.savefig(os.path.join("country_plots", country,
                              "COVID-19_Doubling_Times_{}.png".format(country)))
     plt.close()
 
 
-def plot_R(nums_dt, n=7):
-    """Plot a 3-day rolling average of numbers of deaths."""
+def plot_R(nums_cases, window=7):
+    """
+    Plot the renewal-equation Rt with 95% credible intervals.
+
+    nums_cases are the cumulative cases of each analyzed day, NaN for
+    missing days, so that the days of all countries line up.
+    """
     analyzed_countries = ["UK", "France", "Germany", "US",
                           "Spain", "Italy", "Netherlands",
                           "Belgium", "Romania", "Sweden", "Norway",
@@ -838,36 +856,60 @@ def plot_R(nums_dt, n=7):
                       "Belgium":"lime", "Romania":"orange", "Sweden":"gray", "Norway":"maroon",
                       "Switzerland":"teal", "Canada":"darkslategrey", "Austria": "tan",
                       "Bulgaria": "fuchsia"}
-    len_windows = []
-    for country, dt in nums_dt.items():
-        if country in analyzed_countries:
-            dt = np.array([float(t) for t in dt])
-            R = 14. * (np.exp(0.69314 / dt) - 1.)
-            plt.plot(range(len(R)), R,
-                     color=country_colors[country], label=country)
-            #plt.annotate(country, xy=(len(R) + 0.05,
-            #                          R[-1]), fontsize=8)
-
-    header = "Reproductive number $R_0 = 14(\exp(ln2/T_d) - 1)$\n"
-    sup_header = "where $T_d$ is doubling time for reported cases"
+    geographies = [c for c in nums_cases if c in analyzed_countries]
+    if not geographies:
+        return
+    # all countries in one pass
+    matrix = rt.align_series(nums_cases, geographies)
+    rt_mean, rt_low, rt_high = rt.estimate_rt(matrix, window=window)
+    days = np.arange(matrix.shape[1])
+    for i, country in enumerate(geographies):
+        plt.plot(days, rt_mean[i],
+                 color=country_colors[country], label=country)
+        plt.fill_between(days, rt_low[i], rt_high[i],
+                         color=country_colors[country], alpha=0.15)
+
+    header = "Reproductive number $R_t$ from the renewal equation " + \
+             "(%i-day window, 95%% credible interval)\n" % window
+    sup_header = "serial interval: gamma, mean %.1f days, std %.1f days" % \
+        (rt.SERIAL_INTERVAL_MEAN, rt.SERIAL_INTERVAL_STD)
     plt.title(header + sup_header, fontsize=10)
-    plt.xlabel("Day [starting April 4th]")
-    plt.ylabel("R0")
+    plt.xlabel("Day [since start of analyzed period]")
+    plt.ylabel("Rt")
     plt.axhline(1., linestyle="--", color='r')
-    plt.xlim(0, len(R) + 3)
+    plt.xlim(max(window, rt.SERIAL_INTERVAL_MAX), len(days) + 3)
+    plt.ylim(0., 5.)
     plt.legend(loc="upper right", fontsize=8)
     plt.grid()
 
     country = "ALL_COUNTRIES"
-    if not os.path.isdir(os.path.join("country_plots", country)):
-        os.makedirs(os.path.join("country_plots", country))
 
     plt.savefig(os.path.join("country_plots", country,
                              "COVID-19_R0.png"))
     plt.close()
 
 
-def plot_rolling_average(nums_deaths, n=7):
+def uk_official_deaths(nums_deaths):
+    """Get the cumulative deaths per country, UK from the official history."""
+    nums_deaths = dict(nums_deaths)
+    if "UK" in nums_deaths:
+        nums_deaths["UK"] = load_uk_deaths_history()
+
+    return nums_deaths
+
+
+def rolling_deaths(nums_deaths, threshold=5.):
+    """Get the rolling statistics of cumulative deaths above threshold."""
+    geographies = list(nums_deaths)
+    populations = [COUNTRY_PARAMS[geo][1] if geo in COUNTRY_PARAMS else np.nan
+                   for geo in geographies]
+
+    return rolling.RollingStats(nums_deaths, geographies, populations,
+                                threshold=threshold,
+                                first_dates={"UK": UK_DEATHS_FIRST_DAY})
+
+
+def plot_rolling_average(nums_deaths, stats, n=7):
     """Plot a 3-day rolling average of numbers of deaths."""
     analyzed_countries = ["UK", "France", "Germany", "US",
                           "Spain", "Italy", "Netherlands",
@@ -878,147 +920,75 @@ def plot_rolling_average(nums_deaths, n=7):
                       "Belgium":"lime", "Romania":"orange", "Sweden":"gray", "Norway":"maroon",
                       "Switzerland":"teal", "Canada":"darkslategrey",
                       "Austria": "tan", "Bulgaria": "fuchsia"}
-    len_windows = []
-    for country, deaths in nums_deaths.items():
-        if country in analyzed_countries:
-            if country == "UK":
-                deaths = np.loadtxt("country_data/UK_deaths_history")
-            deaths = list(sorted([d for d in deaths if d > 5.]))
-            # adjust for ONS correction of 29 April 2020
-            # rempve the delta from 28 to 29 April (outlier) and replace with 28 apr value
-            deaths = [deaths[i + 1] - deaths[i] for i in range(len(deaths) - 1)]
-            if country == "UK":
-                deaths[46] = 585.  # keep previous delta
-            ret = np.cumsum(deaths, dtype=float)
-            ret[n:] = ret[n:] - ret[:-n]
-            rolling_avg = ret[n - 1:] / n
+    # daily increments (UK 29/04 ONS correction applied, see
+    # rolling.CORRECTIONS), per capita and cumulative, all countries at once
+    figures = [
+        (stats.series(stats.rolling_mean(n)),
+         "7-day rolling average for daily no. of deaths increase starting at min=5"
+         "\nUK: 29/04 correction from ONS: 4419 increase replaced with prev. day increase 585",
+         "7-day rolling window average daily no of deaths",
+         "COVID-19_Deaths_Rolling_Average.png"),
+        (stats.series(stats.rolling_mean(n, per_capita=True)),
+         "7-day rolling average for daily no. of deaths increase starting at min=5"
+         "\n Proportion of each 1,000 of country population (equiv. to per thousand)"
+         "\nUK: 29/04 correction from ONS: 4419 increase replaced with prev. day increase 585",
+         "7-day rolling window average daily no of deaths per 1k of population",
+         "COVID-19_Deaths_Rolling_Average_per_Population.png"),
+        (stats.series(stats.rolling_mean(n, per_capita=True, daily=False)),
+         "7-day rolling average cumulative no. of deaths starting at min=5"
+         "\n Proportion of each 1,000 of country population (equiv. to per thousand)",
+         "7-day rolling window average cumulative no. of deaths per 1k population",
+         "COVID-19_Deaths_per_Population.png"),
+    ]
+    countries = [country for country in stats.geographies
+                 if country in analyzed_countries]
+    len_windows = [len(figures[0][0][country]) for country in countries]
+    for idx, (series, title, ylabel, file_name) in enumerate(figures):
+        for country in countries:
+            rolling_avg = series[country]
+            if not len(rolling_avg):
+                continue
             plt.plot(range(len(rolling_avg)), rolling_avg,
                      color=country_colors[country], label=country)
             plt.annotate(country, xy=(len(rolling_avg) + 0.05,
                                       rolling_avg[-1]), fontsize=8)
-            len_windows.append(len(rolling_avg))
-
-    header = "7-day rolling average for daily no. of deaths increase starting at min=5"
-    subheader = "\nUK: 29/04 correction from ONS: 4419 increase replaced with prev. day increase 585"
-    plt.title(header + subheader, fontsize=10)
-    plt.xlabel("Rolling window midpoint [day]")
-    plt.ylabel("7-day rolling window average daily no of deaths")
-    plt.semilogy()
-    plt.xlim(0, max(len_windows) + 3)
-    plt.grid()
-
-    country = "ALL_COUNTRIES"
-    if not os.path.isdir(os.path.join("country_plots", country)):
-        os.makedirs(os.path.join("country_plots", country))
-
-    plt.savefig(os.path.join("country_plots", country,
-                             "COVID-19_Deaths_Rolling_Average.png"))
-    plt.close()
-
-    for country, deaths in nums_deaths.items():
-        if country in analyzed_countries:
-            if country == "UK":
-                deaths = np.loadtxt("country_data/UK_deaths_history")
-            deaths = list(sorted([d for d in deaths if d > 5.]))
-            deaths = [deaths[i + 1] - deaths[i] for i in range(len(deaths) - 1)]
-            # adjust delta from ONS correction; replace outlier with value from 28 apr
-            if country == "UK":
-                deaths[46] = 585.  # keep previous delta
-            cp = COUNTRY_PARAMS[country][1]
-            deaths_per_capita = [d / cp for d in deaths]
-            ret_pc = np.cumsum(deaths_per_capita, dtype=float)
-            ret_pc[n:] = ret_pc[n:] - ret_pc[:-n]
-            rolling_avg_pc = ret_pc[n - 1:] / n
-            plt.plot(range(len(rolling_avg_pc)), rolling_avg_pc,
-                     color=country_colors[country], label=country)
-            plt.annotate(country, xy=(len(rolling_avg_pc) + 0.05,
-                                      rolling_avg_pc[-1]), fontsize=8)
-
-    header = "7-day rolling average for daily no. of deaths increase starting at min=5"
-    subheader = '\n Proportion of each 1,000 of country population (equiv. to per thousand)'
-    subheader2 = "\nUK: 29/04 correction from ONS: 4419 increase replaced with prev. day increase 585"
-    plt.title(header + subheader + subheader2, fontsize=10)
-    plt.xlabel("Rolling window midpoint [day]")
-    plt.ylabel("7-day rolling window average daily no of deaths per 1k of population")
-    plt.semilogy()
-    plt.xlim(0, max(len_windows) + 3)
-    plt.grid()
-    plt.legend(loc="lower right", fontsize=8)
-
-    country = "ALL_COUNTRIES"
-    if not os.path.isdir(os.path.join("country_plots", country)):
-        os.makedirs(os.path.join("country_plots", country))
-
-    plt.savefig(os.path.join("country_plots", country,
-                             "COVID-19_Deaths_Rolling_Average_per_Population.png"))
-    plt.close()
-
-
-    for country, deaths in nums_deaths.items():
-        if country in analyzed_countries:
-            if country == "UK":
-                deaths = np.loadtxt("country_data/UK_deaths_history")
-            deaths = list(sorted([d for d in deaths if d > 5.]))
-            cp = COUNTRY_PARAMS[country][1]
-            deaths_per_capita = [d / cp for d in deaths]
-            ret_pc = np.cumsum(deaths_per_capita, dtype=float)
-            ret_pc[n:] = ret_pc[n:] - ret_pc[:-n]
-            rolling_avg_pc = ret_pc[n - 1:] / n
-            plt.plot(range(len(rolling_avg_pc)), rolling_avg_pc,
-                     color=country_colors[country], label=country)
-            plt.annotate(country, xy=(len(rolling_avg_pc) + 0.05,
-                                      rolling_avg_pc[-1]), fontsize=8)
-
-    header = "7-day rolling average cumulative no. of deaths starting at min=5"
-    subheader = '\n Proportion of each 1,000 of country population (equiv. to per thousand)'
-    plt.title(header + subheader, fontsize=10)
-    plt.xlabel("Rolling window midpoint [day]")
-    plt.ylabel("7-day rolling window average cumulative no. of deaths per 1k population")
-    plt.semilogy()
-    plt.xlim(0, max(len_windows) + 3)
-    plt.grid()
-    plt.legend(loc="lower right", fontsize=8)
-
-    country = "ALL_COUNTRIES"
-    if not os.path.isdir(os.path.join("country_plots", country)):
-        os.makedirs(os.path.join("country_plots", country))
+        plt.title(title, fontsize=10)
+        plt.xlabel("Rolling window midpoint [day]")
+        plt.ylabel(ylabel)
+        plt.semilogy()
+        plt.xlim(0, max(len_windows + [0]) + 3)
+        plt.grid()
+        if idx:
+            plt.legend(loc="lower right", fontsize=8)
+        plt.savefig(os.path.join("country_plots", "ALL_COUNTRIES", file_name))
+        plt.close()
 
-    plt.savefig(os.path.join("country_plots", country,
-                             "COVID-19_Deaths_per_Population.png"))
-    plt.close()
+    for country in countries:
+        deaths = np.asarray(nums_deaths[country], dtype=float)
+        deaths = np.sort(deaths[np.isfinite(deaths)])
+        # bars of the deaths and of the previous day deaths
+        x = np.arange(len(deaths))
+        x_shift = np.arange(1, len(deaths))
+        width = 0.75
+        fig, ax = plt.subplots()
+        rects1 = ax.bar(x - width/2, deaths, width,
+                        color='red', log=True)
+        rects2 = ax.bar(x_shift - width/2, deaths[:-1], width,
+                        color=country_colors[country], log=True)
+
+        # Add some text for labels, title and custom x-axis tick labels, etc.
+        # ax.set_yscale('log')
+        ax.set_ylabel('No of deaths')
+        ax.set_xlabel('Days since first death recorded')
+        ax.set_title('{}: March-April number of deaths and daily increment'.format(country))
+        ax.set_xticks(x)
+        ax.tick_params(axis="x", labelsize=6)
+        ax.grid()
+        ax.legend()
 
-    for country, deaths in nums_deaths.items():
-        if country in analyzed_countries:
-            if country == "UK":
-                deaths = np.loadtxt("country_data/UK_deaths_history")
-            deaths = list(sorted([d for d in deaths]))
-            dd = [deaths[i + 1] - deaths[i] for i in range(len(deaths) - 1)]
-            delta_deaths = np.array(deaths[1:]) - np.array(dd) 
-            x = np.arange(len(deaths))
-            x_shift = np.arange(1, len(deaths))
-            width = 0.75
-            fig, ax = plt.subplots()
-            rects1 = ax.bar(x - width/2, deaths, width,
-                            color='red', log=True)
-            rects2 = ax.bar(x_shift - width/2, delta_deaths, width,
-                            color=country_colors[country], log=True)
-
-            # Add some text for labels, title and custom x-axis tick labels, etc.
-            # ax.set_yscale('log')
-            ax.set_ylabel('No of deaths')
-            ax.set_xlabel('Days since first death recorded')
-            ax.set_title('{}: March-April number of deaths and daily increment'.format(country))
-            ax.set_xticks(x)
-            ax.tick_params(axis="x", labelsize=6)
-            ax.grid()
-            ax.legend()
-
-            if not os.path.isdir(os.path.join("country_plots", country)):
-                os.makedirs(os.path.join("country_plots", country))
-
-            plt.savefig(os.path.join("country_plots", country,
-                                     "COVID-19_Deaths_logHist_{}.png".format(country)))
-            plt.close()
+        plt.savefig(os.path.join("country_plots", country,
+                                 "COVID-19_Deaths_logHist_{}.png".format(country)))
+        plt.close()
 
 
 def get_linear_parameters_local(x, y):
@@ -1044,84 +1014,57 @@ def plot_death_extrapolation(death_rates):
                       "Switzerland":"teal", "Canada":"darkslategrey", "Austria": "tan",
                       "Bulgaria": "fuchsia"}
 
-    all_rates = []
-    all_frequencies = []
-
-    for country, tuplex in death_rates.items():
-        if country in analyzed_countries:
-            daily_deaths = tuplex[0]
-            daily_rates = tuplex[1]
-            rate_frequency = {float(key):len(list(group)) for key,group in groupby(daily_rates)}
-            rate_frequency = dict(sorted(rate_frequency.items()))
-            plt.scatter(rate_frequency.keys(), rate_frequency.values(),
-                        color=country_colors[country], s=60, label=country)
-            all_rates.extend(rate_frequency.keys())
-            all_frequencies.extend(rate_frequency.values())
-
-            # plot bar rates
-            frequencies = rate_frequency.values()
-            labels = ['m={}'.format(m) for m in rate_frequency.keys()]
-            x = np.arange(len(labels))  # the label locations
-            width = 0.45  # the width of the bars
-            fig, ax = plt.subplots()
-            rects1 = ax.bar(x - width/2, frequencies, width,
-                            color=country_colors[country])
-
-            # Add some text for labels, title and custom x-axis tick labels, etc.
-            ax.set_ylabel('No of days of constant rate $m$')
-            ax.set_title('{}: 5-day average daily growth rate of deaths $m$ vs no of days of constant $m$'.format(country))
-            ax.set_xticks(x)
-            ax.set_xticklabels(labels)
-            ax.tick_params(axis="x", labelsize=8)
-            ax.grid()
-            ax.legend()
-
-            if not os.path.isdir(os.path.join("country_plots", country)):
-                os.makedirs(os.path.join("country_plots", country))
-
-            plt.savefig(os.path.join("country_plots", country,
-                                     "COVID-19_DeathsRate_Rolling_Average_{}.png".format(country)))
-            plt.close()
-
-    all_rates = [float(a) for a in all_rates]
-    all_rates = np.array(all_rates)
-    all_frequencies = np.array(all_frequencies)
-    doubles = [(i, j) for i, j in zip(all_rates, all_frequencies)]
-
-    lim_10 = [d for d in doubles if d[0] < 10.0]
-    x_10 = np.array([s[0] for s in lim_10])
-    y_10 = np.array([s[1] for s in lim_10])
-
-    lim_5 = [d for d in doubles if d[0] < 5.0]
-    x_5 = np.array([s[0] for s in lim_5])
-    y_5 = np.array([s[1] for s in lim_5])
-
-    # look for smaller rates
-    #lim_25 = [d for d in doubles if d[0] < 2.5]
-    #x_25 = np.array([s[0] for s in lim_25])
-    #y_25 = np.array([s[1] for s in lim_25])
+    # days at each (binned) death rate of all countries at once
+    countries = [country for country in death_rates
+                 if country in analyzed_countries]
+    rate_histogram = runs.RateHistogram(
+        {country: death_rates[country][1] for country in countries},
+        countries)
 
-    # get linear params for all data
-    poly_x, slope, intercept = get_linear_parameters_local(
-        all_rates,
-        all_frequencies)
-    poly_x10, slope10, intercept10 = get_linear_parameters_local(
-        x_10,
-        y_10)
-    poly_x5, slope5, intercept5 = get_linear_parameters_local(
-        x_5,
-        y_5)
-    #poly_x25, slope25, intercept25 = get_linear_parameters_local(
-    #    x_25,
-    #    y_25)
-    plt.plot(all_rates, poly_x, '--r')
-    plt.plot(x_10, poly_x10, '--b')
-    plt.plot(x_5, poly_x5, '--g')
-    #plt.plot(x_25, poly_x25, '--k')
-    plt.annotate("(all m) = %.2f %.2f x R" % (intercept, slope), xy=(11., 8.), color='r')
-    plt.annotate("$(m < 0.1)$ = %.2f %.2f x R" % (intercept10, slope10), xy=(11., 7.5), color='b')
-    plt.annotate("$(m < 0.05)$ = %.2f %.2f x R" % (intercept5, slope5), xy=(11., 7.), color='g')
-    #plt.annotate("$(m < 0.025)$ = %.2f %.2f x R" % (intercept25, slope25), xy=(11., 6.5), color='k')
+    for country in countries:
+        rates, frequencies = rate_histogram.geography(country)
+        longest = rate_histogram.longest_runs(country)
+        plt.scatter(rates, frequencies,
+                    color=country_colors[country], s=60, label=country)
+
+        # plot bar rates
+        labels = ['m={}'.format(m) for m in rates]
+        x = np.arange(len(labels))  # the label locations
+        width = 0.45  # the width of the bars
+        fig, ax = plt.subplots()
+        rects1 = ax.bar(x - width/2, frequencies, width,
+                        color=country_colors[country], label="all days")
+        rects2 = ax.bar(x + width/2, longest, width,
+                        color=country_colors[country], alpha=0.5,
+                        label="longest run")
+
+        # Add some text for labels, title and custom x-axis tick labels, etc.
+        ax.set_ylabel('No of days of constant rate $m$')
+        ax.set_title('{}: 5-day average daily growth rate of deaths $m$ vs no of days of constant $m$'.format(country))
+        ax.set_xticks(x)
+        ax.set_xticklabels(labels)
+        ax.tick_params(axis="x", labelsize=8)
+        ax.grid()
+        ax.legend()
+
+        plt.savefig(os.path.join("country_plots", country,
+                                 "COVID-19_DeathsRate_Rolling_Average_{}.png".format(country)))
+        plt.close()
+
+    # get linear params for all data, m < 0.1 and m < 0.05
+    fits = [(None, '--r', "(all m)", 8.),
+            (10.0, '--b', "$(m < 0.1)$", 7.5),
+            (5.0, '--g', "$(m < 0.05)$", 7.)]
+    for limit, line_style, label, y_label in fits:
+        rates, frequencies = rate_histogram.below(limit)
+        if len(np.unique(rates)) < 2:
+            continue
+        poly_x, slope, intercept = get_linear_parameters_local(
+            rates,
+            frequencies)
+        plt.plot(rates, poly_x, line_style)
+        plt.annotate("%s = %.2f %.2f x R" % (label, intercept, slope),
+                     xy=(11., y_label), color=line_style[-1])
 
     header = "5-day rolling average daily growth rate $m$ for deaths (from $exp^{mt}$) vs times (days) of constant $m$"
     plt.title(header, fontsize=10)
@@ -1131,14 +1074,192 @@ def plot_death_extrapolation(death_rates):
     plt.legend(loc="upper right", fontsize=8)
 
     country = "ALL_COUNTRIES"
-    if not os.path.isdir(os.path.join("country_plots", country)):
-        os.makedirs(os.path.join("country_plots", country))
 
     plt.savefig(os.path.join("country_plots", country,
                              "COVID-19_DeathsRate_Rolling_Average_Counts.png"))
     plt.close()
 
 
+class GeographyResult(object):
+    """Results of the analysis of one country or region."""
+
+    __slots__ = ("geography", "region", "fit", "cases", "deaths",
+                 "padded_cases", "padded_deaths", "plots", "instruments",
+                 "writer")
+
+    def __init__(self, geography, region):
+        self.geography = geography
+        self.region = region
+        self.fit = fit_records.empty_fit()
+        self.cases = None
+        self.deaths = None
+        # all analyzed days, NaN if missing: the Rt and CFR day axis
+        self.padded_cases = None
+        self.padded_deaths = None
+        self.plots = []
+        self.instruments = None
+        self.writer = results_writer.ResultsWriter(None)
+
+
+def _monthly_numbers(geography, region, month, store, fetch, series,
+                     data_dir=DATA_DIR, read_only=False):
+    """Get monthly data from the time-series cube or the daily reports."""
+    if series is not None and not region:
+        return series.monthly(geography, month)
+
+    return get_monthly_countries_data(geography, month, region=region,
+                                      store=store, fetch=fetch,
+                                      data_dir=data_dir, read_only=read_only)
+
+
+def load_geography(geography, region, months, store=None, fetch=True,
+                   series=None, data_dir=DATA_DIR, read_only=False):
+    """
+    Get monthly data and previous month's deaths of a geography.
+
+    Countries are sliced from the time-series cube if one is given
+    (see datafinder.time_series), else read from the daily reports in
+    data_dir (see data_finder.get_monthly_countries_data for read_only).
+    """
+    cases, deaths, recs, times = [], [], [], []
+    prev_month_deaths = np.array([])
+    for month in months:
+        monthly_numbers_i = _monthly_numbers(geography, region, month,
+                                             store, fetch, series,
+                                             data_dir, read_only)
+        if len(months) == 1 and not region:
+            monthly_numbers_prev_month = _monthly_numbers(
+                geography, region, month - 1, store, fetch, series,
+                data_dir, read_only)
+            prev_deaths = monthly_numbers_prev_month[1]
+            prev_month_deaths = prev_deaths[~np.isnan(prev_deaths)]
+
+        cases.append(monthly_numbers_i[0])
+        deaths.append(monthly_numbers_i[1])
+        recs.append(monthly_numbers_i[2])
+        times.append(monthly_numbers_i[3])
+
+    return (np.concatenate(cases), np.concatenate(deaths),
+            np.concatenate(recs), np.concatenate(times)), prev_month_deaths
+
+
+def _history_range(history, geography, column):
+    """Get days since March 31st and values of a history column."""
+    today_iso = datetime.today().strftime("%Y-%m-%d")
+    dates, values = history.series(geography, column,
+                                   start=HISTORY_START, end=today_iso)
+    # x-axis: days since March 31st (April 4th is day 4)
+    current_range = (dates - np.datetime64("2020-03-31")).astype(int)
+
+    return current_range, values
+
+
+def analyze_geography(geography, region, monthly_numbers, months,
+                      download, history, data_dir=DATA_DIR, read_only=False,
+                      verbose=True):
+    """
+    Fit, plot and tabulate a country or region.
+
+    Official data (UK) is read from data_dir; verbose prints progress.
+    """
+    if verbose:
+        print("Analyzing {} ...".format(geography))
+    result = GeographyResult(geography, region)
+
+    # get the evolution parameters
+    result.fit, nums = plot_countries(monthly_numbers, months, geography,
+                                      result.writer,
+                                      download and not region,
+                                      data_dir, read_only)
+    if region:
+        return result
+    result.cases = nums[0]
+    result.deaths = nums[1]
+    result.padded_cases = nums[2]
+    result.padded_deaths = nums[3]
+
+    # plot historic doubling times from history
+    if len(months) > 1:
+        current_range, cases_dt = _history_range(history, geography,
+                                                 "doubling cases (days)")
+        _, deaths_dt = _history_range(history, geography,
+                                      "doubling deaths (days)")
+        if len(cases_dt) >= 7:
+            if verbose:
+                print("Analyzing cases dubling times count {}".format(
+                    str(len(cases_dt))))
+            plot_doubling(cases_dt, deaths_dt, current_range, geography)
+
+    return result
+
+
+def add_aligned_series(run_results, result):
+    """Add the day-aligned cases and deaths of a country (NaN: no data)."""
+    run_results.add_array("cases_aligned", result.geography,
+                          result.padded_cases)
+    run_results.add_array("deaths_aligned", result.geography,
+                          result.padded_deaths)
+
+
+def add_rt_series(run_results, nums_cases):
+    """Add the Rt series and credible intervals of all countries."""
+    geographies = list(nums_cases)
+    if not geographies:
+        return
+    matrix = rt.align_series(nums_cases, geographies)
+    for name, values in zip(("rt", "rt_lower", "rt_upper"),
+                            rt.estimate_rt(matrix)):
+        for i, geography in enumerate(geographies):
+            run_results.add_array(name, geography, values[i])
+
+
+def add_rolling_series(run_results, death_stats, n=7):
+    """Add the 7-day rolling average of daily deaths of all countries."""
+    for geography, values in death_stats.series(
+            death_stats.rolling_mean(n)).items():
+        run_results.add_array("deaths_rolling_avg", geography, values)
+
+
+# per-process state of the analysis workers
+_WORKER = {}
+
+
+def _init_worker(history, plots=True):
+    """Set the results history and plot collection of an analysis worker."""
+    _WORKER["history"] = history
+    # forked workers start counting from zero
+    instrument.set_instruments(instrument.Instruments())
+    if plots:
+        render.set_renderer(render.Renderer(collect=True))
+    else:
+        render.set_renderer(render.NullRenderer())
+
+
+def _analyze_task(task):
+    """Analyze one geography of the shared data cube in a worker."""
+    idx, spec, months, download = task
+    cube = _WORKER.get("cube")
+    if cube is None or cube.spec != spec:
+        from cov_model.datafinder import shared_cube
+        cube = _WORKER["cube"] = shared_cube.SharedCube.attach(spec)
+    result = analyze_geography(str(cube.geographies[idx]),
+                               bool(cube.regions[idx]),
+                               cube.datasets(idx), months, download,
+                               _WORKER["history"])
+
+    # figures are drawn by the parent's render stage
+    result.plots = render.get_renderer().pop_specs()
+
+    # timers and counters are merged by the parent
+    result.instruments = instrument.get_instruments().snapshot(reset=True)
+
+    # hand arrays and fit numbers back via the shared block only
+    cube.write_fit(idx, result.fit, result.cases, result.deaths)
+    result.fit = result.cases = result.deaths = None
+
+    return result
+
+
 def main():
     """Execute the plotter."""
     # parse command line args
@@ -1167,12 +1288,72 @@ def main():
                         type=bool,
                         default=False,
                         help='Analyze all available data.')
+    parser.add_argument('--all',
+                        action='store_true',
+                        help='Analyze all countries and US states found in '
+                             'the daily reports (replaces the lists).')
+    parser.add_argument('-t',
+                        '--time-series',
+                        action='store_true',
+                        help='Read countries from the JHU time-series files '
+                             'instead of the daily reports.')
+    parser.add_argument('--no-cache',
+                        action='store_true',
+                        help='Do not memoize monthly data (in process and in '
+                             'country_data/monthly_cache).')
+    parser.add_argument('-j',
+                        '--jobs',
+                        type=int,
+                        default=1,
+                        help='Number of processes analyzing geographies.')
+    parser.add_argument('-p',
+                        '--render-jobs',
+                        type=int,
+                        default=1,
+                        help='Number of background processes rendering '
+                             'plots; 0 renders inline.')
+    parser.add_argument('-f',
+                        '--force-render',
+                        action='store_true',
+                        help='Redraw all plots, even unchanged ones.')
+    parser.add_argument('-n',
+                        '--no-plots',
+                        action='store_true',
+                        help='Compute only: no plots, write a results bundle.')
+    parser.add_argument('-o',
+                        '--results',
+                        type=str,
+                        default=None,
+                        help='Results bundle path prefix (.json and .npz).')
+    parser.add_argument('--profile',
+                        type=str,
+                        default=None,
+                        help='Write stage timers and counters to a JSON file.')
+    parser.add_argument('--cprofile',
+                        action='store_true',
+                        help='Add a cProfile capture to the --profile report.')
+    parser.add_argument('--tracemalloc',
+                        action='store_true',
+                        help='Add a tracemalloc capture to the --profile report.')
+    parser.add_argument('-v',
+                        '--verbose',
+                        action='store_true',
+                        help='Log debug messages (eg. of each linear fit).')
+    parser.add_argument('-s',
+                        '--sqlite',
+                        type=str,
+                        default=None,
+                        help='SQLite file to store data and results in.')
     args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format="%(message)s")
+    instruments = instrument.get_instruments()
+    instruments.start_capture(profile=args.cprofile, memory=args.tracemalloc)
 
     # parse command line args
     download = False
     all_data = False
-    if not args.countries:
+    if not args.countries and not args.all:
         return
     if args.download_data:
         download = True
@@ -1188,164 +1369,206 @@ def main():
         raise ValueError("You must supply either --all-data or --month")
 
     # get countries or regions (states)
-    countries = _get_geography(args.countries)
-    if not args.regions:
-        regions = []
+    if args.all:
+        with instrument.timer("discovery"):
+            countries, regions = discover_geographies(months[-1])
+        print("Found {} countries and {} US states".format(len(countries),
+                                                            len(regions)))
     else:
-        regions = _get_geography(args.regions)
+        countries = _get_geography(args.countries)
+        if not args.regions:
+            regions = []
+        else:
+            regions = _get_geography(args.regions)
 
-    # write summary files
+    # summary tables are buffered and written at the end of the run
     today_date = datetime.today().strftime('%m-%d-%Y')
     today_day = today_date.split("-")[1]
     today_month = today_date.split("-")[0]
-    header = "Country,country-name,cases,deaths,case rate,death rate," + \
-             "doubling cases (days),doubling deaths (days)," + \
-             "pct pop 0.5% mort,prct pop 1% mort,prct pop 2% " +  \
-             "mort,0.5% mort sim cases,1% mort sim cases," + \
-             "2% mort sim cases," + \
-             "prct rep cases 0.5% mort,prct rep cases 1% mort," + \
-             "prct rep cases 2% mort," + \
-             "pct pop 0.5% mort (10d),prct pop 1% mort (10d),prct pop 2% (10d)," +  \
-             "pct pop 0.5% mort (20d),prct pop 1% mort (20d),prct pop 2% (20d) "
+    if args.month:
+        today_month = "0{}".format(args.month)
+    table_date = "{}-{}-2020".format(today_day, today_month)
+    # the history, ensemble and store key the table rows by its date
+    table_iso = "2020-{}-{}".format(today_month, today_day)
     table_file = \
-        "country_tables/ALL_COUNTRIES_DATA_{}-0{}-2020.csv".format(today_day,
-                                                                   args.month)
-    with open(table_file, "w") as file:
-        file.write(header + "\n")
-
-    # write pointer file
-    raw_date = "date={}-0{}-2020".format(today_day, args.month)
-    raw_content = "url=https://raw.githubusercontent.com/" + \
-                  "valeriupredoi/" + \
-                  "COVID-19_LINEAR/master/country_tables/" + \
-                  "ALL_COUNTRIES_DATA_{}-0{}-2020.csv".format(today_day,
-                                                              args.month)
-    # write inc file pointing to most recent data file
-    raw_file = "country_tables/currentdata.inc"
-    with open(raw_file, "w") as file:
-        file.write(raw_date + '\n' + raw_content)
-
-    # write countriles with doubling time > 14
-    with open("country_tables/countries_with_case_doubling-time_larger_14days.csv", "w") as file:
-        file.write("Country,doubling time (days)\n")
-
-    # plot other countries
-    double_time = []
-    basic_rep = []
-    lin_fit_quality = []
+        "country_tables/ALL_COUNTRIES_DATA_{}.csv".format(table_date)
+    writer = results_writer.ResultsWriter(table_file)
+
+    # monthly data is memoized unless asked not to
+    if args.no_cache:
+        monthly_cache.set_monthly_cache(None)
+
+    # optional SQLite store for raw data and results
+    store = None
+    if args.sqlite:
+        from cov_model.datafinder import sqlite_store
+        store = sqlite_store.SQLiteStore(args.sqlite)
+
+    # load results history of previous runs
+    history = results_history.load_history()
+
+    # render figures inline or in a separate pool of processes;
+    # figures whose data and text did not change are not redrawn
+    if args.no_plots:
+        renderer = render.NullRenderer()
+    else:
+        cache = None
+        if not args.force_render:
+            cache = render.RenderCache()
+        renderer = render.Renderer(args.render_jobs, cache=cache)
+    render.set_renderer(renderer)
+
+    # optional time-series backend: three files for all countries
+    series = None
+    if args.time_series:
+        from cov_model.datafinder import time_series
+        with instrument.timer("load data"):
+            series = time_series.TimeSeriesCube.load()
+
+    # get data for each country, then each region (state)
+    tasks = [(country, False) for country in countries]
+    tasks.extend((region, True) for region in regions)
+    datasets = []
+    prev_month_deaths = []
+    with instrument.timer("load data"):
+        for geography, region in tasks:
+            monthly_numbers, prev_deaths = load_geography(geography, region,
+                                                          months, store,
+                                                          series=series)
+            datasets.append(monthly_numbers)
+            prev_month_deaths.append(prev_deaths)
+    if args.all:
+        # discovered geographies need enough days with cases to be fitted
+        keep = [idx for idx, (geography, _) in enumerate(tasks)
+                if geography == "UK" or
+                np.sum(datasets[idx][0] > 0.) >= MIN_FIT_DAYS]
+        for idx in sorted(set(range(len(tasks))) - set(keep)):
+            print("Skipping {}: too few days with cases".format(tasks[idx][0]))
+        tasks = [tasks[idx] for idx in keep]
+        datasets = [datasets[idx] for idx in keep]
+        prev_month_deaths = [prev_month_deaths[idx] for idx in keep]
+
+    fits = []
     nums_cases = {}
+    padded_cases = {}
     nums_deaths = {}
     all_nums_deaths = {}
     death_rates = {}
-    all_nums_cases_dt = {}
-
-    # run for each country
-    for country in countries:
-        print("Analyzing {} ...".format(country))
-        cases, deaths, recs, times = [], [], [], []
-        for month in months:
-            monthly_numbers_i = get_monthly_countries_data(country,
-                                                           month,
-                                                           region=False)
-            if len(months) == 1:
-                monthly_numbers_prev_month = get_monthly_countries_data(
-                    country,
-                    month - 1,
-                    region=False)
-
-            cases.extend(monthly_numbers_i[0])
-            deaths.extend(monthly_numbers_i[1])
-            recs.extend(monthly_numbers_i[2])
-            times.extend(monthly_numbers_i[3])
-
-        monthly_numbers = (cases, deaths, recs, times)
-
-        # get the evolution parameters
-        d_time, R0, lin_fit, nums = plot_countries(monthly_numbers,
-                                                   months, country,
-                                                   table_file,
-                                                   download)
-        double_time.extend(d_time)
-        basic_rep.extend(R0)
-        lin_fit_quality.extend(lin_fit)
-        nums_cases[country] = nums[0]
-        nums_deaths[country] = nums[1]
-        all_nums_deaths[country] = nums[1]
-        if len(months) == 1:
-            prev_month_deaths = [
-                float(s) for s in monthly_numbers_prev_month[1] if s != 'NN'
-            ]
-            all_nums_deaths[country] = np.hstack((all_nums_deaths[country],
-                                                  prev_month_deaths))
-
-        # get data from all countries files
-        cases_dt = []
-        deaths_dt = []
-        c_deaths = []
-        c_rates = []
-        for m in months[1:]:
-            if m == 4:
-                mth = '04'
-                current_range = range(4, 31)
-                l_apr = len(current_range)
-            elif m == 5:
-                mth = '05'
-                current_range = range(1, int(today_day) + 1)
-                l_may = len(current_range)
-            for d in current_range:
-                if d < 10:
-                    dat_file = "country_tables/ALL_COUNTRIES_DATA_0{}-{}-2020.csv".format(d, mth)
-                else:
-                    dat_file = "country_tables/ALL_COUNTRIES_DATA_{}-{}-2020.csv".format(d, mth)
-                with open(dat_file, "r") as file:
-                    content = file.readlines()
-                    for line in content:
-                        if line.split(",")[1] == country:
-                            cases_dt.append(line.split(",")[6])
-                            deaths_dt.append(line.split(",")[7])
-                            c_deaths.append(line.split(",")[3])
-                            c_rates.append(line.split(",")[5])
-        tot_l = l_apr + l_may
-        if len(cases_dt) == tot_l - 1:
-            current_range = range(4, 31)
-            may = [31 + x for x in range(0, int(today_day) - 1)]
-            current_range.extend(may)
-            print("Analyzing cases dubling times count {} with data points {}".format(str(len(cases_dt)), str(len(current_range))))
-            plot_doubling(cases_dt, deaths_dt, current_range, country)
-            all_nums_cases_dt[country] = cases_dt
-        if len(c_deaths) == len(c_rates):
-            death_rates[country] = (c_deaths, c_rates)
-                
-    if regions:
-        for region in regions:
-            print("Analyzing {} ...".format(region))
-            cases, deaths, recs, times = [], [], [], []
-            for month in months:
-                monthly_numbers_i = get_monthly_countries_data(region,
-                                                               month,
-                                                               region=True)
-                cases.extend(monthly_numbers_i[0])
-                deaths.extend(monthly_numbers_i[1])
-                recs.extend(monthly_numbers_i[2])
-                times.extend(monthly_numbers_i[3])
-
-            monthly_numbers = (cases, deaths, recs, times)
-
-            # get the evolution parameters
-            d_timeR, R0R, lin_fitR, nums = plot_countries(monthly_numbers,
-                                                          months, region,
-                                                          table_file,
-                                                          download=False)
-            double_time.extend(d_timeR)
-            basic_rep.extend(R0R)
-            lin_fit_quality.extend(lin_fitR)
+    today_iso = datetime.today().strftime("%Y-%m-%d")
+    run_results = results_bundle.RunResults(today_iso, months)
+    analysis_start = time.time()
+
+    # analyze: in a process pool the data is published in shared memory;
+    # the block is freed even if a worker fails
+    pool = cube = None
+    try:
+        if args.jobs > 1:
+            from cov_model.datafinder import shared_cube
+            cube = shared_cube.SharedCube.publish(
+                [geo for geo, _ in tasks], [reg for _, reg in tasks],
+                datasets, shared_cube.fit_days(months))
+            pool = multiprocessing.Pool(args.jobs,
+                                        initializer=_init_worker,
+                                        initargs=(history, not args.no_plots))
+            results = pool.imap(_analyze_task,
+                                [(idx, cube.spec, months, download)
+                                 for idx in range(len(tasks))],
+                                chunksize=1)
+        else:
+            results = (analyze_geography(geography, region, datasets[idx],
+                                         months, download, history)
+                       for idx, (geography, region) in enumerate(tasks))
+
+        # merge results in input order, whichever worker finished first
+        for idx, result in enumerate(results):
+            if result.instruments is not None:
+                instruments.merge(result.instruments)
+            if args.jobs > 1:
+                result.fit, result.cases, result.deaths = cube.read_fit(idx)
+            writer.merge(result.writer, idx)
+            for path, calls in result.plots:
+                renderer.submit(path, calls)
+            fits.append(result.fit)
+            run_results.add_geography(result.geography, result.region,
+                                      result.fit["doubling_time"],
+                                      result.fit["reproductive_number"],
+                                      result.fit["fit_quality"],
+                                      result.cases, result.deaths)
+            if result.region:
+                continue
+            add_aligned_series(run_results, result)
+            nums_cases[result.geography] = result.cases
+            padded_cases[result.geography] = result.padded_cases
+            nums_deaths[result.geography] = result.deaths
+            all_nums_deaths[result.geography] = np.hstack(
+                (result.deaths, prev_month_deaths[idx]))
+            if len(months) > 1:
+                _, c_deaths = _history_range(history, result.geography,
+                                             "deaths")
+                _, c_rates = _history_range(history, result.geography,
+                                            "death rate")
+                if len(c_deaths):
+                    death_rates[result.geography] = (c_deaths, c_rates)
+        if pool is not None:
+            pool.close()
+            pool.join()
+    finally:
+        if pool is not None:
+            pool.terminate()
+        if cube is not None:
+            cube.close()
+    instruments.add_time("analysis", time.time() - analysis_start)
+
+    # scalar fit numbers of all geographies
+    fit_table = fit_records.fit_table([geo for geo, _ in tasks],
+                                      [reg for _, reg in tasks], fits)
+    run_results.fit_table = fit_table
+    double_time = fit_table["doubling_time"]
+    basic_rep = fit_table["reproductive_number"]
+    lin_fit_quality = fit_table["fit_quality"]
+
+    # rolling statistics of deaths shared by the bundle and the plots
+    nums_deaths_uk = uk_official_deaths(all_nums_deaths)
+    death_stats = rolling_deaths(nums_deaths_uk)
+
+    with instrument.timer("tables"):
+        # write tables and pointer file pointing to most recent data file
+        writer.commit(pointer_date=table_date)
+
+        # add the table to the results history, keyed by its date
+        history.add_rows(table_iso, writer.header, writer.rows)
+        history.write()
+
+        # ensemble statistics (moments, histograms) of this run
+        record_ensemble(table_iso, double_time, basic_rep, lin_fit_quality)
+        if store is not None:
+            store.insert_results(table_iso, writer.header, writer.rows)
+            store.close()
+
+        # machine-readable results bundle
+        run_results.add_rows(writer.header, writer.rows)
+        results_prefix = args.results
+        if args.no_plots and results_prefix is None:
+            results_prefix = results_bundle.RESULTS_PREFIX.format(today_iso)
+        if results_prefix is not None:
+            add_rt_series(run_results, padded_cases)
+            add_rolling_series(run_results, death_stats)
+            run_results.write(results_prefix)
 
     # plot viral parameters and various ensemble plots
-    plot_parameters(double_time, basic_rep, lin_fit_quality, len(countries))
-    ks.kstest(nums_cases, nums_deaths)
-    plot_rolling_average(all_nums_deaths)
-    plot_R(all_nums_cases_dt)
-    plot_death_extrapolation(death_rates)
+    if not args.no_plots:
+        with instrument.timer("ensemble analysis"):
+            plot_parameters(double_time, basic_rep, lin_fit_quality,
+                            len(countries))
+            ks.kstest(nums_cases, nums_deaths)
+            plot_rolling_average(nums_deaths_uk, death_stats)
+            plot_R(padded_cases)
+            plot_death_extrapolation(death_rates)
+        with instrument.timer("render wait"):
+            renderer.finish()
+
+    if args.profile:
+        instruments.write(args.profile)
 
 
 if __name__ == '__main__':
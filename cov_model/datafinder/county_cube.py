@@ -0,0 +1,177 @@
+"""
+US county (FIPS) x day data cube.
+
+Since 23 March 2020 the JHU daily reports hold one row per US county,
+keyed by its FIPS code. The county rows of each daily report are summed
+per FIPS code (see datafinder.rollup) and kept in a compact cube: an
+integer FIPS index, county and state names and float32 cumulative cases
+and deaths (county x day), stored in one .npz file. Only days missing
+from the cube are read on later runs.
+"""
+import csv
+import io
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+
+try:
+    from urllib.request import urlretrieve
+except ImportError:  # python 2
+    from urllib import urlretrieve
+
+from cov_model import instrument
+from cov_model.datafinder.data_finder import JOHN_HOPKINS
+from cov_model.datafinder.results_history import atomic_write
+from cov_model.datafinder.rollup import (NEW_SCHEMA, group_sums,
+    parse_numbers)
+
+
+COUNTY_CUBE_FILE = "country_data/US_counties.npz"
+COUNTY_DATA_DIR = "country_data/US_counties_monthly_{}"
+
+# first daily report with county rows
+FIRST_COUNTY_DAY = datetime(2020, 3, 23)
+
+FIPS_COL = 0
+
+
+class CountyCube(object):
+    """Cumulative cases and deaths of US counties (FIPS x day)."""
+
+    def __init__(self, fips=None, names=None, states=None, dates=None,
+                 cases=None, deaths=None):
+        self.fips = np.zeros(0, dtype=np.int32) if fips is None else fips
+        self.names = np.zeros(0, dtype=str) if names is None else names
+        self.states = np.zeros(0, dtype=str) if states is None else states
+        self.dates = np.zeros(0, dtype="datetime64[D]") \
+            if dates is None else dates
+        shape = (len(self.fips), len(self.dates))
+        self.cases = np.zeros(shape, dtype=np.float32) \
+            if cases is None else cases
+        self.deaths = np.zeros(shape, dtype=np.float32) \
+            if deaths is None else deaths
+        # daily reports read into the cube, removed once it is saved
+        self._read_files = []
+
+    @classmethod
+    def load(cls, path=COUNTY_CUBE_FILE):
+        """Load the cube; an empty one if there is no file yet."""
+        if not os.path.isfile(path):
+            return cls()
+        with np.load(path) as arrays:
+            return cls(**{name: arrays[name] for name in arrays.files})
+
+    def save(self, path=COUNTY_CUBE_FILE):
+        """
+        Atomically write the cube to an .npz file.
+
+        The daily reports read into the cube are removed only then, so
+        an interrupted update reads them again on the next run.
+        """
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, fips=self.fips, names=self.names,
+                            states=self.states, dates=self.dates,
+                            cases=self.cases, deaths=self.deaths)
+        atomic_write(path, buffer.getvalue())
+        for fullpath_file in self._read_files:
+            if os.path.isfile(fullpath_file):
+                os.remove(fullpath_file)
+        self._read_files = []
+
+    def has_day(self, day):
+        """Check if the report of day (datetime) is in the cube."""
+        return np.datetime64(day.strftime("%Y-%m-%d"), "D") in self.dates
+
+    def add_report(self, day, rows):
+        """Add the county rows of the daily report of day (datetime)."""
+        country_col, province_col, admin2_col = NEW_SCHEMA[:3]
+        cases_col, deaths_col = NEW_SCHEMA[4:6]
+        # US rows with a FIPS code (the header has none)
+        rows = [row for row in rows
+                if len(row) > deaths_col and row[country_col] == "US"]
+        fips = parse_numbers([row[FIPS_COL] for row in rows])
+        keep = np.flatnonzero(~np.isnan(fips))
+        fips = fips[keep].astype(np.int32)
+        numbers = np.array([
+            parse_numbers([rows[idx][col] for idx in keep])
+            for col in (cases_col, deaths_col)]).reshape(2, len(keep))
+
+        # sum the rows of each FIPS code
+        order = np.argsort(fips, kind="stable")
+        fips = fips[order]
+        starts = np.flatnonzero(np.r_[True, fips[1:] != fips[:-1]]) \
+            if len(fips) else np.zeros(0, dtype=int)
+        sums = group_sums(numbers[:, order], starts) \
+            if len(fips) else np.zeros((2, 0))
+        first = keep[order[starts]]
+        day_fips = fips[starts]
+
+        # new counties get rows, the day gets a column (in date order)
+        all_fips = np.union1d(self.fips, day_fips).astype(np.int32)
+        if len(all_fips) > len(self.fips):
+            rows_at = np.searchsorted(all_fips, self.fips)
+            new_at = np.searchsorted(all_fips, day_fips)
+            names = np.zeros(len(all_fips), dtype=object)
+            states = np.zeros(len(all_fips), dtype=object)
+            names[new_at] = [rows[idx][admin2_col] for idx in first]
+            states[new_at] = [rows[idx][province_col] for idx in first]
+            names[rows_at] = self.names
+            states[rows_at] = self.states
+            self.names = names.astype(str)
+            self.states = states.astype(str)
+            for field in ("cases", "deaths"):
+                grown = np.full((len(all_fips), len(self.dates)), np.nan,
+                                dtype=np.float32)
+                grown[rows_at] = getattr(self, field)
+                setattr(self, field, grown)
+            self.fips = all_fips
+        date = np.datetime64(day.strftime("%Y-%m-%d"), "D")
+        col = np.searchsorted(self.dates, date)
+        self.dates = np.insert(self.dates, col, date)
+        rows_at = np.searchsorted(self.fips, day_fips)
+        for field, values in zip(("cases", "deaths"), sums):
+            column = np.full(len(self.fips), np.nan, dtype=np.float32)
+            column[rows_at] = values
+            setattr(self, field, np.insert(getattr(self, field), col,
+                                           column, axis=1))
+
+    def update(self, end_day, fetch=True):
+        """
+        Add the daily reports from 23 March up to (excluding) end_day.
+
+        Reports are downloaded if needed (fetch=False: days without a
+        local report are skipped) and removed once the cube is saved.
+        """
+        day = FIRST_COUNTY_DAY
+        while day < end_day:
+            if not self.has_day(day):
+                self._add_report_file(day, fetch)
+            day += timedelta(days=1)
+
+    def _add_report_file(self, day, fetch):
+        """Read (or download) the report of a day into the cube."""
+        file_name = day.strftime("%m-%d-2020.csv")
+        data_dir = COUNTY_DATA_DIR.format(day.strftime("%m"))
+        if not os.path.isdir(data_dir):
+            os.makedirs(data_dir)
+        fullpath_file = os.path.join(data_dir, file_name)
+        if not os.path.isfile(fullpath_file):
+            if not fetch:
+                return
+            url = os.path.join(JOHN_HOPKINS, file_name)
+            with instrument.timer("download"):
+                urlretrieve(url, fullpath_file)
+            instrument.count("files downloaded")
+
+        instrument.count("files opened")
+        instrument.count("bytes read", os.path.getsize(fullpath_file))
+        with open(fullpath_file, "r") as csv_file:
+            reader = csv.reader(csv_file, delimiter=',', quotechar='"')
+            with instrument.timer("csv parse"):
+                data_read = [row for row in reader]
+            instrument.count("rows parsed", len(data_read))
+        with instrument.timer("rollup"):
+            self.add_report(day, data_read)
+        # the cube keeps the numbers once saved
+        self._read_files.append(fullpath_file)
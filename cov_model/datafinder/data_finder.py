@@ -1,49 +1,59 @@
 """
 Data finding module.
 """
+import calendar
 import os
 import csv
 from datetime import datetime
 import os
 import numpy as np
-import urllib
-from xlrd import open_workbook
+
+try:
+    from urllib.request import urlretrieve
+except ImportError:  # python 2
+    from urllib import urlretrieve
+
+from cov_model import instrument
+from cov_model.datafinder.monthly_cache import DATA_VERSION, get_monthly_cache
+from cov_model.datafinder.rollup import NEW_SCHEMA, OLD_SCHEMA, Rollup
 
 
 # data stores: governemental data
 UK_DAILY_CASES_DATA = "https://www.arcgis.com/sharing/rest/content/items/e5fd11150d274bebaaf8fe2a7a2bda11/data"
 UK_DAILY_DEATH_DATA = "https://www.arcgis.com/sharing/rest/content/items/bc8ee90225644ef7a6f4dd1b13ea1d67/data"
 
+# raw data, downloaded and cached reports
+DATA_DIR = "country_data"
+
+# official UK cumulative deaths, one line per day from 13 March 2020
+UK_DEATHS_HISTORY = os.path.join(DATA_DIR, "UK_deaths_history")
+UK_DEATHS_FIRST_DAY = "2020-03-13"
+
 # data stores: Johns Hopkins data
 JOHN_HOPKINS = "https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_daily_reports"
 
-# countries that need their data to be summed;
-# same for US states
-COUNTRIES_TO_SUM = ["US", "France", "Denmark", "Canada",
-                    "Georgia", "Kentucky",
-                    "Netherlands", "California", "New York"]
-
-def _sum_up(param, country):
-    """Get special csv param for US - summing is needed."""
-    if country not in COUNTRIES_TO_SUM:
-        param = param[0]
-    else:
-        if not len(set(param)) > 1:
-            param = param[0]
-        else:
-            if isinstance(param[0], float):
-                param = sum(param)
-            else:
-                param = param[0]
+# daily reports read whole to discover all geographies (kept)
+ALL_GEOGRAPHIES_DIR = "country_data/ALL_monthly_{}"
+
+# JHU report name: geography analyzed from official data instead
+OFFICIAL_DATA_NAMES = {"United Kingdom": "UK"}
 
-    return param
 
+def get_excel_data(url, country_table, table_name, column, download,
+                   data_dir=DATA_DIR, read_only=False):
+    """Retrive Excel sheet and parse; read_only: never download."""
+    # xlrd is only needed for the official UK data
+    from xlrd import open_workbook
 
-def get_excel_data(url, country_table, table_name, column, download):
-    """Retrive Excel sheet and parse."""
-    country_xls = "country_data/{}.xls".format(country_table)
+    country_xls = os.path.join(data_dir, "{}.xls".format(country_table))
     if not os.path.isfile(country_xls):  # or download - obsolete
-        urllib.urlretrieve(url, country_xls)
+        if read_only:
+            raise IOError("No {} in read-only mode".format(country_xls))
+        with instrument.timer("download"):
+            urlretrieve(url, country_xls)
+        instrument.count("files downloaded")
+    instrument.count("files opened")
+    instrument.count("bytes read", os.path.getsize(country_xls))
     book = open_workbook(country_xls, on_demand=True)
     sheet = [
         book.sheet_by_name(name) for name in book.sheet_names()
@@ -54,34 +64,41 @@ def get_excel_data(url, country_table, table_name, column, download):
     return cells
 
 
-def load_daily_deaths_history(month):
+def load_uk_deaths_history(path=UK_DEATHS_HISTORY):
+    """Load the official UK cumulative deaths (from UK_DEATHS_FIRST_DAY)."""
+    return np.loadtxt(path, dtype='float')
+
+
+def load_daily_deaths_history(month, data_dir=DATA_DIR):
     """Load previously written to disk deaths numbers."""
+    history = list(load_uk_deaths_history(
+        os.path.join(data_dir, os.path.basename(UK_DEATHS_HISTORY))))
     if month == 3:
-        deaths_list = \
-            list(np.loadtxt("country_data/UK_deaths_history", dtype='float'))[0:19]
+        deaths_list = history[0:19]
     elif month == 4:
-        deaths_list = \
-            list(np.loadtxt("country_data/UK_deaths_history", dtype='float'))[19:49]
+        deaths_list = history[19:49]
     elif month == 5:
-        deaths_list = \
-            list(np.loadtxt("country_data/UK_deaths_history", dtype='float'))[49:]
+        deaths_list = history[49:]
     return deaths_list
 
 
-def get_official_uk_data(month, download):
+def get_official_uk_data(month, download, data_dir=DATA_DIR,
+                         read_only=False):
     """Get the official UK data starting March 1st, 2020."""
     uk_cases_url = UK_DAILY_CASES_DATA
     cases_cells = get_excel_data(uk_cases_url, "UK_cases",
                                  "DailyConfirmedCases", 2,
-                                 download=download)
+                                 download=download, data_dir=data_dir,
+                                 read_only=read_only)
     uk_deaths_url = UK_DAILY_DEATH_DATA
     death_cells = get_excel_data(uk_deaths_url, "UK_deaths",
                                  "Sheet1", 3,
-                                 download=download)
+                                 download=download, data_dir=data_dir,
+                                 read_only=read_only)
 
     # data cells: cases and deaths
     # uk changed data to remove cases before March 1st (2-04-2020)
-    y_deaths_real = load_daily_deaths_history(month)
+    y_deaths_real = load_daily_deaths_history(month, data_dir)
     # append to file if new data for new monthly data
     #if month == 5:
     #    if death_cells[1:] not in y_deaths_real:
@@ -92,18 +109,18 @@ def get_official_uk_data(month, download):
     if month == 3:
         y_data_real = cases_cells[31:62]
         mort = np.array(y_deaths_real) / np.array(y_data_real[12:])
-        x_data = [np.float(x) for x in range(1, len(y_data_real) + 1)]
-        x_deaths = [np.float(x) for x in range(13, len(y_deaths_real) + 13)]
+        x_data = [float(x) for x in range(1, len(y_data_real) + 1)]
+        x_deaths = [float(x) for x in range(13, len(y_deaths_real) + 13)]
     elif month == 4:
         y_data_real = cases_cells[62:92]
         mort = np.array(y_deaths_real) / np.array(y_data_real)
-        x_data = [np.float(x) for x in range(1, len(y_data_real) + 1)]
-        x_deaths = [np.float(x) for x in range(1, len(y_deaths_real) + 1)]
+        x_data = [float(x) for x in range(1, len(y_data_real) + 1)]
+        x_deaths = [float(x) for x in range(1, len(y_deaths_real) + 1)]
     elif month == 5:
         y_data_real = cases_cells[92:]
         mort = np.array(y_deaths_real) / np.array(y_data_real)
-        x_data = [np.float(x) for x in range(1, len(y_data_real) + 1)]
-        x_deaths = [np.float(x) for x in range(1, len(y_deaths_real) + 1)]
+        x_data = [float(x) for x in range(1, len(y_data_real) + 1)]
+        x_deaths = [float(x) for x in range(1, len(y_deaths_real) + 1)]
 
     # compute average mortality
     avg_mort = np.mean(mort)
@@ -113,49 +130,14 @@ def get_official_uk_data(month, download):
         y_deaths_real, avg_mort, stdev_mort)
 
 
-def _extract_from_csv(data_object, country, param_idx,
-                      country_idx, numeric=False):
-    """
-    Extract and return the needed field from csv file.
-
-    Data before 23 March 2020 is in an old format:
-    sep/state country date cases deaths coord1 coord2
-    ,Belgium,2020-03-22T14:13:06,3401.0,75.0,263.0
-
-    JHU have changed the format from 23 March 2020 as:
-    FIPS Admin2 Province_State Country_Region Last_Update Lat Long_ Confirmed Deaths Recovered Active Combined_Key
-    53001,Adams,Washington,US,2020-03-23 23:19:34,46.98299757,-118.56017340000001,1,0,0,0,"Adams, Washington, US"
-    ,,,Belgium,2020-03-23 23:19:21,50.8333,4.469936,3743,88,401,3254,Belgium
-
-    """
-    if not numeric:
-        param = [
-            tab[param_idx] for tab in data_object if tab[country_idx] == country
-        ]
-    else:
-        param = [
-            tab[param_idx] for tab in data_object
-            if tab[country_idx] == country
-        ]
-        param = [float(p) for p in param if p != 'NN']
-
-    if not param:
-        param = 'NN'
-        return param
-
-    # list of specific data checks
-    param = _sum_up(param, country)
-
-    return param
-
-
 def _reformat_date(exp_dates):
     """Reformat dates to common format."""
     time_fmt = "%Y-%m-%dT%H:%M:%S"
     wrong_time_fmt = "%Y-%m-%d %H:%M:%S"
-    if exp_dates == 'NN':
-        return exp_dates
-    if exp_dates != 'NN' and not isinstance(exp_dates, list):
+    # missing: None; older cache files hold 'NN'
+    if exp_dates in (None, "", "NN"):
+        return None
+    if not isinstance(exp_dates, list):
         try:
             datetime.strptime(exp_dates, time_fmt)
         except ValueError:
@@ -166,7 +148,7 @@ def _reformat_date(exp_dates):
                 exp_dates = datetime.strptime(exp_dates,
                                               "%m/%d/20 %H:%M").strftime(time_fmt)
 
-    if exp_dates != 'NN' and isinstance(exp_dates, list):
+    if isinstance(exp_dates, list):
         try:
             datetime.strptime(exp_dates[0], time_fmt)
         except ValueError:
@@ -176,81 +158,72 @@ def _reformat_date(exp_dates):
     return exp_dates
 
 
-def _get_extracted(data_read, country, idx_pack, cidx):
-    """Get the extracted numbers depending on various data format indeces."""
-    # country data
-    # dates
-    exp_dates = _extract_from_csv(data_read, country, idx_pack[0], cidx)
-    exp_dates = _reformat_date(exp_dates)
-
-    # cases
-    count_cases = _extract_from_csv(data_read, country, idx_pack[1], cidx,
-                                    numeric=True)
-    # deaths
-    count_deaths = _extract_from_csv(data_read, country, idx_pack[2], cidx,
-                                     numeric=True)
-    # recoveries
-    count_rec = _extract_from_csv(data_read, country, idx_pack[3], cidx,
-                                  numeric=True)
-
-    return (exp_dates, count_cases, count_deaths, count_rec)
-
+def _get_daily_countries_data(date, country, region, data_dir=DATA_DIR,
+                              read_only=False):
+    """
+    Get all countries data via csv file reading.
 
-def _get_daily_countries_data(date, country, region):
-    """Get all countries data via csv file reading."""
+    read_only: missing reports are not downloaded (the day is missing)
+    and read reports are not rewritten.
+    """
     # date[0] = DAY(DD), date[1] = MONTH(MM)
     file_name = "{}-{}-2020.csv".format(date[1], date[0])
-    data_dir = os.path.join("country_data",
+    data_dir = os.path.join(data_dir,
                             "{}_monthly_{}".format(country, date[1]))
+    fullpath_file = os.path.join(data_dir, file_name)
+    if read_only and not os.path.isfile(fullpath_file):
+        return np.nan, np.nan, np.nan, None
     if not os.path.isdir(data_dir):
         os.makedirs(data_dir)
-    fullpath_file = os.path.join(data_dir, file_name)
     if not os.path.isfile(fullpath_file):
         url = os.path.join(JOHN_HOPKINS, file_name)
-        urllib.urlretrieve(url, fullpath_file)
+        with instrument.timer("download"):
+            urlretrieve(url, fullpath_file)
+        instrument.count("files downloaded")
 
     # file reading
+    instrument.count("files opened")
+    instrument.count("bytes read", os.path.getsize(fullpath_file))
     with open(fullpath_file, "r") as csv_file:
         reader = csv.reader(csv_file, delimiter=',', quotechar='"')
-        data_read = [row for row in reader]
-
-        # parse for both older JHU data format and newer
-        if date[1] == '03' and int(float(date[0])) < 23:
-            # geography index in file
-            cidx = 1
-            if region:
-                cidx = 0
-            idx_pack = [2, 3, 4, 5]
-            (exp_dates,
-             count_cases,
-             count_deaths,
-             count_rec) = _get_extracted(data_read, country, idx_pack, cidx)
-            country_data = ',' + ','.join([country, exp_dates,
+        with instrument.timer("csv parse"):
+            data_read = [row for row in reader]
+        instrument.count("rows parsed", len(data_read))
+
+        # parse for both older JHU data format and newer;
+        # sum all rows of the geography (provinces, counties)
+        old_format = date[1] == '03' and int(float(date[0])) < 23
+        with instrument.timer("rollup"):
+            rollup = Rollup(data_read, OLD_SCHEMA if old_format else NEW_SCHEMA)
+        (exp_dates,
+         count_cases,
+         count_deaths,
+         count_rec) = rollup.lookup(country,
+                                    "province" if region else "country")
+        exp_dates = _reformat_date(exp_dates)
+        exp_dates_field = exp_dates or ""
+        if old_format:
+            country_data = ',' + ','.join([country, exp_dates_field,
                                            str(count_cases),
                                            str(count_deaths), str(count_rec)])
             if region:
-                country_data = ','.join([country, "REGION",exp_dates,
+                country_data = ','.join([country, "REGION", exp_dates_field,
                                          str(count_cases),
                                          str(count_deaths), str(count_rec)])
         else:
-            # geography index in file
-            cidx = 3
-            if region:
-                cidx = 2
-            idx_pack = [4, 7, 8, 9]
-            (exp_dates,
-             count_cases,
-             count_deaths,
-             count_rec) = _get_extracted(data_read, country, idx_pack, cidx)
-            country_data = ',,,' + ','.join([country, exp_dates, "c1", "c2",
+            country_data = ',,,' + ','.join([country, exp_dates_field,
+                                             "c1", "c2",
                                              str(count_cases),
                                              str(count_deaths), str(count_rec)])
             if region:
-                country_data = ',,' + ','.join([country, "REGION",exp_dates,
+                country_data = ',,' + ','.join([country, "REGION",
+                                                exp_dates_field,
                                                 "c1", "c2",
                                                 str(count_cases),
                                                 str(count_deaths), str(count_rec)])
         csv_file.close()
+        if read_only:
+            return count_cases, count_deaths, count_rec, exp_dates
         os.remove(fullpath_file)
 
     # overwrite so to optimize disk use
@@ -260,8 +233,106 @@ def _get_daily_countries_data(date, country, region):
     return count_cases, count_deaths, count_rec, exp_dates
 
 
-def get_monthly_countries_data(country, month, region):
-    """Assemble monthly data per country."""
+def last_report_day(month):
+    """Get the last day of month read by the monthly data assembly."""
+    if month == 3:
+        return 31
+    if month == 4:
+        return 30
+    return max(datetime.today().day - 1, 1)
+
+
+def discover_geographies(month):
+    """
+    Get all countries and US states with cases in the last report of month.
+
+    The report is read whole (and downloaded if needed); country names
+    are the ones of the report, except for those analyzed from official
+    data (see OFFICIAL_DATA_NAMES).
+    """
+    date_object = datetime(day=last_report_day(month), month=month,
+                           year=2020)
+    file_name = date_object.strftime("%m-%d-2020.csv")
+    data_dir = ALL_GEOGRAPHIES_DIR.format(date_object.strftime("%m"))
+    if not os.path.isdir(data_dir):
+        os.makedirs(data_dir)
+    fullpath_file = os.path.join(data_dir, file_name)
+    if not os.path.isfile(fullpath_file):
+        url = os.path.join(JOHN_HOPKINS, file_name)
+        with instrument.timer("download"):
+            urlretrieve(url, fullpath_file)
+        instrument.count("files downloaded")
+
+    instrument.count("files opened")
+    instrument.count("bytes read", os.path.getsize(fullpath_file))
+    with open(fullpath_file, "r") as csv_file:
+        reader = csv.reader(csv_file, delimiter=',', quotechar='"')
+        with instrument.timer("csv parse"):
+            data_read = [row for row in reader]
+        instrument.count("rows parsed", len(data_read))
+    old_format = month == 3 and date_object.day < 23
+    with instrument.timer("rollup"):
+        rollup = Rollup(data_read, OLD_SCHEMA if old_format else NEW_SCHEMA)
+
+    keys, _, sums = rollup.table("country")
+    countries = sorted(set(
+        OFFICIAL_DATA_NAMES.get(key[0], key[0])
+        for key, cases in zip(keys, sums[0]) if cases > 0.))
+    keys, _, sums = rollup.table("province")
+    states = sorted(key[1] for key, cases in zip(keys, sums[0])
+                    if key[0] == "US" and key[1] and cases > 0.)
+
+    return countries, states
+
+
+def month_closed(month):
+    """Check if all days of month are read (its data cannot change)."""
+    return last_report_day(month) == calendar.monthrange(2020, month)[1]
+
+
+def get_monthly_countries_data(country, month, region, store=None,
+                               fetch=True, data_dir=DATA_DIR,
+                               read_only=False):
+    """
+    Assemble monthly data per country.
+
+    If a store (SQLiteStore, MemoryStore) is given, days already in the
+    store are read from it and newly parsed days with data are bulk
+    inserted into it. With fetch=False days missing from the store are
+    not downloaded or read from data_dir, they are missing.
+
+    Without a store, monthly data is memoized by the active monthly
+    cache (see datafinder.monthly_cache): in process and, for closed
+    months, on disk. With read_only nothing is written: reports missing
+    from data_dir are not downloaded, read reports are not rewritten
+    and the cache is not stored on disk.
+
+    Returns float arrays of cases, deaths and recoveries (NaN where
+    missing) and a datetime64 array of report update times (NaT where
+    missing).
+    """
+    cache = get_monthly_cache()
+    if store is not None or not fetch or cache is None:
+        return _read_monthly_countries_data(country, month, region, store,
+                                            fetch, data_dir, read_only)
+    closed = month_closed(month) and not read_only
+    key = (country, bool(region), month, last_report_day(month),
+           DATA_VERSION)
+    if data_dir != DATA_DIR:
+        key += (data_dir, )
+    numbers = cache.get(key, closed)
+    if numbers is None:
+        numbers = _read_monthly_countries_data(country, month, region,
+                                               store, fetch, data_dir,
+                                               read_only)
+        cache.add(key, numbers, closed)
+
+    return numbers
+
+
+def _read_monthly_countries_data(country, month, region, store, fetch,
+                                 data_dir=DATA_DIR, read_only=False):
+    """Read monthly data from the daily reports (or the store)."""
     m_cases = []
     m_deaths = []
     m_rec = []
@@ -276,16 +347,45 @@ def get_monthly_countries_data(country, month, region):
         today_day = '32'  # grab all March (it's done)
     if month == 4:
         today_day = '31'  # grab all April (it's done)
+
+    stored = {}
+    if store is not None:
+        stored = {
+            row[0]: row[1:] for row in store.get_observations(
+                country, region,
+                "2020-{:02d}-01".format(month), "2020-{:02d}-32".format(month))
+        }
+    new_rows = []
     for day in range(1, int(float(today_day))):
         date_object = datetime(day=day,
                                month=month,
-                               year=2020).strftime('%d-%m-%Y')
-        date = (date_object.split("-")[0], date_object.split("-")[1])
-        month_cases, month_deaths, month_rec, exp_dates = \
-            _get_daily_countries_data(date, country, region)
+                               year=2020)
+        iso_date = date_object.strftime('%Y-%m-%d')
+        if iso_date in stored:
+            exp_dates, month_cases, month_deaths, month_rec = stored[iso_date]
+        elif not fetch:
+            exp_dates = None
+            month_cases = month_deaths = month_rec = np.nan
+        else:
+            date_object = date_object.strftime('%d-%m-%Y')
+            date = (date_object.split("-")[0], date_object.split("-")[1])
+            month_cases, month_deaths, month_rec, exp_dates = \
+                _get_daily_countries_data(date, country, region, data_dir,
+                                          read_only)
+            # days with no data (eg. not reported yet) are not stored,
+            # so later runs read them again
+            if exp_dates or not np.isnan([month_cases, month_deaths,
+                                          month_rec]).all():
+                new_rows.append((iso_date, exp_dates, month_cases,
+                                 month_deaths, month_rec))
         m_cases.append(month_cases)
         m_deaths.append(month_deaths)
         m_rec.append(month_rec)
         actual_dates.append(exp_dates)
 
-    return m_cases, m_deaths, m_rec, actual_dates
+    if store is not None and new_rows:
+        store.insert_observations(country, region, new_rows)
+
+    return (np.array(m_cases, dtype=float), np.array(m_deaths, dtype=float),
+            np.array(m_rec, dtype=float),
+            np.array(actual_dates, dtype="datetime64[s]"))
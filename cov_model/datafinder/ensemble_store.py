@@ -0,0 +1,180 @@
+"""
+Ensemble statistics of the run parameters, one record per run date.
+
+For each run date and parameter (cases doubling time, R0) the store
+keeps weighted running moments (Welford; the batches added in a run
+are merged with the parallel update of Chan et al.) and a fixed-bin
+histogram with under- and overflow bins. Records have a fixed size (a
+NumPy structured dtype) and are kept in one binary file: a new run date
+is appended at the end, a rerun on the same date replaces its record in
+place (its values are not counted twice), and records are
+read back memory-mapped and indexed by date, so historic ensemble
+distributions need no parsing.
+
+Usage
+=====
+>>> store = EnsembleStore()
+>>> store.add("2020-04-30", "doubling time", values, weights)
+>>> store.commit()
+>>> dates, means, stds = store.moments("doubling time")
+"""
+import os
+
+import numpy as np
+
+
+ENSEMBLE_FILE = "country_data/ensemble_statistics.bin"
+
+# parameter: (field name, lowest bin edge, highest bin edge, bins)
+PARAMETERS = [
+    ("doubling time", "doubling_time", 0., 50., 50),
+    ("R0", "R0", 0., 20., 80),
+]
+
+MOMENTS = [("count", "i8"), ("weight", "f8"), ("mean", "f8"), ("m2", "f8"),
+           ("min", "f8"), ("max", "f8")]
+
+
+def record_dtype(parameters=PARAMETERS):
+    """Get the record dtype: date and moments + histogram per parameter."""
+    fields = [("date", "M8[D]")]
+    for _, field, _, _, n_bins in parameters:
+        # histogram: underflow, n_bins bins, overflow
+        fields.append((field, MOMENTS + [("histogram", "f8", (n_bins + 2, ))]))
+
+    return np.dtype(fields)
+
+
+def bin_edges(parameter, parameters=PARAMETERS):
+    """Get the (inner) bin edges of a parameter histogram."""
+    for name, _, low, high, n_bins in parameters:
+        if name == parameter:
+            return np.linspace(low, high, n_bins + 1)
+    raise KeyError(parameter)
+
+
+def merge_moments(moments, values, weights):
+    """
+    Add weighted values to running moments (a record field) in place.
+
+    The batch moments are computed vectorized and merged in O(1):
+    mean += w_b / W * delta, M2 += M2_b + delta^2 * W_a * w_b / W.
+    """
+    weight = weights.sum()
+    if not len(values) or weight <= 0.:
+        return
+    mean = np.sum(weights * values) / weight
+    m2 = np.sum(weights * (values - mean) ** 2)
+    total = moments["weight"] + weight
+    delta = mean - moments["mean"]
+    moments["mean"] += delta * weight / total
+    moments["m2"] += m2 + delta ** 2 * moments["weight"] * weight / total
+    moments["weight"] = total
+    moments["count"] += len(values)
+    moments["min"] = min(moments["min"], values.min())
+    moments["max"] = max(moments["max"], values.max())
+
+
+class EnsembleStore(object):
+    """Fixed-size per run date records of ensemble statistics."""
+
+    def __init__(self, path=ENSEMBLE_FILE, parameters=PARAMETERS):
+        self.path = path
+        self.parameters = parameters
+        self.fields = {name: field for name, field, _, _, _ in parameters}
+        self.dtype = record_dtype(parameters)
+        self._pending = {}
+        self._load_index()
+
+    def _load_index(self):
+        """Map the records and index them by date."""
+        self.records = np.zeros(0, dtype=self.dtype)
+        n_records = 0
+        if os.path.isfile(self.path):
+            # a partly written last record (interrupted append) is ignored
+            n_records = os.path.getsize(self.path) // self.dtype.itemsize
+        if n_records:
+            self.records = np.memmap(self.path, dtype=self.dtype, mode="r",
+                                     shape=(n_records, ))
+        self.index = {str(date): idx
+                      for idx, date in enumerate(self.records["date"])}
+
+    def _new_record(self, date):
+        """Get an empty record for date."""
+        record = np.zeros(1, dtype=self.dtype)
+        record["date"] = np.datetime64(date, "D")
+        for field in self.fields.values():
+            record[field]["min"] = np.inf
+            record[field]["max"] = -np.inf
+
+        return record
+
+    def add(self, date, parameter, values, weights=None):
+        """
+        Add a batch of parameter values (optionally weighted) to date.
+
+        Non-finite values and non-positive weights are not counted.
+        """
+        values = np.asarray(values, dtype=float).ravel()
+        if weights is None:
+            weights = np.ones(len(values))
+        weights = np.asarray(weights, dtype=float).ravel()
+        keep = np.isfinite(values) & np.isfinite(weights) & (weights > 0.)
+        values, weights = values[keep], weights[keep]
+        date = str(np.datetime64(date, "D"))
+        if date not in self._pending:
+            self._pending[date] = self._new_record(date)
+        stats = self._pending[date][self.fields[parameter]]
+        merge_moments(stats[0], values, weights)
+        # fixed bins: index 0 underflow, last overflow
+        edges = bin_edges(parameter, self.parameters)
+        bins = np.searchsorted(edges, values, side="right")
+        bins[values == edges[-1]] = len(edges) - 1
+        np.add.at(stats["histogram"][0], bins, weights)
+
+    def commit(self):
+        """Write the records added: replace known dates, append new ones."""
+        if not self._pending:
+            return
+        dir_name = os.path.dirname(self.path) or "."
+        if not os.path.isdir(dir_name):
+            os.makedirs(dir_name)
+        known = dict(self.index)
+        # release the map before writing
+        self.records = None
+        mode = "r+b" if os.path.isfile(self.path) else "wb"
+        with open(self.path, mode) as file:
+            for date in sorted(self._pending):
+                record = self._pending[date]
+                if date not in known:
+                    known[date] = len(known)
+                file.seek(known[date] * self.dtype.itemsize)
+                file.write(record.tobytes())
+        self._pending = {}
+        self._load_index()
+
+    def record(self, date):
+        """Get the record of a run date (None if not stored)."""
+        idx = self.index.get(str(np.datetime64(date, "D")))
+        if idx is None:
+            return None
+
+        return self.records[idx]
+
+    def moments(self, parameter):
+        """Get dates, weighted means and standard deviations of all runs."""
+        stats = self.records[self.fields[parameter]]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            std = np.sqrt(stats["m2"] / stats["weight"])
+
+        return (np.array(self.records["date"]), np.array(stats["mean"]),
+                std)
+
+    def histogram(self, parameter, date):
+        """Get the bin edges and the weighted counts (under/overflow too)."""
+        record = self.record(date)
+        if record is None:
+            return None
+        counts = np.array(record[self.fields[parameter]]["histogram"])
+
+        return bin_edges(parameter, self.parameters), counts
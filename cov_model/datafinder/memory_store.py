@@ -0,0 +1,42 @@
+"""
+In-memory observations store.
+
+Same observations interface as the SQLiteStore, so it can be handed to
+the data finder and the library API wherever a store is accepted;
+nothing is read from or written to disk.
+"""
+
+
+class MemoryStore(object):
+    """Daily observations held in a dict keyed by (geography, region)."""
+
+    def __init__(self):
+        # (geography, region): {date: (update_time, cases, deaths, recovered)}
+        self._observations = {}
+
+    def close(self):
+        """Nothing to close."""
+
+    def insert_observations(self, geography, region, rows):
+        """Insert (date, update_time, cases, deaths, recovered) rows."""
+        records = self._observations.setdefault((geography, bool(region)), {})
+        for date, update_time, cases, deaths, recovered in rows:
+            records[date] = (update_time, cases, deaths, recovered)
+
+    def get_observations(self, geography, region, start, end):
+        """Get observation rows for dates (YYYY-MM-DD) in [start, end)."""
+        records = self._observations.get((geography, bool(region)), {})
+
+        return [(date, ) + records[date] for date in sorted(records)
+                if start <= date < end]
+
+    def observations_on(self, date):
+        """Get all geographies observed on date."""
+        return [(geography, int(region)) + records[date]
+                for (geography, region), records in
+                sorted(self._observations.items()) if date in records]
+
+    @property
+    def geographies(self):
+        """Get all (geography, region) in store."""
+        return sorted(self._observations)
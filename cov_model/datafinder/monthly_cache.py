@@ -0,0 +1,108 @@
+"""
+Memoization of the monthly data assembly.
+
+Monthly data (see data_finder.get_monthly_countries_data) is keyed by
+(geography, region, month, days read, data version) and kept in an
+in-process LRU, so repeated and overlapping requests (eg. the previous
+month of --month, the same geography in several analyses) are never
+read or parsed again in a run. Closed months, read whole, are
+immutable: they are also stored on disk, one .npz file per key, and
+later runs load them instead of walking the daily files. Bumping
+DATA_VERSION (eg. when parsing changes) invalidates all entries.
+"""
+import hashlib
+import os
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+
+from cov_model import instrument
+
+
+DATA_VERSION = 1
+MONTHLY_CACHE_DIR = "country_data/monthly_cache"
+MONTHLY_CACHE_SIZE = 512
+
+FIELDS = ("cases", "deaths", "recoveries", "times")
+
+
+def _copy(numbers):
+    """Copy the arrays so callers cannot change the cached ones."""
+    return tuple(np.array(values) for values in numbers)
+
+
+class MonthlyCache(object):
+    """In-process LRU of monthly data over an on-disk store of closed months."""
+
+    def __init__(self, cache_dir=MONTHLY_CACHE_DIR,
+                 max_entries=MONTHLY_CACHE_SIZE):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def _path(self, key):
+        """Get the on-disk file of a key."""
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+
+        return os.path.join(self.cache_dir, digest + ".npz")
+
+    def get(self, key, closed):
+        """Get cached monthly data of key or None."""
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            instrument.count("monthly cache hits")
+            return _copy(self._entries[key])
+        path = self._path(key)
+        if closed and os.path.isfile(path):
+            with np.load(path) as arrays:
+                numbers = tuple(arrays[field] for field in FIELDS)
+            instrument.count("monthly cache disk hits")
+            self._remember(key, numbers)
+            return _copy(numbers)
+        instrument.count("monthly cache misses")
+
+        return None
+
+    def add(self, key, numbers, closed):
+        """Cache monthly data; closed months are stored on disk too."""
+        self._remember(key, _copy(numbers))
+        if closed:
+            self._store(self._path(key), numbers)
+
+    def clear(self):
+        """Drop the in-process entries (the disk store is kept)."""
+        self._entries.clear()
+
+    def _remember(self, key, numbers):
+        """Add to the LRU, evicting the least recently used entries."""
+        self._entries[key] = numbers
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _store(self, path, numbers):
+        """Atomically write an entry to the disk store."""
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=".tmp_")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                np.savez(file, **dict(zip(FIELDS, numbers)))
+            os.rename(tmp_path, path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+
+_MONTHLY_CACHE = [MonthlyCache()]
+
+
+def get_monthly_cache():
+    """Get the active monthly cache (None: no memoization)."""
+    return _MONTHLY_CACHE[0]
+
+
+def set_monthly_cache(cache):
+    """Set the active monthly cache; None turns memoization off."""
+    _MONTHLY_CACHE[0] = cache
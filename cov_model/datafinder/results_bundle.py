@@ -0,0 +1,121 @@
+"""
+Machine-readable results bundle of a run.
+
+Per-geography fit numbers and summary table fields go to a JSON file,
+the numeric series (eg. fitted cases and deaths, Rt) and the table of
+scalar fit records of all geographies (see statsanalysis.fit_records)
+to an NPZ file next to it; both are written atomically.
+"""
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from cov_model.datafinder.results_history import atomic_write, COUNTRY_COLUMN
+
+
+RESULTS_PREFIX = "country_results/results_{}"
+
+# NPZ entry of the fit records table
+FIT_TABLE = "fit_table"
+
+
+def _to_json(value):
+    """Convert a fit number to a JSON value; NaN is null."""
+    if value is None:
+        return None
+    value = float(value)
+    if np.isnan(value) or np.isinf(value):
+        return None
+    return value
+
+
+class RunResults(object):
+    """Fit numbers, table fields and series of all analyzed geographies."""
+
+    def __init__(self, run_date, months):
+        self.run_date = run_date
+        self.months = list(months)
+        self.geographies = []
+        self.fits = {}
+        self.table = {}
+        self.arrays = {}
+        # structured array of the scalar fit records (or None)
+        self.fit_table = None
+
+    def add_geography(self, geography, region, doubling_time,
+                      reproductive_number, fit_quality,
+                      cases=None, deaths=None):
+        """Add the fit numbers and fitted series of a geography."""
+        if geography not in self.fits:
+            self.geographies.append(geography)
+        self.fits[geography] = {
+            "region": bool(region),
+            "doubling_time": _to_json(doubling_time),
+            "reproductive_number": _to_json(reproductive_number),
+            "fit_quality": _to_json(fit_quality)}
+        if cases is not None:
+            self.add_array("cases", geography, cases)
+        if deaths is not None:
+            self.add_array("deaths", geography, deaths)
+
+    def add_array(self, name, geography, values):
+        """Add a numeric series of a geography."""
+        self.arrays["{}/{}".format(name, geography)] = \
+            np.asarray(values, dtype=float)
+
+    def array(self, name, geography):
+        """Get a numeric series of a geography (None if missing)."""
+        return self.arrays.get("{}/{}".format(name, geography))
+
+    def add_rows(self, header, rows):
+        """Add summary table rows, keyed by their country name."""
+        country_idx = header.index(COUNTRY_COLUMN)
+        for row in rows:
+            if len(row) > country_idx:
+                self.table[row[country_idx]] = dict(zip(header, row))
+
+    def to_dict(self):
+        """Get the JSON metadata."""
+        return {"run_date": self.run_date,
+                "months": self.months,
+                "geographies": [dict(self.fits[geo], name=geo,
+                                     table=self.table.get(geo, {}))
+                                for geo in self.geographies],
+                "arrays": sorted(self.arrays)}
+
+    def write(self, prefix):
+        """Atomically write prefix.json and prefix.npz."""
+        dir_name = os.path.dirname(prefix) or "."
+        if not os.path.isdir(dir_name):
+            os.makedirs(dir_name)
+        fd, tmp_path = tempfile.mkstemp(dir=dir_name, prefix=".tmp_")
+        try:
+            arrays = dict(self.arrays)
+            if self.fit_table is not None:
+                arrays[FIT_TABLE] = self.fit_table
+            with os.fdopen(fd, "wb") as file:
+                np.savez_compressed(file, **arrays)
+            os.rename(tmp_path, prefix + ".npz")
+        except Exception:
+            os.remove(tmp_path)
+            raise
+        atomic_write(prefix + ".json", json.dumps(self.to_dict(), indent=1))
+
+    @classmethod
+    def load(cls, prefix):
+        """Load a bundle written by write()."""
+        with open(prefix + ".json", "r") as file:
+            content = json.load(file)
+        results = cls(content["run_date"], content["months"])
+        for geo in content["geographies"]:
+            name = geo.pop("name")
+            results.table[name] = geo.pop("table")
+            results.geographies.append(name)
+            results.fits[name] = geo
+        with np.load(prefix + ".npz") as arrays:
+            results.arrays = dict(arrays)
+        results.fit_table = results.arrays.pop(FIT_TABLE, None)
+
+        return results
@@ -0,0 +1,167 @@
+"""
+Consolidated history of the daily summary tables.
+
+All country_tables/ALL_COUNTRIES_DATA_DD-MM-YYYY.csv rows are kept in a
+single file indexed by (country, date), loaded once per run; historic
+values for a country are then array slices instead of a scan through
+every daily table.
+"""
+import csv
+import io
+import os
+import re
+import tempfile
+from datetime import datetime
+
+import numpy as np
+
+
+HISTORY_FILE = "country_tables/ALL_COUNTRIES_HISTORY.csv"
+TABLES_DIR = "country_tables"
+TABLE_PATTERN = re.compile(r"ALL_COUNTRIES_DATA_(\d{2}-\d{2}-\d{4})\.csv$")
+COUNTRY_COLUMN = "country-name"
+
+
+def atomic_write(path, content):
+    """Write text or bytes to a temporary file and rename it over path."""
+    dir_name = os.path.dirname(path) or "."
+    if not os.path.isdir(dir_name):
+        os.makedirs(dir_name)
+    fd, tmp_path = tempfile.mkstemp(dir=dir_name, prefix=".tmp_")
+    try:
+        with os.fdopen(fd, "wb" if isinstance(content, bytes) else "w") \
+                as file:
+            file.write(content)
+        os.rename(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+
+def csv_text(rows):
+    """Format rows as csv text; fields with commas or quotes are quoted."""
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(rows)
+
+    return buffer.getvalue()
+
+
+def _read_table(table_file):
+    """Read a summary table: stripped header and data rows."""
+    with open(table_file, "r") as file:
+        rows = [row for row in csv.reader(file) if row]
+    if not rows:
+        return [], []
+
+    return [col.strip() for col in rows[0]], rows[1:]
+
+
+class ResultsHistory(object):
+    """Summary table rows indexed by country and date."""
+
+    def __init__(self, columns=None):
+        self.columns = list(columns or [])
+        self._rows = {}
+        self._arrays = {}
+
+    def add_rows(self, date, header, rows):
+        """Add table rows for date (YYYY-MM-DD) given the table header."""
+        for col in header:
+            if col not in self.columns:
+                self.columns.append(col)
+        country_idx = header.index(COUNTRY_COLUMN)
+        for row in rows:
+            if len(row) <= country_idx:
+                continue
+            country = row[country_idx]
+            self._rows.setdefault(country, {})[date] = dict(zip(header, row))
+            self._arrays.pop(country, None)
+
+    def add_table(self, table_file, date=None):
+        """Add a daily summary table; date defaults to the one in its name."""
+        if date is None:
+            match = TABLE_PATTERN.search(table_file)
+            if not match:
+                return
+            date = datetime.strptime(match.group(1),
+                                     "%d-%m-%Y").strftime("%Y-%m-%d")
+        header, rows = _read_table(table_file)
+        if COUNTRY_COLUMN in header:
+            self.add_rows(date, header, rows)
+
+    @property
+    def countries(self):
+        """Get all countries in history."""
+        return sorted(self._rows)
+
+    def _country_arrays(self, country):
+        """Get sorted dates and numeric (date x column) values."""
+        if country not in self._arrays:
+            records = self._rows.get(country, {})
+            dates = sorted(records)
+            values = np.full((len(dates), len(self.columns)), np.nan)
+            for i, date in enumerate(dates):
+                for j, col in enumerate(self.columns):
+                    try:
+                        values[i, j] = float(records[date].get(col, ''))
+                    except ValueError:
+                        pass
+            self._arrays[country] = (np.array(dates, dtype="datetime64[D]"),
+                                     values)
+
+        return self._arrays[country]
+
+    def series(self, country, column, start=None, end=None):
+        """Get dates and values of column for country in [start, end)."""
+        dates, values = self._country_arrays(country)
+        mask = np.ones(len(dates), dtype=bool)
+        if start is not None:
+            mask &= dates >= np.datetime64(start, "D")
+        if end is not None:
+            mask &= dates < np.datetime64(end, "D")
+        if column not in self.columns:
+            return dates[mask], np.full(mask.sum(), np.nan)
+
+        return dates[mask], values[mask, self.columns.index(column)]
+
+    def to_csv(self):
+        """Serialise history as csv text."""
+        lines = [["date"] + self.columns]
+        for country in self.countries:
+            for date in sorted(self._rows[country]):
+                record = self._rows[country][date]
+                lines.append([date] + [record.get(col, '')
+                                       for col in self.columns])
+
+        return csv_text(lines)
+
+    def write(self, path=HISTORY_FILE):
+        """Atomically (over)write the history file."""
+        atomic_write(path, self.to_csv())
+
+
+def load_history(path=HISTORY_FILE, tables_dir=TABLES_DIR):
+    """
+    Load the results history once.
+
+    If there is no history file yet, build it from whatever daily
+    tables exist; missing or unreadable days are simply skipped.
+    """
+    history = ResultsHistory()
+    if os.path.isfile(path):
+        header, rows = _read_table(path)
+        by_date = {}
+        for row in rows:
+            by_date.setdefault(row[0], []).append(row[1:])
+        for date in sorted(by_date):
+            history.add_rows(date, header[1:], by_date[date])
+        return history
+
+    if os.path.isdir(tables_dir):
+        for table_name in sorted(os.listdir(tables_dir)):
+            try:
+                history.add_table(os.path.join(tables_dir, table_name))
+            except (IOError, OSError, ValueError):
+                continue
+
+    return history
@@ -0,0 +1,89 @@
+"""
+Buffered writer for the daily summary tables.
+
+Rows are kept in memory and serialised in one go at commit time via a
+temporary file and a rename, so a run that dies never leaves a half
+written table behind. Writers filled by worker processes are merged
+back in a deterministic order.
+"""
+from cov_model.datafinder.results_history import atomic_write, csv_text
+
+
+TABLE_HEADER = [
+    "Country", "country-name", "cases", "deaths", "case rate", "death rate",
+    "doubling cases (days)", "doubling deaths (days)",
+    "pct pop 0.5% mort", "prct pop 1% mort", "prct pop 2% mort",
+    "0.5% mort sim cases", "1% mort sim cases", "2% mort sim cases",
+    "prct rep cases 0.5% mort", "prct rep cases 1% mort",
+    "prct rep cases 2% mort",
+    "pct pop 0.5% mort (10d)", "prct pop 1% mort (10d)", "prct pop 2% (10d)",
+    "pct pop 0.5% mort (20d)", "prct pop 1% mort (20d)", "prct pop 2% (20d)",
+    "delay-adj mort (pct)", "delay-adj mort stdev (pct)"]
+SLOW_TABLE_FILE = \
+    "country_tables/countries_with_case_doubling-time_larger_14days.csv"
+SLOW_TABLE_HEADER = ["Country", "doubling time (days)"]
+POINTER_FILE = "country_tables/currentdata.inc"
+POINTER_URL = "https://raw.githubusercontent.com/valeriupredoi/" + \
+              "COVID-19_LINEAR/master/"
+
+
+class ResultsWriter(object):
+    """In-memory summary table rows, committed atomically."""
+
+    def __init__(self, table_file, header=None,
+                 slow_table_file=SLOW_TABLE_FILE):
+        self.table_file = table_file
+        self.header = list(header or TABLE_HEADER)
+        self.slow_table_file = slow_table_file
+        # (order key, fields)
+        self._rows = []
+        self._slow_rows = []
+
+    @property
+    def rows(self):
+        """Get table rows in commit order."""
+        return [fields for _, fields in
+                sorted(self._rows, key=lambda row: row[0])]
+
+    @property
+    def slow_rows(self):
+        """Get slow doubling rows in commit order."""
+        return [fields for _, fields in
+                sorted(self._slow_rows, key=lambda row: row[0])]
+
+    def add_row(self, fields):
+        """Add a summary table row (list of formatted fields)."""
+        self._rows.append(((len(self._rows), ), [str(f) for f in fields]))
+
+    def add_slow_row(self, country, doubling_time):
+        """Add a country with case doubling time larger than 14 days."""
+        self._slow_rows.append(((len(self._slow_rows), ),
+                                [country, str(doubling_time)]))
+
+    def merge(self, other, key):
+        """
+        Merge rows of another writer (eg. filled by a worker process).
+
+        Merged rows are ordered by key (eg. the geography's index in
+        the input list), then by their order in the other writer, so the
+        committed tables do not depend on when workers finish.
+        """
+        self._rows.extend(((key, ) + order, fields)
+                          for order, fields in other._rows)
+        self._slow_rows.extend(((key, ) + order, fields)
+                               for order, fields in other._slow_rows)
+
+    def commit(self, pointer_date=None):
+        """
+        Write both tables atomically, then the current data pointer.
+
+        The pointer file is only updated after the tables are in place.
+        """
+        atomic_write(self.table_file, csv_text([self.header] + self.rows))
+        atomic_write(self.slow_table_file,
+                     csv_text([SLOW_TABLE_HEADER] + self.slow_rows))
+
+        if pointer_date is not None:
+            pointer = "date={}\nurl={}{}".format(pointer_date, POINTER_URL,
+                                                 self.table_file)
+            atomic_write(POINTER_FILE, pointer)
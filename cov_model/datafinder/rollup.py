@@ -0,0 +1,126 @@
+"""
+Hierarchical roll-up of a JHU daily report.
+
+All rows of a report are grouped by country, (country, province) and
+(country, province, admin2) in one pass: the rows are sorted once by
+the three key columns and cases, deaths and recoveries are summed per
+group of each level with np.add.reduceat, for every country alike.
+Missing numbers (empty fields) are skipped; a group with no number at
+all is NaN. The update time of a group is that of its first row in the
+report.
+
+JHU report layouts (see datafinder.data_finder):
+
+    before 23 March 2020:
+    Province/State,Country/Region,Last Update,Confirmed,Deaths,Recovered,...
+    from 23 March 2020:
+    FIPS,Admin2,Province_State,Country_Region,Last_Update,Lat,Long_,Confirmed,Deaths,Recovered,...
+"""
+import numpy as np
+
+
+# column indices: (country, province, admin2, update time,
+#                  cases, deaths, recovered); admin2 is None if absent
+OLD_SCHEMA = (1, 0, None, 2, 3, 4, 5)
+NEW_SCHEMA = (3, 2, 1, 4, 7, 8, 9)
+
+# level: number of key columns (country, province, admin2)
+LEVELS = {"country": 1, "province": 2, "admin2": 3}
+
+# country column of the header rows
+HEADER_NAMES = ("Country/Region", "Country_Region")
+
+
+def parse_numbers(fields):
+    """Parse csv number fields to floats; empty, 'nan', 'NN' are NaN."""
+    fields = np.asarray(fields, dtype=str)
+    values = np.full(len(fields), np.nan)
+    present = (fields != "") & (fields != "NN")
+    try:
+        values[present] = fields[present].astype(float)
+    except ValueError:
+        # stray text in a number column: parse field by field
+        for idx in np.flatnonzero(present):
+            try:
+                values[idx] = float(fields[idx])
+            except ValueError:
+                pass
+
+    return values
+
+
+def group_sums(values, starts):
+    """Sum sorted values (rows) per group skipping NaN; NaN if no number."""
+    valid = ~np.isnan(values)
+    sums = np.add.reduceat(np.where(valid, values, 0.), starts, axis=-1)
+    sums[np.add.reduceat(valid, starts, axis=-1) == 0] = np.nan
+
+    return sums
+
+
+class Rollup(object):
+    """Report numbers summed at the country, province and admin2 levels."""
+
+    def __init__(self, rows, schema):
+        country_col, province_col, admin2_col, time_col = schema[:4]
+        n_cols = max(col for col in schema if col is not None) + 1
+        rows = [row for row in rows
+                if len(row) >= n_cols and row[country_col] not in HEADER_NAMES]
+        n_rows = len(rows)
+        columns = [np.array([row[col] for row in rows], dtype=str)
+                   if col is not None else np.full(n_rows, "")
+                   for col in (country_col, province_col, admin2_col)]
+        self.times = [row[time_col] for row in rows]
+        # (cases, deaths, recovered) x row
+        numbers = np.array([parse_numbers([row[col] for row in rows])
+                            for col in schema[4:]]).reshape(3, n_rows)
+
+        # one sort by (country, province, admin2); a group of a level
+        # starts where any of its key columns changes
+        order = np.lexsort(columns[::-1])
+        columns = [column[order] for column in columns]
+        numbers = numbers[:, order]
+        change = np.zeros(n_rows, dtype=bool)
+        change[:1] = True
+        # level: (keys (group x depth), first row of groups,
+        #         sums (3 x group))
+        self.levels = {}
+        for level, depth in sorted(LEVELS.items(), key=lambda item: item[1]):
+            column = columns[depth - 1]
+            change[1:] |= column[1:] != column[:-1]
+            starts = np.flatnonzero(change)
+            if not n_rows:
+                self.levels[level] = (np.zeros((0, depth), dtype=str),
+                                      starts, np.zeros((3, 0)))
+                continue
+            keys = np.stack([col[starts] for col in columns[:depth]], axis=1)
+            first = np.minimum.reduceat(order, starts)
+            sums = group_sums(numbers, starts)
+            self.levels[level] = (keys, first, sums)
+
+    def table(self, level):
+        """Get the keys, update times and (cases, deaths, recs) sums."""
+        keys, first, sums = self.levels[level]
+
+        return ([tuple(key) for key in keys.tolist()],
+                [self.times[row] for row in first], sums)
+
+    def lookup(self, name, level="country"):
+        """
+        Get (update time, cases, deaths, recovered) of a geography.
+
+        name is matched on the last key column of level (eg. a province
+        name at the province level, whatever its country); groups with
+        the same name are summed. Missing geographies get a None update
+        time and NaN numbers.
+        """
+        keys, first, sums = self.levels[level]
+        groups = np.flatnonzero(keys[:, -1] == name)
+        if not len(groups):
+            return None, np.nan, np.nan, np.nan
+        values = sums[:, groups]
+        totals = np.where(np.isnan(values).all(axis=1), np.nan,
+                          np.nansum(values, axis=1))
+        update_time = self.times[min(first[groups])]
+
+        return (update_time, ) + tuple(float(val) for val in totals)
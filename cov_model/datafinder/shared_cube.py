@@ -0,0 +1,172 @@
+"""
+Shared memory (geography x day) data cube for worker processes.
+
+The parent process publishes the cases, deaths and recoveries arrays,
+the report update times and the geography index once in a single shared
+memory block; workers attach to it by name and get NumPy views, and
+write their fit results into a preallocated structured array in the
+same block. Only the block name and layout travel between processes.
+"""
+import calendar
+import os
+import tempfile
+
+import numpy as np
+
+from cov_model.statsanalysis import fit_records
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # python < 3.8: file-backed memory map
+    shared_memory = None
+
+
+# scalar fit results per geography, filled by the workers
+FIT_DTYPE = np.dtype(fit_records.FIT_DTYPE.descr +
+                     [("n_cases", "i4"), ("n_deaths", "i4")])
+
+ALIGNMENT = 64
+
+
+def fit_days(months, year=2020):
+    """Get the number of days of months: the longest fitted series."""
+    return sum(calendar.monthrange(year, month)[1] for month in months)
+
+
+def _layout(n_geographies, n_days, name_length, n_fit_days):
+    """Get field: (dtype, shape, offset) and the total block size."""
+    fields = [("cases", "f8", (n_geographies, n_days)),
+              ("deaths", "f8", (n_geographies, n_days)),
+              ("recoveries", "f8", (n_geographies, n_days)),
+              ("times", "M8[s]", (n_geographies, n_days)),
+              ("geographies", "U{}".format(name_length), (n_geographies, )),
+              ("regions", "?", (n_geographies, )),
+              ("results", FIT_DTYPE.descr, (n_geographies, )),
+              ("fit_cases", "f8", (n_geographies, n_fit_days)),
+              ("fit_deaths", "f8", (n_geographies, n_fit_days))]
+    layout = {}
+    offset = 0
+    for field, dtype, shape in fields:
+        layout[field] = (dtype, shape, offset)
+        size = np.dtype(dtype).itemsize * int(np.prod(shape))
+        offset += -(-size // ALIGNMENT) * ALIGNMENT
+
+    return layout, max(offset, 1)
+
+
+class SharedCube(object):
+    """Data cube and fit results views on a shared memory block."""
+
+    def __init__(self, spec, create=False):
+        self.spec = spec
+        name, layout, size = spec
+        self._owner = create
+        if shared_memory is not None:
+            self._shm = shared_memory.SharedMemory(name=name, create=create,
+                                                   size=size)
+            buffer = self._shm.buf
+        else:
+            self._shm = np.memmap(name, dtype=np.uint8,
+                                  mode="w+" if create else "r+",
+                                  shape=(size, ))
+            buffer = self._shm
+        for field, (dtype, shape, offset) in layout.items():
+            setattr(self, field, np.ndarray(shape, dtype=np.dtype(dtype),
+                                            buffer=buffer, offset=offset))
+
+    @classmethod
+    def publish(cls, geographies, regions, datasets, n_fit_days=None):
+        """
+        Create the shared block and copy the data into it once.
+
+        datasets are the per-geography (cases, deaths, recs, times)
+        arrays as returned by the data finder; shorter series are
+        padded with NaN (NaT for times). Fitted series may come from
+        another source (eg. UK official data): n_fit_days (default: the
+        longest dataset) is room for the longest one, see fit_days.
+        """
+        n_days = max([len(data[0]) for data in datasets] + [1])
+        n_fit_days = max(n_fit_days or 0, n_days)
+        name_length = max([len(geo) for geo in geographies] + [1])
+        layout, size = _layout(len(geographies), n_days, name_length,
+                               n_fit_days)
+        if shared_memory is not None:
+            name = "cov_lin_{}".format(os.getpid())
+        else:
+            fd, name = tempfile.mkstemp(prefix="cov_lin_cube_")
+            os.close(fd)
+        cube = cls((name, layout, size), create=True)
+        cube.geographies[:] = geographies
+        cube.regions[:] = regions
+        cube.results[:] = np.zeros(1, dtype=cube.results.dtype)
+        for idx, (cases, deaths, recs, times) in enumerate(datasets):
+            n = len(cases)
+            cube.cases[idx] = np.nan
+            cube.deaths[idx] = np.nan
+            cube.recoveries[idx] = np.nan
+            cube.times[idx] = np.datetime64("NaT")
+            cube.cases[idx, :n] = cases
+            cube.deaths[idx, :n] = deaths
+            cube.recoveries[idx, :n] = recs
+            cube.times[idx, :n] = times
+
+        return cube
+
+    @classmethod
+    def attach(cls, spec):
+        """Attach to a published block from a worker process."""
+        return cls(spec, create=False)
+
+    def datasets(self, idx):
+        """Get (copies of) the (cases, deaths, recs, times) of a geography."""
+        return (self.cases[idx].copy(), self.deaths[idx].copy(),
+                self.recoveries[idx].copy(), self.times[idx].copy())
+
+    def write_fit(self, idx, fit, cases=None, deaths=None):
+        """
+        Write a worker's fit record and fitted series of a geography.
+
+        Raises ValueError if a series is longer than the block has room
+        for, rather than cutting it.
+        """
+        result = self.results[idx]
+        for name in fit_records.FIT_DTYPE.names:
+            result[name] = fit[name]
+        n_max = self.fit_cases.shape[1]
+        for field, target, series in (("n_cases", self.fit_cases, cases),
+                                      ("n_deaths", self.fit_deaths, deaths)):
+            n = 0 if series is None else len(series)
+            if n > n_max:
+                raise ValueError(
+                    "Fitted {} of {} has {} days, room for {}".format(
+                        field[2:], self.geographies[idx], n, n_max))
+            if n:
+                target[idx, :n] = series[-n:]
+            result[field] = n
+        self.results[idx] = result
+
+    def read_fit(self, idx):
+        """Read back the fit record and fitted series of a geography."""
+        result = self.results[idx]
+        fit = fit_records.empty_fit()
+        for name in fit_records.FIT_DTYPE.names:
+            fit[name] = result[name]
+
+        return (fit,
+                self.fit_cases[idx, :result["n_cases"]].copy(),
+                self.fit_deaths[idx, :result["n_deaths"]].copy())
+
+    def close(self):
+        """Detach from the block; the owner also frees it."""
+        for field in self.spec[1]:
+            setattr(self, field, None)
+        if shared_memory is not None:
+            self._shm.close()
+            if self._owner:
+                self._shm.unlink()
+        else:
+            name = self.spec[0]
+            self._shm = None
+            if self._owner:
+                os.remove(name)
+
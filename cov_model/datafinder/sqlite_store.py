@@ -0,0 +1,169 @@
+"""
+Optional SQLite store for raw daily observations and per-run results.
+
+One database file replaces the per-country one-line csv files in
+country_data/ and gives indexed queries over the daily tables, e.g.
+the doubling time of a country over dates or all countries on a date.
+"""
+import csv
+import math
+import sqlite3
+
+from cov_model.datafinder.results_history import csv_text
+
+
+SQLITE_FILE = "country_data/covid19.sqlite"
+
+# sql column name: summary table column name
+RESULT_COLUMNS = [("iso", "Country"),
+                  ("cases", "cases"),
+                  ("deaths", "deaths"),
+                  ("case_rate", "case rate"),
+                  ("death_rate", "death rate"),
+                  ("doubling_cases", "doubling cases (days)"),
+                  ("doubling_deaths", "doubling deaths (days)"),
+                  ("cfr", "delay-adj mort (pct)"),
+                  ("cfr_stdev", "delay-adj mort stdev (pct)")]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS observations (
+    geography TEXT NOT NULL,
+    region INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    update_time TEXT,
+    cases REAL,
+    deaths REAL,
+    recovered REAL,
+    PRIMARY KEY (geography, region, date)
+);
+CREATE INDEX IF NOT EXISTS observations_date ON observations (date);
+CREATE TABLE IF NOT EXISTS results (
+    geography TEXT NOT NULL,
+    run_date TEXT NOT NULL,
+    {columns},
+    line TEXT,
+    PRIMARY KEY (geography, run_date)
+);
+CREATE INDEX IF NOT EXISTS results_run_date ON results (run_date);
+""".format(columns=",\n    ".join(
+    "{} {}".format(col, "TEXT" if col == "iso" else "REAL")
+    for col, _ in RESULT_COLUMNS))
+
+
+def _to_db(value):
+    """Convert a data value to its database form; None and NaN are NULL."""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return value
+
+
+def _from_db(value):
+    """Convert a database number to its data form; NULL is NaN."""
+    if value is None:
+        return float("nan")
+    return value
+
+
+def _to_float(value):
+    """Convert a table field to float or NULL."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class SQLiteStore(object):
+    """Observations and results tables in a WAL-mode SQLite file."""
+
+    def __init__(self, path=SQLITE_FILE):
+        self.path = path
+        # workers of a parallel run may wait on each other's writes
+        self.connection = sqlite3.connect(path, timeout=30.)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        self.connection.commit()
+
+    def close(self):
+        """Close the database connection."""
+        self.connection.close()
+
+    def insert_observations(self, geography, region, rows):
+        """Bulk insert (date, update_time, cases, deaths, recovered) rows."""
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO observations VALUES (?,?,?,?,?,?,?)",
+                [(geography, int(region), date, _to_db(update_time),
+                  _to_db(cases), _to_db(deaths), _to_db(recovered))
+                 for date, update_time, cases, deaths, recovered in rows])
+
+    def get_observations(self, geography, region, start, end):
+        """Get observation rows for dates (YYYY-MM-DD) in [start, end)."""
+        cursor = self.connection.execute(
+            "SELECT date, update_time, cases, deaths, recovered "
+            "FROM observations WHERE geography=? AND region=? "
+            "AND date>=? AND date<? ORDER BY date",
+            (geography, int(region), start, end))
+
+        return [(row[0], row[1]) + tuple(_from_db(val) for val in row[2:])
+                for row in cursor]
+
+    def observations_on(self, date):
+        """Get all geographies observed on date."""
+        cursor = self.connection.execute(
+            "SELECT geography, region, update_time, cases, deaths, recovered "
+            "FROM observations WHERE date=? ORDER BY geography", (date, ))
+
+        return cursor.fetchall()
+
+    def insert_results(self, run_date, header, rows):
+        """Bulk insert summary table rows of a run."""
+        header = [col.strip() for col in header]
+        country_idx = header.index("country-name")
+        indices = [header.index(name) if name in header else None
+                   for _, name in RESULT_COLUMNS]
+        records = []
+        for row in rows:
+            values = [row[idx] if idx is not None and idx < len(row) else None
+                      for idx in indices]
+            values = [values[0]] + [_to_float(val) for val in values[1:]]
+            records.append([row[country_idx], run_date] + values +
+                           [csv_text([row]).rstrip("\n")])
+        placeholders = ",".join("?" * (len(RESULT_COLUMNS) + 3))
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO results VALUES ({})".format(
+                    placeholders), records)
+
+    def insert_table(self, run_date, table_file):
+        """Bulk insert all rows of a summary table file."""
+        with open(table_file, "r") as file:
+            rows = [row for row in csv.reader(file) if row]
+        if rows:
+            self.insert_results(run_date, rows[0], rows[1:])
+
+    def result_series(self, geography, column):
+        """Get (run_date, value) of a results column for a geography."""
+        if column not in [col for col, _ in RESULT_COLUMNS]:
+            raise ValueError("Unknown results column {}".format(column))
+        cursor = self.connection.execute(
+            "SELECT run_date, {} FROM results WHERE geography=? "
+            "ORDER BY run_date".format(column), (geography, ))
+
+        return cursor.fetchall()
+
+    def doubling_times(self, geography):
+        """Get (run_date, doubling cases, doubling deaths) for geography."""
+        cursor = self.connection.execute(
+            "SELECT run_date, doubling_cases, doubling_deaths FROM results "
+            "WHERE geography=? ORDER BY run_date", (geography, ))
+
+        return cursor.fetchall()
+
+    def results_on(self, run_date):
+        """Get all geographies' results lines of a run date."""
+        cursor = self.connection.execute(
+            "SELECT geography, line FROM results WHERE run_date=? "
+            "ORDER BY geography", (run_date, ))
+
+        return cursor.fetchall()
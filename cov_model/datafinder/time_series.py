@@ -0,0 +1,264 @@
+"""
+Ingest backend for the JHU wide time-series files.
+
+JHU publish the whole history of each metric in one file:
+
+    time_series_covid19_{confirmed,deaths,recovered}_global.csv
+    Province/State,Country/Region,Lat,Long,1/22/20,1/23/20,...
+
+The three files are parsed in one vectorized pass each and the province
+rows are summed per country (see datafinder.rollup) into a country x day
+cube; monthly data is then sliced from the cube, in the same layout as
+get_monthly_countries_data returns it. A cold start reads three files
+instead of one daily report per geography per day. Only countries are
+in the global files: regions (US states) still come from the daily
+reports.
+
+Countries are named as elsewhere in the analysis: "United Kingdom" is
+UK (see data_finder.OFFICIAL_DATA_NAMES) and the JHU names of
+country_parameters.JHU_NAMES (eg. "Korea, South") are renamed, the JHU
+name still finding the row. The cube is cross-checked against the daily
+reports path with cross_check, which lists the days where the two
+sources differ:
+
+Usage
+=====
+$ python cov_model/datafinder/time_series.py --countries Italy,Spain --months 3,4
+"""
+import argparse
+import csv
+import os
+import sys
+from datetime import datetime
+
+import numpy as np
+
+try:
+    from urllib.request import urlretrieve
+except ImportError:  # python 2
+    from urllib import urlretrieve
+
+if __package__ in (None, ""):
+    # run as a script: make the cov_model package importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__)))))
+
+from cov_model import instrument
+from cov_model.datafinder.data_finder import (OFFICIAL_DATA_NAMES,
+    get_monthly_countries_data, last_report_day)
+from cov_model.datafinder.rollup import group_sums, parse_numbers
+from cov_model.statsanalysis.country_parameters import JHU_NAMES
+
+
+TIME_SERIES = "https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series"
+TIME_SERIES_FILE = "time_series_covid19_{}_global.csv"
+TIME_SERIES_DIR = "country_data/time_series"
+
+# cube field: file metric
+METRICS = [("cases", "confirmed"), ("deaths", "deaths"),
+           ("recoveries", "recovered")]
+
+COUNTRY_COL = 1
+FIRST_DATE_COL = 4
+
+# relative difference tolerated by the cross-check
+TOLERANCE = 0.
+
+
+def read_wide_file(path):
+    """Parse a wide file: get countries, dates and values (row x day)."""
+    instrument.count("files opened")
+    instrument.count("bytes read", os.path.getsize(path))
+    with open(path, "r") as csv_file:
+        reader = csv.reader(csv_file, delimiter=',', quotechar='"')
+        with instrument.timer("csv parse"):
+            rows = [row for row in reader]
+    instrument.count("rows parsed", len(rows))
+    header = rows[0]
+    rows = [row for row in rows[1:] if len(row) == len(header)]
+    dates = np.array([datetime.strptime(date, "%m/%d/%y").strftime("%Y-%m-%d")
+                      for date in header[FIRST_DATE_COL:]],
+                     dtype="datetime64[D]")
+    countries = np.array([row[COUNTRY_COL] for row in rows], dtype=str)
+    values = parse_numbers([field for row in rows
+                            for field in row[FIRST_DATE_COL:]])
+
+    return countries, dates, values.reshape(len(rows), len(dates))
+
+
+def rename_countries(countries):
+    """Get the names used in the analysis of the JHU country names."""
+    names = dict(JHU_NAMES, **OFFICIAL_DATA_NAMES)
+
+    return np.array([names.get(country, country) for country in countries],
+                    dtype=str)
+
+
+def sum_by_country(countries, values):
+    """Sum the (province) rows per country; get names and sums."""
+    if not len(countries):
+        return countries, values
+    order = np.argsort(countries, kind="stable")
+    countries = countries[order]
+    starts = np.flatnonzero(np.r_[True, countries[1:] != countries[:-1]])
+
+    return countries[starts], group_sums(values[order].T, starts).T
+
+
+def _stale(path):
+    """Check if a file was last modified before today."""
+    modified = datetime.fromtimestamp(os.path.getmtime(path))
+
+    return modified.date() < datetime.today().date()
+
+
+def _positions(values, targets):
+    """Get the indices of targets in sorted values and which are there."""
+    if not len(values):
+        return (np.zeros(len(targets), dtype=int),
+                np.zeros(len(targets), dtype=bool))
+    idx = np.minimum(np.searchsorted(values, targets), len(values) - 1)
+
+    return idx, values[idx] == targets
+
+
+class TimeSeriesCube(object):
+    """Cumulative cases, deaths and recoveries (country x day)."""
+
+    def __init__(self, geographies, dates, cases, deaths, recoveries):
+        self.geographies = list(geographies)
+        self._index = {geo: idx for idx, geo in enumerate(self.geographies)}
+        # the JHU names find the renamed rows too
+        for jhu_name, name in JHU_NAMES.items():
+            if name in self._index:
+                self._index.setdefault(jhu_name, self._index[name])
+        self.dates = dates
+        self.cases = cases
+        self.deaths = deaths
+        self.recoveries = recoveries
+
+    @classmethod
+    def load(cls, data_dir=TIME_SERIES_DIR, download=False):
+        """
+        Read the three wide files into a cube.
+
+        Files are downloaded if missing or not downloaded today (they
+        grow by one day every day), or always with download=True.
+        """
+        if not os.path.isdir(data_dir):
+            os.makedirs(data_dir)
+        metrics = {}
+        for field, metric in METRICS:
+            file_name = TIME_SERIES_FILE.format(metric)
+            path = os.path.join(data_dir, file_name)
+            if download or not os.path.isfile(path) or _stale(path):
+                with instrument.timer("download"):
+                    urlretrieve(os.path.join(TIME_SERIES, file_name), path)
+                instrument.count("files downloaded")
+            countries, dates, values = read_wide_file(path)
+            countries = rename_countries(countries)
+            with instrument.timer("rollup"):
+                metrics[field] = (dates, ) + sum_by_country(countries, values)
+
+        # align all metrics on the countries and dates of the cases
+        dates, geographies, _ = metrics["cases"]
+        arrays = {}
+        for field, _ in METRICS:
+            field_dates, field_geos, sums = metrics[field]
+            aligned = np.full((len(geographies), len(dates)), np.nan)
+            rows, rows_ok = _positions(field_geos, geographies)
+            cols, cols_ok = _positions(field_dates, dates)
+            aligned[np.ix_(rows_ok, cols_ok)] = \
+                sums[np.ix_(rows[rows_ok], cols[cols_ok])]
+            arrays[field] = aligned
+
+        return cls(geographies, dates, **arrays)
+
+    def monthly(self, geography, month):
+        """
+        Get the (cases, deaths, recs, times) of a country for month.
+
+        Same layout as get_monthly_countries_data: days 1 to the last
+        day read of the month, NaN (NaT) where there is no data; times
+        are the dates (midnight) of the columns.
+        """
+        first = np.datetime64("2020-{:02d}-01".format(month), "D")
+        days = first + np.arange(last_report_day(month))
+        cols, found = _positions(self.dates, days)
+        found &= geography in self._index
+        numbers = []
+        for field, _ in METRICS:
+            values = np.full(len(days), np.nan)
+            if geography in self._index:
+                row = getattr(self, field)[self._index[geography]]
+                values[found] = row[cols[found]]
+            numbers.append(values)
+        times = np.where(found, days, np.datetime64("NaT"))
+
+        return tuple(numbers) + (times.astype("datetime64[s]"), )
+
+
+def cross_check(cube, geographies, months, tolerance=TOLERANCE):
+    """
+    Compare the cube with the daily reports path.
+
+    Returns (geography, date, field, time series, daily reports) of the
+    days where the numbers differ by more than tolerance (relative) or
+    only one of them is missing.
+    """
+    mismatches = []
+    for geography in geographies:
+        for month in months:
+            series = cube.monthly(geography, month)
+            reports = get_monthly_countries_data(geography, month,
+                                                 region=False)
+            first = np.datetime64("2020-{:02d}-01".format(month), "D")
+            for idx, (field, _) in enumerate(METRICS):
+                ts_values, rep_values = series[idx], reports[idx]
+                missing = np.isnan(ts_values) != np.isnan(rep_values)
+                with np.errstate(invalid="ignore"):
+                    differ = np.abs(ts_values - rep_values) > \
+                        tolerance * np.abs(rep_values)
+                for day in np.flatnonzero(missing | differ):
+                    mismatches.append((geography, str(first + day), field,
+                                       ts_values[day], rep_values[day]))
+
+    return mismatches
+
+
+def main():
+    """Cross-check the time-series files with the daily reports."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c',
+                        '--countries',
+                        type=str,
+                        required=True,
+                        help='Comma-sep list of countries.')
+    parser.add_argument('-m',
+                        '--months',
+                        type=str,
+                        default="3,4",
+                        help='Comma-sep months.')
+    parser.add_argument('-t',
+                        '--tolerance',
+                        type=float,
+                        default=TOLERANCE,
+                        help='Relative difference tolerated.')
+    parser.add_argument('-d',
+                        '--download',
+                        action='store_true',
+                        help='Download the latest time-series files.')
+    args = parser.parse_args()
+
+    cube = TimeSeriesCube.load(download=args.download)
+    mismatches = cross_check(cube, args.countries.split(","),
+                             [int(month) for month in args.months.split(",")],
+                             args.tolerance)
+    print("geography | date | field | time series | daily reports")
+    for mismatch in mismatches:
+        print("%s | %s | %s | %s | %s" % mismatch)
+    print("{} mismatching values".format(len(mismatches)))
+
+
+if __name__ == '__main__':
+    main()
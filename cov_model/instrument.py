@@ -0,0 +1,138 @@
+"""
+Per-stage timers and counters.
+
+Stages wrap their work in instrument.timer("stage") and bump counters
+with instrument.count("files opened"); the active Instruments collect
+wall clock totals and counts, optionally a cProfile and tracemalloc
+capture, and report them as JSON (--profile report.json). Workers send
+snapshots of their instruments back to be merged by the parent.
+"""
+import json
+import time
+from contextlib import contextmanager
+
+from cov_model.datafinder.results_history import atomic_write
+
+
+# functions and allocation sites kept in the report
+TOP_ENTRIES = 30
+
+
+class Instruments(object):
+    """Named timers (calls, seconds) and counters."""
+
+    def __init__(self):
+        self.timers = {}
+        self.counters = {}
+        self._profile = None
+        self._tracemalloc = None
+
+    @contextmanager
+    def timer(self, name):
+        """Time a block of work as stage name."""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.time() - start)
+
+    def add_time(self, name, seconds):
+        """Add a timed call of seconds to timer name."""
+        calls, total = self.timers.get(name, (0, 0.))
+        self.timers[name] = (calls + 1, total + seconds)
+
+    def count(self, name, value=1):
+        """Add value to counter name."""
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self, reset=False):
+        """Get the timers and counters (eg. to send to the parent)."""
+        snapshot = {"timers": dict(self.timers),
+                    "counters": dict(self.counters)}
+        if reset:
+            self.timers = {}
+            self.counters = {}
+
+        return snapshot
+
+    def merge(self, snapshot):
+        """Add a snapshot of another process' instruments."""
+        for name, (calls, total) in snapshot["timers"].items():
+            own_calls, own_total = self.timers.get(name, (0, 0.))
+            self.timers[name] = (own_calls + calls, own_total + total)
+        for name, value in snapshot["counters"].items():
+            self.count(name, value)
+
+    def start_capture(self, profile=False, memory=False):
+        """Start cProfile and/or tracemalloc capture."""
+        if profile:
+            import cProfile
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        if memory:
+            import tracemalloc
+            tracemalloc.start()
+            self._tracemalloc = tracemalloc
+
+    def _stop_capture(self):
+        """Stop capturing; get the cProfile and tracemalloc reports."""
+        report = {}
+        if self._profile is not None:
+            import pstats
+            self._profile.disable()
+            stats = pstats.Stats(self._profile).stats
+            entries = sorted(stats.items(), key=lambda item: -item[1][3])
+            report["cprofile"] = [
+                {"function": "{}:{}({})".format(*func), "calls": nc,
+                 "total_time": tt, "cumulative_time": ct}
+                for func, (_, nc, tt, ct, _) in entries[:TOP_ENTRIES]]
+            self._profile = None
+        if self._tracemalloc is not None:
+            current, peak = self._tracemalloc.get_traced_memory()
+            top = self._tracemalloc.take_snapshot().statistics("lineno")
+            report["tracemalloc"] = {
+                "current_bytes": current, "peak_bytes": peak,
+                "top": [{"site": str(stat.traceback), "bytes": stat.size,
+                         "blocks": stat.count}
+                        for stat in top[:TOP_ENTRIES]]}
+            self._tracemalloc.stop()
+            self._tracemalloc = None
+
+        return report
+
+    def report(self):
+        """Get the JSON report; stops any capture."""
+        report = {"timers": {name: {"calls": calls, "seconds": total}
+                             for name, (calls, total) in self.timers.items()},
+                  "counters": dict(self.counters)}
+        report.update(self._stop_capture())
+
+        return report
+
+    def write(self, path):
+        """Atomically write the JSON report."""
+        atomic_write(path, json.dumps(self.report(), indent=1,
+                                      sort_keys=True))
+
+
+_INSTRUMENTS = [Instruments()]
+
+
+def get_instruments():
+    """Get the active instruments."""
+    return _INSTRUMENTS[0]
+
+
+def set_instruments(instruments):
+    """Set the active instruments."""
+    _INSTRUMENTS[0] = instruments
+
+
+def timer(name):
+    """Time a block of work on the active instruments."""
+    return _INSTRUMENTS[0].timer(name)
+
+
+def count(name, value=1):
+    """Add value to a counter of the active instruments."""
+    _INSTRUMENTS[0].count(name, value)
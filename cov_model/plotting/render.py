@@ -0,0 +1,282 @@
+"""
+Headless rendering stage.
+
+Plotting code records pyplot-style calls on a FigureRecorder; each
+savefig hands the recorded spec (output path and calls) to the active
+Renderer, which draws it on an explicit Agg Figure, either inline or
+asynchronously in a process pool so computation does not wait on
+rasterisation. Matplotlib is only imported where specs are rendered.
+
+A RenderCache skips specs whose output file was already drawn from an
+identical spec (same data, text, styling and matplotlib version).
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import pickle
+from collections import OrderedDict
+
+from cov_model import instrument
+from cov_model.datafinder.results_history import atomic_write
+
+
+# bump when the rendering itself changes so cached plots are redrawn
+STYLE_VERSION = 1
+
+RENDER_CACHE_FILE = "country_plots/.render_cache.json"
+RENDER_CACHE_SIZE = 5000
+
+_MATPLOTLIB_VERSION = []
+
+
+# pyplot function: Axes method
+PYPLOT_TO_AXES = {"xlim": "set_xlim",
+                  "ylim": "set_ylim",
+                  "xlabel": "set_xlabel",
+                  "ylabel": "set_ylabel",
+                  "title": "set_title"}
+
+# pyplot calls that only manage the global figure state
+NO_OPS = ("close", "subplots", "figure")
+
+
+def _apply(fig, ax, name, args, kwargs):
+    """Apply one recorded call to the figure or its axes."""
+    if name in NO_OPS:
+        return
+    if name in ("xticks", "yticks"):
+        set_ticks = getattr(ax, "set_{}".format(name))
+        set_ticks(args[0])
+        if len(args) > 1:
+            set_labels = getattr(ax, "set_{}labels".format(name[0] + "tick"))
+            set_labels(args[1], **kwargs)
+    elif name == "semilogy":
+        ax.set_yscale("log")
+    elif name == "semilogx":
+        ax.set_xscale("log")
+    elif name == "suptitle":
+        fig.suptitle(*args, **kwargs)
+    elif name == "hist" and "normed" in kwargs:
+        # normed was removed from matplotlib in favour of density
+        kwargs = dict(kwargs)
+        kwargs["density"] = kwargs.pop("normed")
+        ax.hist(*args, **kwargs)
+    else:
+        getattr(ax, PYPLOT_TO_AXES.get(name, name))(*args, **kwargs)
+
+
+def render_spec(path, calls):
+    """Render a recorded figure to path with the Agg backend."""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    for name, args, kwargs in calls:
+        _apply(fig, ax, name, args, kwargs)
+    dir_name = os.path.dirname(path)
+    if dir_name and not os.path.isdir(dir_name):
+        os.makedirs(dir_name)
+    fig.savefig(path)
+
+    return path
+
+
+def matplotlib_version():
+    """Get the installed matplotlib version, without importing it."""
+    if not _MATPLOTLIB_VERSION:
+        try:
+            from importlib.metadata import version
+            _MATPLOTLIB_VERSION.append(version("matplotlib"))
+        except ImportError:  # python < 3.8
+            import matplotlib
+            _MATPLOTLIB_VERSION.append(matplotlib.__version__)
+
+    return _MATPLOTLIB_VERSION[0]
+
+
+def spec_key(path, calls):
+    """Hash a figure spec: style and matplotlib versions, path and calls."""
+    content = pickle.dumps((STYLE_VERSION, matplotlib_version(), path,
+                            calls), protocol=2)
+
+    return hashlib.sha1(content).hexdigest()
+
+
+class RenderCache(object):
+    """Size-bounded LRU manifest of output path: spec key."""
+
+    def __init__(self, manifest_file=RENDER_CACHE_FILE,
+                 max_entries=RENDER_CACHE_SIZE):
+        self.manifest_file = manifest_file
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        if os.path.isfile(manifest_file):
+            try:
+                with open(manifest_file, "r") as file:
+                    self._entries.update(json.load(file))
+            except ValueError:
+                # corrupt manifest: everything gets redrawn
+                self._entries.clear()
+
+    def hit(self, path, key):
+        """Check whether path exists and was drawn from spec key."""
+        if self._entries.get(path) != key or not os.path.isfile(path):
+            return False
+        self._entries[path] = self._entries.pop(path)
+        return True
+
+    def add(self, path, key):
+        """Record a drawn output; evict the least recently used."""
+        self._entries.pop(path, None)
+        self._entries[path] = key
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def save(self):
+        """Atomically write the manifest."""
+        atomic_write(self.manifest_file, json.dumps(self._entries))
+
+
+class Renderer(object):
+    """
+    Render figure specs inline, in a process pool or just collect them.
+
+    jobs=0 renders inline, jobs>0 renders asynchronously in a pool of
+    jobs processes (finish() waits for them); collect=True keeps the
+    specs (eg. in analysis workers, so the parent can render them).
+    With a RenderCache, specs identical to the one an existing output
+    was drawn from are skipped.
+    """
+
+    def __init__(self, jobs=0, collect=False, cache=None):
+        self.collect = collect
+        self.cache = cache
+        self.skipped = 0
+        self.specs = []
+        self._pool = None
+        self._pending = []
+        if jobs > 0 and not collect:
+            self._pool = multiprocessing.Pool(jobs)
+
+    def submit(self, path, calls):
+        """Render (or collect) a figure spec."""
+        if self.collect:
+            self.specs.append((path, calls))
+            return
+        key = None
+        if self.cache is not None:
+            key = spec_key(path, calls)
+            if self.cache.hit(path, key):
+                self.skipped += 1
+                instrument.count("figures cached")
+                return
+        if self._pool is not None:
+            self._pending.append(
+                (path, key, self._pool.apply_async(render_spec,
+                                                   (path, calls))))
+        else:
+            with instrument.timer("render"):
+                render_spec(path, calls)
+            self._drawn(path, key)
+
+    def _drawn(self, path, key):
+        """Count a finished render and record it in the cache."""
+        instrument.count("figures rendered")
+        if self.cache is not None:
+            self.cache.add(path, key)
+
+    def pop_specs(self):
+        """Get and forget the collected specs."""
+        specs, self.specs = self.specs, []
+        return specs
+
+    def finish(self):
+        """Wait for all pending renders; re-raise rendering errors."""
+        pending, self._pending = self._pending, []
+        for path, key, result in pending:
+            result.get()
+            self._drawn(path, key)
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        if self.cache is not None:
+            self.cache.save()
+
+
+class NullRenderer(object):
+    """Discard figure specs (compute-only runs never import matplotlib)."""
+
+    skipped = 0
+
+    def submit(self, path, calls):
+        """Discard a figure spec."""
+
+    def pop_specs(self):
+        """There are never collected specs."""
+        return []
+
+    def finish(self):
+        """Nothing is pending."""
+
+
+_RENDERER = [Renderer()]
+
+
+def set_renderer(renderer):
+    """Set the renderer that receives saved figures."""
+    _RENDERER[0] = renderer
+
+
+def get_renderer():
+    """Get the renderer that receives saved figures."""
+    return _RENDERER[0]
+
+
+def _picklable(value):
+    """Turn dict views (not picklable) into lists for the render pool."""
+    if isinstance(value, (type({}.keys()), type({}.values()))):
+        return list(value)
+    return value
+
+
+class FigureRecorder(object):
+    """
+    Record pyplot-style calls for the current figure.
+
+    Any plt.<function>(...) or ax.<method>(...) call is recorded on the
+    current figure; as with pyplot, subplots() opens a new figure (the
+    recorder stands for both figure and axes), close() discards the
+    current one and returns to the previously open figure, and savefig()
+    hands a snapshot of the current figure to the active renderer.
+    """
+
+    def __init__(self):
+        self._figures = [[]]
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        def record(*args, **kwargs):
+            args = tuple(_picklable(arg) for arg in args)
+            self._figures[-1].append((name, args, kwargs))
+        return record
+
+    def subplots(self, *args, **kwargs):
+        """Open a new figure."""
+        self._figures.append([])
+        return self, self
+
+    def savefig(self, path):
+        """Hand the current figure to the active renderer."""
+        get_renderer().submit(path, list(self._figures[-1]))
+
+    def close(self, *args):
+        """Discard the current figure."""
+        self._figures.pop()
+        if not self._figures:
+            self._figures.append([])
@@ -0,0 +1,340 @@
+"""
+Local HTTP/JSON query service over warm results.
+
+Loads the latest results bundle (see datafinder.results_bundle) and the
+results history once and answers queries from the in-memory arrays;
+derived series (eg. Rt for another window, delay-adjusted CFR) are
+computed from the bundle's day-aligned cases and deaths, as in the
+analysis run, and kept in an LRU cache. When the ingest stage publishes a newer bundle or
+history file the state is reloaded and the cache starts over.
+
+Usage
+=====
+$ python cov_model/service.py --port 8765
+
+GET /geographies
+GET /fit?geography=UK
+GET /rt?geography=UK&window=7
+GET /cfr?geography=UK
+GET /history?geography=UK&column=doubling cases (days)
+GET /status
+
+The service binds to localhost only.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from collections import OrderedDict
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from urllib.parse import parse_qs, urlparse
+except ImportError:  # python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from urlparse import parse_qs, urlparse
+
+import numpy as np
+
+if __package__ in (None, ""):
+    # run as a script: make the cov_model package importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+
+from cov_model.datafinder import results_bundle, results_history
+from cov_model.statsanalysis import cfr, rt
+
+
+HOST = "127.0.0.1"
+PORT = 8765
+RESULTS_GLOB = "country_results/results_*.json"
+
+# seconds between checks for newly published results
+RELOAD_INTERVAL = 5.
+CACHE_SIZE = 256
+
+
+class QueryError(Exception):
+    """Bad query: unknown geography, column or parameter."""
+
+
+class LRUCache(object):
+    """Size-bounded least recently used cache of derived results."""
+
+    def __init__(self, max_entries=CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key, compute):
+        """Get the cached value of key or compute and cache it."""
+        if key in self._entries:
+            self.hits += 1
+            value = self._entries[key] = self._entries.pop(key)
+            return value
+        self.misses += 1
+        value = compute()
+        self._entries[key] = value
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        """Forget all cached values."""
+        self._entries.clear()
+
+
+def _latest_bundle(pattern=RESULTS_GLOB):
+    """Get the path prefix of the latest results bundle (or None)."""
+    files = sorted(glob.glob(pattern))
+    if not files:
+        return None
+    return files[-1][:-len(".json")]
+
+
+def _mtime(path):
+    """Get the modification time of path, None if missing."""
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def _to_list(values):
+    """Convert an array to a JSON list; NaN is null."""
+    return [None if np.isnan(val) else float(val) for val in values]
+
+
+class WarmState(object):
+    """Results bundle and history held in memory, reloaded on change."""
+
+    def __init__(self, results_prefix=None,
+                 history_file=results_history.HISTORY_FILE,
+                 results_glob=RESULTS_GLOB):
+        self.fixed_prefix = results_prefix
+        self.history_file = history_file
+        self.results_glob = results_glob
+        self.results = None
+        self.history = results_history.ResultsHistory()
+        self.cache = LRUCache()
+        self.generation = 0
+        self.loaded_at = None
+        self._stamp = None
+        self._checked = 0.
+        self.reload()
+
+    def _current_stamp(self):
+        """Get the (bundle, mtimes) identifying the published data."""
+        prefix = self.fixed_prefix or _latest_bundle(self.results_glob)
+        if prefix is None:
+            return None, None
+        return prefix, (_mtime(prefix + ".json"), _mtime(prefix + ".npz"),
+                        _mtime(self.history_file))
+
+    def reload(self, force=True):
+        """Reload if forced or published data changed; True if reloaded."""
+        now = time.time()
+        if not force and now - self._checked < RELOAD_INTERVAL:
+            return False
+        self._checked = now
+        prefix, stamp = self._current_stamp()
+        if not force and (prefix, stamp) == self._stamp:
+            return False
+        if prefix is not None and os.path.isfile(prefix + ".npz"):
+            self.results = results_bundle.RunResults.load(prefix)
+        if os.path.isfile(self.history_file):
+            self.history = results_history.load_history(self.history_file)
+        self._stamp = (prefix, stamp)
+        self.generation += 1
+        self.loaded_at = now
+        self.cache.clear()
+        return True
+
+    def _results(self):
+        """Get the loaded results."""
+        if self.results is None:
+            raise QueryError("No results bundle loaded")
+        return self.results
+
+    def _series(self, name, geography):
+        """Get a series of a geography from the bundle."""
+        values = self._results().array(name, geography)
+        if values is None:
+            raise QueryError("No {} series for {}".format(name, geography))
+        return values
+
+    def geographies(self):
+        """List analyzed geographies."""
+        results = self._results()
+        return {"run_date": results.run_date,
+                "geographies": results.geographies}
+
+    def fit(self, geography):
+        """Get fit numbers and table fields of a geography."""
+        results = self._results()
+        if geography not in results.fits:
+            raise QueryError("Unknown geography {}".format(geography))
+        return dict(results.fits[geography], geography=geography,
+                    run_date=results.run_date,
+                    table=results.table.get(geography, {}))
+
+    def rt(self, geography, window=7):
+        """Get the Rt series and 95% credible interval of a geography."""
+        if window < 1:
+            raise QueryError("Window must be positive")
+
+        def compute():
+            cases = self._series("cases_aligned", geography)
+            mean, lower, upper = rt.estimate_rt(cases, window=window)
+            return {"geography": geography, "window": window,
+                    "rt": _to_list(mean[0]),
+                    "rt_lower": _to_list(lower[0]),
+                    "rt_upper": _to_list(upper[0])}
+        return self.cache.get((self.generation, "rt", geography, window),
+                              compute)
+
+    def cfr(self, geography, window=7):
+        """Get the delay-adjusted CFR series of a geography."""
+        if window < 1:
+            raise QueryError("Window must be positive")
+
+        def compute():
+            cases = self._series("cases_aligned", geography)
+            deaths = self._series("deaths_aligned", geography)
+            values, mean, std = cfr.delay_adjusted_cfr(cases[None, :],
+                                                       deaths[None, :],
+                                                       window=window)
+            return {"geography": geography, "window": window,
+                    "cfr": _to_list(values[0]),
+                    "cfr_mean": _to_list(mean[0]),
+                    "cfr_std": _to_list(std[0])}
+        return self.cache.get((self.generation, "cfr", geography, window),
+                              compute)
+
+    def history_series(self, geography, column):
+        """Get the dates and values of a results history column."""
+        if column not in self.history.columns:
+            raise QueryError("Unknown history column {}".format(column))
+
+        def compute():
+            dates, values = self.history.series(geography, column)
+            return {"geography": geography, "column": column,
+                    "dates": [str(date) for date in dates],
+                    "values": _to_list(values)}
+        return self.cache.get((self.generation, "history", geography, column),
+                              compute)
+
+    def status(self):
+        """Get the loaded data and cache statistics."""
+        return {"bundle": self._stamp[0] if self._stamp else None,
+                "generation": self.generation,
+                "loaded_at": self.loaded_at,
+                "cache_hits": self.cache.hits,
+                "cache_misses": self.cache.misses}
+
+
+def _param(query, name, default=None):
+    """Get a query string parameter."""
+    values = query.get(name)
+    if not values:
+        if default is None:
+            raise QueryError("Missing parameter {}".format(name))
+        return default
+    return values[0]
+
+
+def _int_param(query, name, default):
+    """Get an integer query string parameter."""
+    try:
+        return int(_param(query, name, str(default)))
+    except ValueError:
+        raise QueryError("Parameter {} must be an integer".format(name))
+
+
+# path: handler(state, query)
+ROUTES = {
+    "/geographies": lambda state, query: state.geographies(),
+    "/fit": lambda state, query: state.fit(_param(query, "geography")),
+    "/rt": lambda state, query: state.rt(_param(query, "geography"),
+                                         _int_param(query, "window", 7)),
+    "/cfr": lambda state, query: state.cfr(_param(query, "geography"),
+                                           _int_param(query, "window", 7)),
+    "/history": lambda state, query: state.history_series(
+        _param(query, "geography"), _param(query, "column")),
+    "/status": lambda state, query: state.status(),
+}
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """Answer GET queries with JSON."""
+
+    def do_GET(self):
+        """Route a query to the warm state."""
+        url = urlparse(self.path)
+        state = self.server.state
+        state.reload(force=False)
+        route = ROUTES.get(url.path.rstrip("/") or "/status")
+        if route is None:
+            self._reply(404, {"error": "Unknown path {}".format(url.path)})
+            return
+        try:
+            self._reply(200, route(state, parse_qs(url.query)))
+        except QueryError as exc:
+            self._reply(400, {"error": str(exc)})
+        except Exception as exc:
+            # a failing query must not drop the connection without reply
+            self._reply(500, {"error": "{}: {}".format(type(exc).__name__,
+                                                       exc)})
+
+    def _reply(self, code, content):
+        """Send a JSON response."""
+        body = json.dumps(content).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        """Keep the console quiet; queries are not logged."""
+
+
+def make_server(state, host=HOST, port=PORT):
+    """Create the query server; port 0 picks a free port."""
+    server = HTTPServer((host, port), QueryHandler)
+    server.state = state
+
+    return server
+
+
+def main():
+    """Parse command line args and serve until interrupted."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-o',
+                        '--results',
+                        type=str,
+                        default=None,
+                        help='Results bundle path prefix; default: latest.')
+    parser.add_argument('-p',
+                        '--port',
+                        type=int,
+                        default=PORT,
+                        help='Port on localhost to serve on.')
+    args = parser.parse_args()
+
+    state = WarmState(args.results)
+    server = make_server(state, port=args.port)
+    print("Serving {} on http://{}:{}".format(state.status()["bundle"],
+                                              HOST, server.server_port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Delay-adjusted case fatality rate (CFR).
+
+The naive ratio deaths / cases underestimates the CFR while the
+epidemic grows, since most of the current cases have not yet
+had an outcome. Here cases are weighted by the confirmation-to-death
+delay so deaths are compared only to cases that could have died:
+
+    CFR(t) = D(t) / sum_{s<=t} sum_k c(s - k) f(k)
+
+where D is the cumulative number of deaths, c the daily cases
+and f the delay distribution; the cases before the series are
+counted as resolved.
+"""
+import numpy as np
+
+from cov_model.statsanalysis import delays
+
+
+# confirmation to death delay (days): mean and standard deviation
+DEATH_DELAY_MEAN = 13.
+DEATH_DELAY_STD = 12.7
+DEATH_DELAY_MAX = 40
+
+
+def death_delay(mean=DEATH_DELAY_MEAN, std=DEATH_DELAY_STD,
+                max_days=DEATH_DELAY_MAX):
+    """Get the discrete confirmation-to-death delay distribution."""
+    return delays.discretised_gamma(mean, std, max_days)
+
+
+def _rolling_moments(series, window):
+    """Get NaN-aware rolling mean and std along the last axis."""
+    valid = ~np.isnan(series)
+    values = np.where(valid, series, 0.)
+    zeros = np.zeros(series.shape[:-1] + (1, ))
+    csum = np.concatenate((zeros, np.cumsum(values, axis=-1)), axis=-1)
+    csum2 = np.concatenate((zeros, np.cumsum(values ** 2, axis=-1)),
+                           axis=-1)
+    ccount = np.concatenate((zeros, np.cumsum(valid, axis=-1)), axis=-1)
+    lag = np.maximum(np.arange(1, series.shape[-1] + 1) - window, 0)
+    total = csum[..., 1:] - csum[..., lag]
+    total2 = csum2[..., 1:] - csum2[..., lag]
+    count = ccount[..., 1:] - ccount[..., lag]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        var = np.clip(total2 / count - mean ** 2, 0., None)
+
+    return mean, np.sqrt(var)
+
+
+def delay_adjusted_cfr(cum_cases, cum_deaths, pmf=None, window=7):
+    """
+    Compute delay-adjusted CFR series for (geography x day) matrices.
+
+    Returns the daily CFR, its rolling mean and rolling standard
+    deviation over window days; days with no resolved cases are NaN.
+    The cases counted on the first known day are taken as resolved:
+    early values are biased low rather than inflated by a one-day lump
+    of new cases.
+    """
+    if pmf is None:
+        pmf = death_delay()
+    cum_cases = delays.fill_gaps(cum_cases)
+    cum_deaths = delays.fill_gaps(cum_deaths)
+    daily_cases = np.nan_to_num(delays.daily_increments(cum_cases))
+    # the count on the first known day (cases before the series) is
+    # taken as resolved; later cases resolve with the delay
+    first = delays.first_days(cum_cases)
+    rows = np.flatnonzero(first < cum_cases.shape[-1])
+    baseline = np.full(len(cum_cases), np.nan)
+    baseline[rows] = cum_cases[rows, first[rows]]
+    resolved = baseline[:, None] + \
+        np.cumsum(delays.causal_convolve(daily_cases, pmf), axis=-1)
+    resolved[np.arange(cum_cases.shape[-1]) < first[:, None]] = np.nan
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cfr = np.where(resolved > 0., cum_deaths / resolved, np.nan)
+    # a CFR above 1 only flags a too short resolved baseline
+    cfr[cfr > 1.] = np.nan
+    rolling_mean, rolling_std = _rolling_moments(cfr, window)
+
+    return cfr, rolling_mean, rolling_std
+
+
+def current_cfr(cases, deaths, pmf=None, window=7):
+    """
+    Get the current delay-adjusted CFR and its rolling uncertainty.
+
+    Cases and deaths are cumulative lists ending on the same day;
+    deaths may be shorter (no deaths recorded at the start).
+    """
+    cases = np.asarray(cases, dtype=float)
+    deaths_full = np.zeros(len(cases))
+    if len(deaths):
+        deaths_full[-len(deaths):] = deaths[-len(cases):]
+    _, rolling_mean, rolling_std = delay_adjusted_cfr(cases, deaths_full,
+                                                      pmf, window)
+    valid = np.flatnonzero(~np.isnan(rolling_mean[0]))
+    if not len(valid):
+        return np.nan, np.nan
+
+    return rolling_mean[0, valid[-1]], rolling_std[0, valid[-1]]
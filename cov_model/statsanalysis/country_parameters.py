@@ -1,3 +1,21 @@
+"""
+Country metadata: ISO code and population.
+
+COUNTRY_PARAMS is the built-in table; rows of the optional population
+table (country_data/populations.csv: name,ISO,population in 1e3 units)
+are added to it or override it, so geographies found in the daily
+reports can be given a population without a code change. Names used by
+the JHU reports are indexed to the same rows via JHU_NAMES.
+"""
+import csv
+import os
+
+
+POPULATION_TABLE = "country_data/populations.csv"
+
+# JHU daily report name: name used here
+JHU_NAMES = {"Korea, South": "South Korea",
+             "Mainland China": "China"}
 
 # name: [ISO, population in 1e3 units]
 COUNTRY_PARAMS = \
@@ -43,3 +61,24 @@ COUNTRY_PARAMS = \
      "United Arab Emirates": ["ARE", 9631.],
      "US": ["USA", 327096.]
 }
+
+
+def load_country_params(path=POPULATION_TABLE):
+    """Get the built-in table joined with the population table rows."""
+    params = dict(COUNTRY_PARAMS)
+    if os.path.isfile(path):
+        with open(path, "r") as file:
+            for row in csv.reader(file):
+                if len(row) < 3 or row[0].strip().lower() == "name":
+                    continue
+                name, iso, population = [field.strip() for field in row[:3]]
+                try:
+                    params[name] = [iso, float(population)]
+                except ValueError:
+                    continue
+    # index the JHU names too
+    for jhu_name, name in JHU_NAMES.items():
+        if name in params and jhu_name not in params:
+            params[jhu_name] = params[name]
+
+    return params
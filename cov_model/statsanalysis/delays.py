@@ -0,0 +1,79 @@
+"""
+Module that builds discrete delay distributions and convolves
+(geography x day) incidence matrices with them.
+"""
+import math
+
+import numpy as np
+
+
+def discretised_gamma(mean, std, max_days):
+    """Daily probability mass of a gamma delay with given mean and std."""
+    shape = (mean / std) ** 2
+    scale = std ** 2 / mean
+    days = np.arange(max_days + 1, dtype=float)
+    # evaluate the density at day midpoints; day 0 gets the first half day
+    mids = np.maximum(days, 0.5)
+    log_pdf = (shape - 1.) * np.log(mids) - mids / scale - \
+        math.lgamma(shape) - shape * math.log(scale)
+    pmf = np.exp(log_pdf)
+    pmf[0] *= 0.5
+
+    return pmf / pmf.sum()
+
+
+def causal_convolve(incidence, pmf):
+    """
+    Convolve each row of incidence with the delay pmf.
+
+    Output at day t is sum_k incidence[t - k] * pmf[k], i.e. what
+    is expected to surface at day t; done for all rows at once
+    with a zero-padded real FFT.
+    """
+    incidence = np.atleast_2d(np.asarray(incidence, dtype=float))
+    n_days = incidence.shape[-1]
+    n_fft = 1
+    while n_fft < n_days + len(pmf) - 1:
+        n_fft *= 2
+    spectrum = np.fft.rfft(incidence, n_fft, axis=-1) * \
+        np.fft.rfft(pmf, n_fft)
+    convolved = np.fft.irfft(spectrum, n_fft, axis=-1)[..., :n_days]
+
+    # clip the FFT round-off noise
+    return np.clip(convolved, 0., None)
+
+
+def fill_gaps(cumulative):
+    """Interpolate missing (NaN) days inside each row linearly."""
+    cumulative = np.atleast_2d(np.array(cumulative, dtype=float))
+    days = np.arange(cumulative.shape[-1])
+    for row in cumulative:
+        known = np.flatnonzero(~np.isnan(row))
+        if len(known) > 1:
+            inside = days[known[0]:known[-1] + 1]
+            row[inside] = np.interp(inside, known, row[known])
+
+    return cumulative
+
+
+def first_days(cumulative):
+    """Get the index of the first known (not NaN) day of each row."""
+    known = ~np.isnan(np.atleast_2d(cumulative))
+
+    return np.where(known.any(axis=-1), np.argmax(known, axis=-1),
+                    known.shape[-1])
+
+
+def daily_increments(cumulative):
+    """
+    Get daily increments from cumulative counts, row-wise.
+
+    The count on the first known day holds the whole history before
+    it, so its increment is unknown (NaN), as are days outside the
+    known range; missing days inside it are interpolated.
+    """
+    cumulative = fill_gaps(cumulative)
+    daily = np.diff(cumulative, axis=-1, prepend=np.nan)
+
+    # downward corrections in the reported totals are not new cases
+    return np.clip(daily, 0., None)
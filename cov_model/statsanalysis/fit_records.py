@@ -0,0 +1,88 @@
+"""
+Typed containers of the fit results.
+
+SeriesFit holds the linear fit of one log series and CountryFits the
+inputs of the per-geography plots; both use __slots__. The scalar fit
+numbers of a geography are one FIT_DTYPE record and the records of all
+geographies form one structured array (see fit_table): compact,
+sortable (np.sort(table, order="doubling_time")), written in one go
+(eg. in the results bundle) and cheap to pass between processes.
+"""
+import numpy as np
+
+
+# scalar fit numbers of a geography
+FIT_DTYPE = np.dtype([("doubling_time", "f8"),
+                      ("reproductive_number", "f8"),
+                      ("fit_quality", "f8"),
+                      ("rate_cases", "f8"),
+                      ("rate_deaths", "f8"),
+                      ("doubling_deaths", "f8"),
+                      ("cases", "f8"),
+                      ("deaths", "f8"),
+                      ("cfr", "f8"),
+                      ("cfr_std", "f8")])
+
+GEOGRAPHY_LENGTH = 64
+
+
+def empty_fit():
+    """Get a fit record with all numbers NaN."""
+    fit = np.zeros((), dtype=FIT_DTYPE)
+    for name in FIT_DTYPE.names:
+        fit[name] = np.nan
+
+    return fit
+
+
+def table_dtype(name_length=GEOGRAPHY_LENGTH):
+    """Get the fit table dtype: geography, region flag and fit numbers."""
+    return np.dtype([("geography", "U{}".format(name_length)),
+                     ("region", "?")] + FIT_DTYPE.descr)
+
+
+def fit_table(geographies, regions, fits):
+    """Stack the fit records of geographies into a structured array."""
+    name_length = max([len(geo) for geo in geographies] + [1])
+    table = np.zeros(len(fits), dtype=table_dtype(name_length))
+    table["geography"] = geographies
+    table["region"] = regions
+    for name in FIT_DTYPE.names:
+        table[name] = [fit[name] for fit in fits]
+
+    return table
+
+
+class SeriesFit(object):
+    """Linear fit of a log series: data, fitted line and fit numbers."""
+
+    __slots__ = ("x", "y", "values", "poly_x", "R", "y_err", "slope",
+                 "d_time", "R0")
+
+    def __init__(self, x, y, values, poly_x=None, R=None, y_err=None,
+                 slope=None, d_time=None, R0=None):
+        self.x = x
+        self.y = y
+        self.values = values
+        self.poly_x = poly_x
+        self.R = R
+        self.y_err = y_err
+        self.slope = slope
+        self.d_time = d_time
+        self.R0 = R0
+
+
+class CountryFits(object):
+    """Cases and deaths fits, plot texts and month starts of a geography."""
+
+    __slots__ = ("cases", "deaths", "plot_text", "plot_text_d",
+                 "plot_name", "month_starts")
+
+    def __init__(self, cases, deaths, plot_text, plot_text_d, plot_name,
+                 month_starts):
+        self.cases = cases
+        self.deaths = deaths
+        self.plot_text = plot_text
+        self.plot_text_d = plot_text_d
+        self.plot_name = plot_name
+        self.month_starts = month_starts
@@ -1,14 +1,19 @@
 """
 Module that runs a Kolmogorov Smirnoff test.
 """
-import matplotlib
-import matplotlib.pyplot as plt
 import numpy as np
-from scipy import stats
+
+from cov_model.plotting import render
+
+
+plt = render.FigureRecorder()
 
 
 def kstest(nums_cases, nums_deaths):
     """Run a simple Kolmogorov-Sminroff test on populations."""
+    # scipy is only needed here, not by compute-only runs
+    from scipy import stats
+
     # first compare UK to a few representative countries
     uk_france_cases = stats.ks_2samp(nums_cases["UK"],
                                      nums_cases["France"])
@@ -1,10 +1,16 @@
 """
 Line fit via numpy polyfit.
 """
+import logging
 import numpy as np
 
 from datetime import datetime
 
+from cov_model import instrument
+
+
+logger = logging.getLogger(__name__)
+
 
 # slowing countries: countries that show a consistent slowing trend
 # slowing down value = date in March that is roughly the start of slowdown
@@ -101,12 +107,17 @@ def c_of_d(ys_orig, ys_line):
 def get_linear_parameters(x, y):
     """Retrive linear parameters."""
     # line parameters
-    print("------ Analizying no of time points: {}".format(len(x)))
-    coef = np.polyfit(x, y, 1)
+    logger.debug("------ Analizying no of time points: %i", len(x))
+    instrument.count("linear fits")
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    # missing (NaN) points and logs of zero do not enter the fit
+    valid = np.isfinite(x) & np.isfinite(y)
+    coef = np.polyfit(x[valid], y[valid], 1)
     poly1d_fn = np.poly1d(coef)
 
     # statistical parameters first line
-    R = c_of_d(y, poly1d_fn(x))  # R squared
+    R = c_of_d(y[valid], poly1d_fn(x[valid]))  # R squared
     y_err = poly1d_fn(x) - y  # y-error
     slope = coef[0]  # slope
     d_time = np.log(2.) / slope  # doubling time
@@ -115,6 +126,37 @@ def get_linear_parameters(x, y):
     return poly1d_fn(x), R, y_err, slope, d_time, R0
 
 
+def get_linear_parameters_batch(x, y):
+    """
+    Retrive linear parameters of many series at once.
+
+    y is (series x points) over the common x; missing (NaN) points and
+    logs of zero are left out per series. Returns arrays of slope, R
+    squared, doubling time and daily reproductive number; NaN for series
+    with fewer than two points.
+    """
+    y = np.asarray(y, dtype=float)
+    x = np.broadcast_to(np.asarray(x, dtype=float), y.shape)
+    instrument.count("linear fits", len(y))
+    valid = np.isfinite(x) & np.isfinite(y)
+    n_points = valid.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_mean = np.where(valid, x, 0.).sum(axis=1) / n_points
+        y_mean = np.where(valid, y, 0.).sum(axis=1) / n_points
+        dx = np.where(valid, x - x_mean[:, None], 0.)
+        dy = np.where(valid, y - y_mean[:, None], 0.)
+        sxx = (dx * dx).sum(axis=1)
+        sxy = (dx * dy).sum(axis=1)
+        syy = (dy * dy).sum(axis=1)
+        slope = sxy / sxx
+        R = 1. - (syy - slope * sxy) / syy  # R squared
+        slope[n_points < 2] = np.nan
+        d_time = np.log(2.) / slope  # doubling time
+    R0 = np.exp(slope) - 1.  # basic reproductive number, daily
+
+    return slope, R, d_time, R0
+
+
 def common_plot_stuff(plt, country, month_str):
     """Add common stuff to plot."""
     if month_str in ["March", "April", "May", "June", "July"]:
@@ -131,14 +173,21 @@ def common_plot_stuff(plt, country, month_str):
 
 
 def get_plot_text(slope, country, R, d_time, R0, x,
-                  month, deaths_label=False):
-    """Set plot title, subtitle, text."""
+                  month, deaths_label=False, data_date=None):
+    """
+    Set plot title, subtitle, text.
+
+    data_date is the date of the last data point (default: today); the
+    text is part of the cached figure, so a plot of unchanged data is
+    not redrawn on a later day.
+    """
     header = "Daily Cases:"
     if deaths_label:
         header = "Daily Deaths (slower):"
-    today = datetime.today().strftime('%m-%d-%Y')
+    if data_date is None:
+        data_date = datetime.today()
     plot_text = header + "\n" + \
-                "Date: %s" % today + "\n" + \
+                "Date: %s" % data_date.strftime('%m-%d-%Y') + "\n" + \
                 "Line fit $N=Ce^{bt}$ with rate $b=$%.2f" % slope + "\n" + \
                 "Coefficient of determination R=%.3f" % R + "\n" + \
                 "Cases Doubling time: %.1f days" % d_time + "\n" + \
@@ -148,12 +197,16 @@ def get_plot_text(slope, country, R, d_time, R0, x,
     return plot_text, plot_name
 
 
-def get_deaths_plot_text(slope, country, R, d_time, avg_mort, stdev_mort):
-    """Set text for deaths."""
+def get_deaths_plot_text(slope, country, R, d_time, avg_mort, stdev_mort,
+                         official_mort=None):
+    """Set text for deaths; official_mort: (average, STD) if published."""
     plot_text = "Daily Deaths:" + "\n" + \
                 "Line fit $N=Ce^{mt}$ with rate $m=$%.2f" % slope + "\n" + \
                 "Coefficient of determination R=%.3f" % R + "\n" + \
                 "Deaths Doubling time: %.1f days" % d_time + "\n" + \
-                "Average mortality %.2f+/-%.2f (STD)" % (avg_mort, stdev_mort)
+                "Delay-adjusted mortality %.2f+/-%.2f (7-day STD)" % (avg_mort, stdev_mort)
+    if official_mort is not None:
+        plot_text += "\n" + \
+            "Official average mortality %.2f+/-%.2f (STD)" % official_mort
 
     return plot_text
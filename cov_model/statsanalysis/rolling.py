@@ -0,0 +1,158 @@
+"""
+Rolling statistics of (geography x day) cumulative series.
+
+The cumulative series of all geographies are aligned on their first
+day above a threshold (left-aligned, NaN padded at the end) and daily
+increments, N-day rolling sums and means, per-capita values and daily
+log-ratios are computed for the whole matrix at once with cumulative
+sums. Results are memoized per statistic and window, so the ensemble
+plots and tables share one computation.
+
+Known reporting corrections are applied to the daily increments from a
+dated table (CORRECTIONS).
+"""
+import numpy as np
+
+
+# (geography, date of the increment): replacement daily increment
+CORRECTIONS = {
+    # ONS 29 April 2020: 4419 increase (care homes deaths added at
+    # once) replaced with the previous day increase
+    ("UK", "2020-04-29"): 585.,
+}
+
+
+def align_left(nums, geographies, threshold=None):
+    """
+    Stack cumulative series into a matrix aligned on their first day.
+
+    Values of each series are sorted and, with a threshold, only values
+    above it are kept; rows are NaN padded at the end. Returns the
+    matrix, the number of values kept and the number of (first) values
+    skipped per row.
+    """
+    rows = []
+    skipped = []
+    for geo in geographies:
+        values = np.asarray(nums[geo], dtype=float)
+        values = np.sort(values[np.isfinite(values)])
+        n_values = len(values)
+        if threshold is not None:
+            values = values[values > threshold]
+        rows.append(values)
+        skipped.append(n_values - len(values))
+    lengths = np.array([len(values) for values in rows], dtype=int)
+    matrix = np.full((len(rows), max(lengths) if len(rows) else 0), np.nan)
+    for i, values in enumerate(rows):
+        matrix[i, :len(values)] = values
+
+    return matrix, lengths, np.array(skipped, dtype=int)
+
+
+def rolling_sum(matrix, window):
+    """Sums of full windows along the last axis (window - 1 fewer days)."""
+    matrix = np.asarray(matrix, dtype=float)
+    csum = np.cumsum(matrix, axis=-1)
+    summed = csum[..., window - 1:].copy()
+    summed[..., 1:] -= csum[..., :-window]
+
+    return summed
+
+
+def rolling_mean(matrix, window):
+    """Means of full windows along the last axis (window - 1 fewer days)."""
+    return rolling_sum(matrix, window) / window
+
+
+def log_ratios(matrix):
+    """Daily log-ratios log(x[t + 1] / x[t]) along the last axis."""
+    matrix = np.asarray(matrix, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.log(matrix[..., 1:] / matrix[..., :-1])
+
+
+def trim(row):
+    """Get the values of a NaN padded row."""
+    return row[~np.isnan(row)]
+
+
+class RollingStats(object):
+    """Memoized rolling statistics of left-aligned cumulative series."""
+
+    def __init__(self, nums, geographies, populations=None, threshold=None,
+                 first_dates=None, corrections=CORRECTIONS):
+        """
+        Align the series of nums (geography: cumulative values).
+
+        populations (per geography) give the per-capita values;
+        first_dates (geography: date of the first value) date the
+        daily increments, so that corrections can be applied.
+        """
+        self.geographies = list(geographies)
+        self.cumulative, self.lengths, self.skipped = align_left(
+            nums, self.geographies, threshold)
+        self.populations = None
+        if populations is not None:
+            self.populations = np.asarray(populations, dtype=float)
+        self.first_dates = first_dates or {}
+        self.corrections = corrections
+        self._memo = {}
+
+    def _memoized(self, key, compute):
+        """Compute a statistic once."""
+        if key not in self._memo:
+            self._memo[key] = compute()
+
+        return self._memo[key]
+
+    def increments(self):
+        """Daily increments (one day fewer), corrections applied."""
+        return self._memoized(("increments", ), self._increments)
+
+    def _increments(self):
+        """Get the corrected daily increments."""
+        daily = np.diff(self.cumulative, axis=-1)
+        for (geo, date), value in self.corrections.items():
+            if geo not in self.first_dates or geo not in self.geographies:
+                continue
+            # increment i is dated by (kept) cumulative value i + 1
+            row = self.geographies.index(geo)
+            day = (np.datetime64(date, "D") -
+                   np.datetime64(self.first_dates[geo], "D")).astype(int) - \
+                self.skipped[row] - 1
+            if 0 <= day < self.lengths[row] - 1:
+                daily[row, day] = value
+
+        return daily
+
+    def per_capita(self, matrix):
+        """Divide the rows by the populations."""
+        return matrix / self.populations[:, None]
+
+    def rolling_mean(self, window=7, per_capita=False, daily=True):
+        """N-day rolling means of the daily increments (or cumulative)."""
+        key = ("rolling mean", window, per_capita, daily)
+
+        def compute():
+            matrix = self.increments() if daily else self.cumulative
+            if per_capita:
+                matrix = self.per_capita(matrix)
+            return rolling_mean(matrix, window)
+
+        return self._memoized(key, compute)
+
+    def rolling_sum(self, window=7, daily=True):
+        """N-day rolling sums of the daily increments (or cumulative)."""
+        return self._memoized(
+            ("rolling sum", window, daily),
+            lambda: rolling_sum(self.increments() if daily
+                                else self.cumulative, window))
+
+    def log_ratios(self):
+        """Daily log-ratios of the cumulative values."""
+        return self._memoized(("log ratios", ),
+                              lambda: log_ratios(self.cumulative))
+
+    def series(self, matrix):
+        """Get geography: values of a statistic matrix, padding removed."""
+        return {geo: trim(row) for geo, row in zip(self.geographies, matrix)}
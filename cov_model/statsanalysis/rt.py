@@ -0,0 +1,94 @@
+"""
+Time-varying reproduction number Rt via the renewal equation.
+
+Incidence I(t) is modelled as Poisson with mean Rt * Lambda(t), where
+Lambda(t) = sum_s I(t - s) w(s) is the total infectiousness and w the
+serial interval distribution. With a Gamma(a, b) prior and Rt constant
+over a sliding window of tau days, the posterior is again gamma
+(Cori et al. 2013):
+
+    shape = a + sum_window I,  rate = 1/b + sum_window Lambda
+
+All geographies are processed at once on (geography x day) matrices.
+"""
+import numpy as np
+
+from cov_model.statsanalysis import delays
+
+
+# serial interval (days): mean and standard deviation
+SERIAL_INTERVAL_MEAN = 4.7
+SERIAL_INTERVAL_STD = 2.9
+SERIAL_INTERVAL_MAX = 20
+
+# gamma prior on Rt: shape and scale
+PRIOR_SHAPE = 1.
+PRIOR_SCALE = 5.
+
+
+def serial_interval(mean=SERIAL_INTERVAL_MEAN, std=SERIAL_INTERVAL_STD,
+                    max_days=SERIAL_INTERVAL_MAX):
+    """Get the discrete serial interval; no same-day transmission."""
+    pmf = delays.discretised_gamma(mean, std, max_days)
+    pmf[0] = 0.
+
+    return pmf / pmf.sum()
+
+
+def _window_sum(matrix, window):
+    """Sliding window sums along the last axis via cumulative sums."""
+    csum = np.cumsum(matrix, axis=-1)
+    summed = csum.copy()
+    summed[..., window:] = csum[..., window:] - csum[..., :-window]
+
+    return summed
+
+
+def estimate_rt(cum_cases, si_pmf=None, window=7,
+                quantiles=(0.025, 0.975)):
+    """
+    Estimate daily Rt with credible intervals from cumulative cases.
+
+    Takes a (geography x day) matrix (or a single series) of cumulative
+    cases (NaN: missing day) and returns posterior mean, lower and upper
+    quantile matrices. The first known count holds the cases before the
+    series, so days within a serial interval (SERIAL_INTERVAL_MAX) of
+    the start, unknown days and days with no infectiousness are NaN.
+    """
+    from scipy import stats
+
+    if si_pmf is None:
+        si_pmf = serial_interval()
+    cum_cases = np.atleast_2d(np.asarray(cum_cases, dtype=float))
+    daily = delays.daily_increments(cum_cases)
+    incidence = np.nan_to_num(daily)
+    infectiousness = delays.causal_convolve(incidence, si_pmf)
+
+    shape = PRIOR_SHAPE + _window_sum(incidence, window)
+    rate = 1. / PRIOR_SCALE + _window_sum(infectiousness, window)
+    mean = shape / rate
+    lower = stats.gamma.ppf(quantiles[0], shape, scale=1. / rate)
+    upper = stats.gamma.ppf(quantiles[1], shape, scale=1. / rate)
+
+    # mask unknown days, windows with nothing to infect from and the
+    # days whose infectiousness still misses cases from before the start
+    invalid = (_window_sum(infectiousness, window) <= 0.) | np.isnan(daily)
+    history = max(window, len(si_pmf) - 1)
+    days = np.arange(cum_cases.shape[-1])
+    invalid |= days < delays.first_days(cum_cases)[:, None] + history
+    for matrix in (mean, lower, upper):
+        matrix[invalid] = np.nan
+
+    return mean, lower, upper
+
+
+def align_series(nums, geographies):
+    """Stack per-geography cumulative series into a matrix, right-aligned."""
+    n_days = max(len(nums[geo]) for geo in geographies)
+    matrix = np.full((len(geographies), n_days), np.nan)
+    for i, geo in enumerate(geographies):
+        series = np.asarray(nums[geo], dtype=float)
+        if len(series):
+            matrix[i, n_days - len(series):] = series
+
+    return matrix
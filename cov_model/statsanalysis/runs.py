@@ -0,0 +1,98 @@
+"""
+Run lengths and histograms of binned daily rates of many geographies.
+
+The daily series of all geographies are concatenated with a geography
+index; runs of constant (binned) rate are found in one pass where the
+rate or the geography changes (np.diff / np.flatnonzero) and the days
+spent at each rate are counted per geography with np.unique. Missing
+(NaN) rates end a run and are not counted.
+"""
+import numpy as np
+
+
+# rates are tabulated as whole numbers (x 100)
+BIN_WIDTH = 1.
+
+
+def concatenate(series, geographies):
+    """Concatenate the series of geographies; get values and index."""
+    values = [np.asarray(series[geo], dtype=float).ravel()
+              for geo in geographies]
+    groups = np.repeat(np.arange(len(values)),
+                       [len(vals) for vals in values])
+    values = np.concatenate(values) if values else np.zeros(0)
+
+    return values, groups
+
+
+def bin_values(values, bin_width=BIN_WIDTH):
+    """Round values to the nearest multiple of bin_width."""
+    return np.round(values / bin_width) * bin_width
+
+
+def run_lengths(values, groups):
+    """
+    Get (group, value, length) of runs of equal values within groups.
+
+    NaN values split runs and are dropped.
+    """
+    if not len(values):
+        return groups, values, np.zeros(0, dtype=int)
+    change = np.ones(len(values), dtype=bool)
+    change[1:] = (values[1:] != values[:-1]) | (groups[1:] != groups[:-1])
+    starts = np.flatnonzero(change)
+    lengths = np.diff(np.append(starts, len(values)))
+    keep = ~np.isnan(values[starts])
+
+    return groups[starts][keep], values[starts][keep], lengths[keep]
+
+
+def histogram(values, groups):
+    """Get (group, value, count) of the distinct values of each group."""
+    valid = ~np.isnan(values)
+    if not valid.any():
+        return (np.zeros(0, dtype=int), np.zeros(0),
+                np.zeros(0, dtype=int))
+    keys, counts = np.unique(
+        np.column_stack((groups[valid], values[valid])), axis=0,
+        return_counts=True)
+
+    return keys[:, 0].astype(int), keys[:, 1], counts
+
+
+class RateHistogram(object):
+    """Days and runs of constant binned rate for a set of geographies."""
+
+    def __init__(self, series, geographies, bin_width=BIN_WIDTH):
+        self.geographies = list(geographies)
+        values, groups = concatenate(series, self.geographies)
+        values = bin_values(values, bin_width)
+        # per (geography, rate): days at that rate, longest run
+        self.groups, self.rates, self.days = histogram(values, groups)
+        run_groups, run_rates, lengths = run_lengths(values, groups)
+        self.longest = np.zeros(len(self.rates), dtype=int)
+        if len(lengths):
+            # the distinct run keys are the (sorted) histogram keys
+            _, inverse = np.unique(np.column_stack((run_groups, run_rates)),
+                                   axis=0, return_inverse=True)
+            np.maximum.at(self.longest, inverse.ravel(), lengths)
+
+    def geography(self, geography):
+        """Get the rates and days at each rate of a geography."""
+        select = self.groups == self.geographies.index(geography)
+
+        return self.rates[select], self.days[select]
+
+    def longest_runs(self, geography):
+        """Get the longest run (days) at each rate of a geography."""
+        select = self.groups == self.geographies.index(geography)
+
+        return self.longest[select]
+
+    def below(self, limit=None):
+        """Get the rates (below limit) and days of all geographies."""
+        if limit is None:
+            return self.rates, self.days
+        select = self.rates < limit
+
+        return self.rates[select], self.days[select]
@@ -0,0 +1,34 @@
+"""Library API over synthetic data: the UK Rt from the official cases."""
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+import cov_model
+from benchmarks import synthetic
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """Synthetic reports and official UK files, no UK report rows."""
+    pytest.importorskip("xlwt")
+    pytest.importorskip("xlrd")
+    synthetic.generate(str(tmp_path), 3, 61)
+    data_dir = tmp_path / "country_data"
+    # as in the JHU reports, there are no numbers for the UK
+    for month in ("03", "04"):
+        shutil.rmtree(str(data_dir / "UK_monthly_{}".format(month)))
+    monkeypatch.chdir(tmp_path)
+
+    return str(data_dir)
+
+
+def test_uk_rt_from_official_cases(data_dir):
+    results = cov_model.analyze(["UK", "France"], "2020-04-01",
+                                "2020-04-30", data_dir=data_dir)
+    for geography in ("UK", "France"):
+        values = results.array("rt", geography)
+        assert len(values) == 30
+        assert np.isfinite(values[-10:]).all()
+    assert not os.path.isdir(os.path.join(data_dir, "UK_monthly_04"))
@@ -0,0 +1,60 @@
+"""Delay distributions and the delay-adjusted CFR on fixed inputs."""
+import numpy as np
+
+from cov_model.statsanalysis import cfr, delays
+
+
+def test_discretised_gamma():
+    pmf = delays.discretised_gamma(13., 12.7, 40)
+    assert len(pmf) == 41
+    assert np.isclose(pmf.sum(), 1.)
+    assert (pmf >= 0.).all()
+
+
+def test_causal_convolve():
+    incidence = np.array([[1., 0., 2., 0., 0.], [0., 3., 0., 0., 1.]])
+    pmf = np.array([0.5, 0.3, 0.2])
+    expected = [np.convolve(row, pmf)[:5] for row in incidence]
+    assert np.allclose(delays.causal_convolve(incidence, pmf), expected)
+
+
+def test_daily_increments():
+    cumulative = np.array([[np.nan, 10., 12., np.nan, 16., 15., np.nan]])
+    daily = delays.daily_increments(cumulative)
+    # unknown before and at the first day, gap interpolated, no
+    # negative corrections
+    assert np.isnan(daily[0, :2]).all()
+    assert list(daily[0, 2:6]) == [2., 2., 2., 0.]
+    assert np.isnan(daily[0, 6])
+    assert list(delays.first_days(cumulative)) == [1]
+    assert list(delays.first_days(np.full((1, 3), np.nan))) == [3]
+
+
+def test_constant_cfr():
+    pmf = cfr.death_delay()
+    cases = 100. * 1.1 ** np.arange(60)
+    # deaths: 2% of the cases resolved by each day, the first day's
+    # count counted as resolved
+    daily = np.diff(cases, prepend=cases[0])
+    resolved = cases[0] + np.cumsum(np.convolve(daily, pmf)[:60])
+    deaths = 0.02 * resolved
+    values, mean, std = cfr.delay_adjusted_cfr(cases[None, :],
+                                               deaths[None, :])
+    assert np.allclose(values, 0.02)
+    assert np.allclose(mean, 0.02)
+    assert np.allclose(std, 0., atol=1e-6)
+    # the naive ratio is biased low while the epidemic grows
+    assert deaths[-1] / cases[-1] < 0.01
+
+    current, spread = cfr.current_cfr(cases, deaths)
+    assert np.isclose(current, 0.02)
+    assert spread < 1e-6
+
+
+def test_cfr_missing_days():
+    cases = np.array([[np.nan, np.nan, 10., 20., np.nan, 40.]])
+    deaths = np.array([[np.nan, np.nan, 0., 1., np.nan, 2.]])
+    values, _, _ = cfr.delay_adjusted_cfr(cases, deaths)
+    # nothing before the first known day, the gap is interpolated
+    assert np.isnan(values[0, :2]).all()
+    assert np.isfinite(values[0, 2:]).all()
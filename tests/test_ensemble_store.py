@@ -0,0 +1,48 @@
+"""Ensemble statistics records: batches of a run merge, reruns replace."""
+import numpy as np
+
+from cov_model.datafinder.ensemble_store import EnsembleStore
+
+
+def _run(path, values, weights):
+    """Add the values of one run on 30 April in two batches."""
+    store = EnsembleStore(path)
+    store.add("2020-04-30", "doubling time", values[:2], weights[:2])
+    store.add("2020-04-30", "doubling time", values[2:], weights[2:])
+    store.commit()
+
+    return EnsembleStore(path)
+
+
+def test_batches_of_a_run_merge(tmp_path):
+    values = np.array([3., 5., 9., 60.])
+    weights = np.array([1., 2., 1., 0.5])
+    store = _run(str(tmp_path / "ensemble.bin"), values, weights)
+    stats = store.record("2020-04-30")["doubling_time"]
+    mean = np.average(values, weights=weights)
+    assert stats["count"] == 4
+    assert stats["weight"] == weights.sum()
+    assert np.isclose(stats["mean"], mean)
+    assert np.isclose(stats["m2"], np.sum(weights * (values - mean) ** 2))
+    assert (stats["min"], stats["max"]) == (3., 60.)
+    _, counts = store.histogram("doubling time", "2020-04-30")
+    # 60 days is in the overflow bin
+    assert counts.sum() == weights.sum()
+    assert counts[-1] == 0.5
+
+
+def test_rerun_replaces_record(tmp_path):
+    path = str(tmp_path / "ensemble.bin")
+    values = np.array([3., 5., 9.])
+    weights = np.ones(3)
+    first = np.array(_run(path, values, weights).record("2020-04-30"))
+    store = _run(path, values, weights)
+    assert len(store.records) == 1
+    assert np.array(store.record("2020-04-30")).tobytes() == first.tobytes()
+
+    store.add("2020-05-01", "R0", [2.5])
+    store.commit()
+    store = EnsembleStore(path)
+    dates, means, _ = store.moments("R0")
+    assert [str(date) for date in dates] == ["2020-04-30", "2020-05-01"]
+    assert means[1] == 2.5
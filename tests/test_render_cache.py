@@ -0,0 +1,64 @@
+"""Render cache: plots of unchanged data are not redrawn on a later day."""
+import datetime as dt
+
+import numpy as np
+import pytest
+
+from cov_model import cov_lin_wrapper as wrapper
+from cov_model.datafinder.results_writer import ResultsWriter
+from cov_model.plotting import render
+from cov_model.statsanalysis import linear
+
+
+class _LaterDay(dt.datetime):
+    """A datetime whose today() is a week later."""
+
+    @classmethod
+    def today(cls):
+        return dt.datetime.now() + dt.timedelta(days=7)
+
+
+@pytest.fixture
+def drawn(tmp_path, monkeypatch):
+    """Record the rendered paths instead of drawing them."""
+    monkeypatch.chdir(tmp_path)
+    paths = []
+
+    def render_spec(path, calls):
+        paths.append(path)
+        open(path, "w").close()
+    monkeypatch.setattr(render, "render_spec", render_spec)
+    previous = render.get_renderer()
+    yield paths
+    render.set_renderer(previous)
+
+
+def _run(cache_file):
+    """Plot and tabulate one country over 30 April days."""
+    cache = render.RenderCache(cache_file)
+    renderer = render.Renderer(0, cache=cache)
+    render.set_renderer(renderer)
+    days = np.arange(30)
+    cases = 100. * 1.1 ** days
+    deaths = 0.02 * cases
+    times = np.datetime64("2020-04-01", "s") + \
+        days * np.timedelta64(1, "D")
+    wrapper.plot_countries((cases, deaths, np.full(30, np.nan), times), [4],
+                           "Austria", ResultsWriter(None), False)
+    renderer.finish()
+
+    return renderer
+
+
+def test_unchanged_data_renders_nothing(tmp_path, drawn, monkeypatch):
+    (tmp_path / "country_plots" / "Austria").mkdir(parents=True)
+    cache_file = str(tmp_path / "country_plots" / ".render_cache.json")
+    _run(cache_file)
+    n_figures = len(drawn)
+    assert n_figures
+    assert any("COVID-19_LIN_Austria" in path for path in drawn)
+
+    monkeypatch.setattr(linear, "datetime", _LaterDay)
+    renderer = _run(cache_file)
+    assert len(drawn) == n_figures
+    assert renderer.skipped == n_figures
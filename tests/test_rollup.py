@@ -0,0 +1,54 @@
+"""Roll-up of report rows per country, province and admin2."""
+import numpy as np
+
+from cov_model.datafinder import rollup
+
+
+NEW_HEADER = ["FIPS", "Admin2", "Province_State", "Country_Region",
+              "Last_Update", "Lat", "Long_", "Confirmed", "Deaths",
+              "Recovered"]
+
+
+def _row(admin2, province, country, time, cases, deaths, recovered):
+    """Report row in the new schema."""
+    return ["", admin2, province, country, time, "0", "0", cases, deaths,
+            recovered]
+
+
+def test_parse_numbers():
+    values = rollup.parse_numbers(["3", "", "NN", "2.5", "nan", "x"])
+    assert values[0] == 3. and values[3] == 2.5
+    assert np.isnan(values[[1, 2, 4, 5]]).all()
+
+
+def test_group_sums():
+    values = np.array([[1., np.nan, 2., np.nan, np.nan, 4.]])
+    sums = rollup.group_sums(values, np.array([0, 3, 5]))
+    # NaN skipped; a group with no number at all is NaN
+    assert sums[0, 0] == 3.
+    assert np.isnan(sums[0, 1])
+    assert sums[0, 2] == 4.
+
+
+def test_rollup_levels():
+    rows = [NEW_HEADER,
+            _row("", "Gibraltar", "United Kingdom", "t2", "5", "1", ""),
+            _row("", "", "Italy", "t1", "100", "10", "20"),
+            _row("", "", "United Kingdom", "t3", "50", "", "3"),
+            _row("Kings", "New York", "US", "t4", "7", "1", "0"),
+            _row("Queens", "New York", "US", "t5", "8", "2", "0"),
+            _row("", "Texas", "US", "t6", "", "", "")]
+    report = rollup.Rollup(rows, rollup.NEW_SCHEMA)
+
+    keys, _, sums = report.table("country")
+    assert keys == [("Italy", ), ("US", ), ("United Kingdom", )]
+    assert list(sums[0]) == [100., 15., 55.]
+    assert list(sums[1]) == [10., 3., 1.]
+
+    assert report.lookup("United Kingdom") == ("t2", 55., 1., 3.)
+    assert report.lookup("New York", "province") == ("t4", 15., 3., 0.)
+    _, cases, deaths, _ = report.lookup("Texas", "province")
+    assert np.isnan(cases) and np.isnan(deaths)
+    assert report.lookup("Kings", "admin2")[1] == 7.
+    time, cases, _, _ = report.lookup("Narnia")
+    assert time is None and np.isnan(cases)
@@ -0,0 +1,45 @@
+"""Cori Rt on constant-growth series."""
+import numpy as np
+
+from cov_model.statsanalysis import rt
+
+
+def _growth_rt(growth, si_pmf):
+    """Rt of exponential growth (discrete Euler-Lotka equation)."""
+    return 1. / np.sum(si_pmf * np.exp(-growth * np.arange(len(si_pmf))))
+
+
+def test_serial_interval():
+    pmf = rt.serial_interval()
+    assert pmf[0] == 0.
+    assert np.isclose(pmf.sum(), 1.)
+
+
+def test_constant_growth():
+    growth = 0.1
+    cases = 1000. * np.exp(growth * np.arange(60))
+    mean, lower, upper = rt.estimate_rt(cases)
+    expected = _growth_rt(growth, rt.serial_interval())
+    assert np.allclose(mean[0, -10:], expected, rtol=0.005)
+    assert (lower[0, -10:] < mean[0, -10:]).all()
+    assert (upper[0, -10:] > mean[0, -10:]).all()
+    # no estimate within a serial interval of the start
+    assert np.isnan(mean[0, :rt.SERIAL_INTERVAL_MAX]).all()
+    assert np.isfinite(mean[0, rt.SERIAL_INTERVAL_MAX:]).all()
+
+
+def test_missing_days_and_alignment():
+    growth = 0.05
+    cases = 1000. * np.exp(growth * np.arange(60))
+    gappy = cases.copy()
+    gappy[45] = np.nan
+    matrix = rt.align_series({"A": cases, "B": gappy[10:]}, ["A", "B"])
+    # right-aligned: B is NaN padded at the start
+    assert np.isnan(matrix[1, :10]).all()
+    mean, _, _ = rt.estimate_rt(matrix)
+    expected = _growth_rt(growth, rt.serial_interval())
+    assert np.allclose(mean[:, -5:], expected, rtol=0.005)
+    # the start of B is later: so is its first estimate
+    assert np.isnan(mean[1, :10 + rt.SERIAL_INTERVAL_MAX]).all()
+    # the interpolated day has an estimate
+    assert np.isfinite(mean[1, 45])
@@ -0,0 +1,49 @@
+"""Runs and day counts of binned rates around NaN and geography changes."""
+import numpy as np
+
+from cov_model.statsanalysis import runs
+
+
+def test_run_lengths_split_at_nan_and_geography():
+    values = np.array([1., 1., np.nan, 1., 2., 2., 2., 2., 3.])
+    groups = np.array([0, 0, 0, 0, 0, 0, 1, 1, 1])
+    run_groups, rates, lengths = runs.run_lengths(values, groups)
+    assert list(run_groups) == [0, 0, 0, 1, 1]
+    assert list(rates) == [1., 1., 2., 2., 3.]
+    assert list(lengths) == [2, 1, 2, 2, 1]
+
+
+def test_run_lengths_empty():
+    _, _, lengths = runs.run_lengths(np.zeros(0), np.zeros(0, dtype=int))
+    assert len(lengths) == 0
+
+
+def test_histogram_skips_nan():
+    values = np.array([1., np.nan, 1., 2., np.nan])
+    groups = np.array([0, 0, 0, 1, 1])
+    hist_groups, rates, counts = runs.histogram(values, groups)
+    assert list(hist_groups) == [0, 1]
+    assert list(rates) == [1., 2.]
+    assert list(counts) == [2, 1]
+
+    _, _, counts = runs.histogram(np.array([np.nan]), np.array([0]))
+    assert len(counts) == 0
+
+
+def test_rate_histogram():
+    series = {"UK": [1.2, 0.9, np.nan, 1.1, 2.], "Italy": [2.1, 1.8, 3.]}
+    hist = runs.RateHistogram(series, ["UK", "Italy"])
+    rates, days = hist.geography("UK")
+    assert list(rates) == [1., 2.]
+    assert list(days) == [3, 1]
+    # the NaN day splits the UK run of rate 1
+    assert list(hist.longest_runs("UK")) == [2, 1]
+    # the UK run of rate 2 does not continue into Italy
+    rates, days = hist.geography("Italy")
+    assert list(rates) == [2., 3.]
+    assert list(days) == [2, 1]
+    assert list(hist.longest_runs("Italy")) == [2, 1]
+
+    rates, days = hist.below(2.)
+    assert list(rates) == [1.]
+    assert list(days) == [3]
@@ -0,0 +1,132 @@
+"""Query service: routes, bad queries and errors over a small bundle."""
+import json
+import threading
+
+try:
+    from urllib.error import HTTPError
+    from urllib.request import urlopen
+except ImportError:  # python 2
+    from urllib2 import HTTPError, urlopen
+
+import numpy as np
+import pytest
+
+from cov_model import cov_lin_wrapper as wrapper
+from cov_model import service
+from cov_model.datafinder import results_bundle
+from cov_model.statsanalysis import cfr
+
+
+@pytest.fixture
+def server(tmp_path):
+    """Serve a one-geography bundle on a free port."""
+    days = np.arange(40)
+    cases = 10. * 1.15 ** days
+    deaths = np.floor(0.02 * cases)
+    # a missing report day
+    cases[20] = deaths[20] = np.nan
+    results = results_bundle.RunResults("2020-04-30", [4])
+    # fitted series: missing days and days without deaths dropped
+    results.add_geography("Narnia", False, 4.96, 2.1, 0.99,
+                          cases=cases[~np.isnan(cases)],
+                          deaths=deaths[deaths > 0.])
+    results.add_array("cases_aligned", "Narnia", cases)
+    results.add_array("deaths_aligned", "Narnia", deaths)
+    wrapper.add_rt_series(results, {"Narnia": cases})
+    prefix = str(tmp_path / "results_2020-04-30")
+    results.write(prefix)
+    state = service.WarmState(prefix,
+                              history_file=str(tmp_path / "history.csv"))
+    httpd = service.make_server(state, port=0)
+    thread = threading.Thread(target=httpd.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _get(httpd, path):
+    """Get (status, JSON content) of a query."""
+    url = "http://{}:{}{}".format(service.HOST, httpd.server_port, path)
+    try:
+        response = urlopen(url)
+    except HTTPError as exc:
+        return exc.code, json.loads(exc.read().decode("utf-8"))
+    return response.getcode(), json.loads(response.read().decode("utf-8"))
+
+
+def test_routes(server):
+    code, content = _get(server, "/geographies")
+    assert code == 200
+    assert content == {"run_date": "2020-04-30", "geographies": ["Narnia"]}
+
+    code, content = _get(server, "/fit?geography=Narnia")
+    assert code == 200
+    assert content["doubling_time"] == 4.96
+
+    code, content = _get(server, "/rt?geography=Narnia&window=5")
+    assert code == 200
+    assert content["window"] == 5
+    assert len(content["rt"]) == 40
+
+    code, content = _get(server, "/cfr?geography=Narnia")
+    assert code == 200
+    assert len(content["cfr"]) == 40
+
+    code, content = _get(server, "/status")
+    assert code == 200
+    assert content["generation"] == 1
+
+
+def test_series_match_the_run(server):
+    # window 7: the Rt of the analysis run, on the same days
+    _, content = _get(server, "/rt?geography=Narnia")
+    stored = server.state.results.array("rt", "Narnia")
+    assert np.allclose(np.array(content["rt"], dtype=float), stored,
+                       equal_nan=True)
+    assert np.isfinite(stored[-1])
+
+    _, content = _get(server, "/cfr?geography=Narnia")
+    cfr_mean = np.array(content["cfr_mean"], dtype=float)
+    # the table's delay-adjusted mortality (one missing day apart)
+    table_cfr, _ = cfr.current_cfr(server.state.results.array("cases",
+                                                              "Narnia"),
+                                   server.state.results.array("deaths",
+                                                              "Narnia"))
+    assert abs(cfr_mean[-1] - table_cfr) < 0.001
+
+
+def test_cache(server):
+    _get(server, "/rt?geography=Narnia")
+    _get(server, "/rt?geography=Narnia")
+    _, content = _get(server, "/status")
+    assert (content["cache_hits"], content["cache_misses"]) == (1, 1)
+
+
+@pytest.mark.parametrize("path", [
+    "/fit?geography=Oz",
+    "/fit",
+    "/rt?geography=Oz",
+    "/rt?geography=Narnia&window=0",
+    "/rt?geography=Narnia&window=seven",
+    "/history?geography=Narnia&column=cases",
+])
+def test_bad_query(server, path):
+    code, content = _get(server, path)
+    assert code == 400
+    assert content["error"]
+
+
+def test_unknown_path(server):
+    code, _ = _get(server, "/forecast")
+    assert code == 404
+
+
+def test_failing_query(server, monkeypatch):
+    def fail(geography):
+        raise RuntimeError("broken")
+    monkeypatch.setattr(server.state, "fit", fail)
+    code, content = _get(server, "/fit?geography=Narnia")
+    assert code == 500
+    assert "broken" in content["error"]
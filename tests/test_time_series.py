@@ -0,0 +1,48 @@
+"""Time-series cube: country names, province sums and monthly slices."""
+import numpy as np
+
+from cov_model.datafinder import time_series
+
+
+HEADER = "Province/State,Country/Region,Lat,Long,3/30/20,3/31/20,4/1/20,4/2/20"
+ROWS = [",United Kingdom,0,0,1,2,10,20",
+        "Gibraltar,United Kingdom,0,0,0,1,1,2",
+        ",\"Korea, South\",0,0,3,4,5,6",
+        ",Italy,0,0,7,8,,9"]
+
+
+def test_rename_countries():
+    names = time_series.rename_countries(
+        np.array(["United Kingdom", "Korea, South", "Italy"]))
+    assert list(names) == ["UK", "South Korea", "Italy"]
+
+
+def test_sum_by_country():
+    countries = np.array(["B", "A", "B"])
+    values = np.array([[1., 2.], [3., np.nan], [10., np.nan]])
+    names, sums = time_series.sum_by_country(countries, values)
+    assert list(names) == ["A", "B"]
+    assert sums[0, 0] == 3. and np.isnan(sums[0, 1])
+    assert list(sums[1]) == [11., 2.]
+
+
+def test_cube_monthly(tmp_path):
+    for _, metric in time_series.METRICS:
+        path = tmp_path / time_series.TIME_SERIES_FILE.format(metric)
+        path.write_text("\n".join([HEADER] + ROWS) + "\n")
+    cube = time_series.TimeSeriesCube.load(str(tmp_path))
+    assert cube.geographies == ["Italy", "South Korea", "UK"]
+
+    cases, deaths, _, times = cube.monthly("UK", 4)
+    assert len(cases) == 30
+    assert list(cases[:2]) == [11., 22.]
+    assert np.isnan(cases[2:]).all()
+    assert str(times[0]) == "2020-04-01T00:00:00"
+    assert np.isnat(times[2:]).all()
+    assert list(deaths[:2]) == [11., 22.]
+
+    # the JHU name finds the renamed row
+    assert list(cube.monthly("Korea, South", 4)[0][:2]) == [5., 6.]
+    assert list(cube.monthly("Italy", 3)[0][-2:]) == [7., 8.]
+    assert np.isnan(cube.monthly("Italy", 4)[0][0])
+    assert np.isnan(cube.monthly("Narnia", 4)[0]).all()